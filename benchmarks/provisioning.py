@@ -0,0 +1,178 @@
+#!/usr/bin/python
+# Measures end to end provisioning throughput and latency on top of the fake
+# backends in ims.einstein.fake, so that it runs without ceph, iscsitarget,
+# dnsmasq or HIL. For every size the nodes are provisioned once one after the
+# other and once concurrently, and then released with release_project.
+#
+# The fakes return immediately unless given latencies, which are set with
+# --latency <operation>=<seconds>, like --latency clone=0.05 --latency
+# restart=1. See the fakes for the names of the operations. --online adds
+# and deletes the iscsi targets with ietadm instead of restarting the daemon
+# and --commit-window groups the targets created within that many
+# milliseconds into one update. --driver lio exports the images with LIO on
+# a fake configfs instead of iscsitarget.
+#
+# Usage: python benchmarks/provisioning.py [--sizes 10,100,1000]
+#            [--workers 16] [--latency op=seconds]... [--online]
+#            [--commit-window ms] [--driver iet|lio]
+import argparse
+import base64
+import shutil
+import tempfile
+import time
+from multiprocessing.pool import ThreadPool
+
+import os
+
+import ims.common.constants as constants
+
+PROJECT = "bench"
+NETWORK = "bench-net"
+NIC = "eno1"
+IMAGE = "golden"
+
+CONFIG = """[bmi]
+uid = 1
+service = False
+
+[db]
+url = {root}/bmi.db
+
+[filesystem]
+ceph = True
+
+[ceph]
+id = bench
+pool = rbd
+conf_file = /dev/null
+keyring = /dev/null
+
+[haas]
+url = http://127.0.0.1/
+
+[iscsi]
+ip = 127.0.0.1
+password =
+
+[rpc]
+name_server_ip = 127.0.0.1
+name_server_port = 10000
+rpc_server_ip = 127.0.0.1
+rpc_server_port = 10001
+
+[tftp]
+pxelinux_url = {root}/pxelinux/
+ipxe_url = {root}/ipxe/
+
+[http]
+bind_ip = 127.0.0.1
+bind_port = 10002
+
+[logs]
+url = {root}/logs/
+debug = False
+verbose = False
+"""
+
+
+def percentile(timings, p):
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(len(timings) * p / 100.0))]
+
+
+def report(name, size, elapsed, timings):
+    print "%-10s %5d nodes  %8.2f provisions/s  p50 = %8.2f ms  " \
+          "p99 = %8.2f ms" % (name, size, size / elapsed,
+                              1000 * percentile(timings, 50),
+                              1000 * percentile(timings, 99))
+
+
+def parse_latencies(values):
+    latencies = {}
+    for value in values:
+        operation, seconds = value.split('=', 1)
+        latencies[operation] = float(seconds)
+    return latencies
+
+
+def setup(root):
+    for name in ("pxelinux", "ipxe", "logs"):
+        os.mkdir(os.path.join(root, name))
+    path = os.path.join(root, "bmi.cfg")
+    with open(path, 'w') as cfg:
+        cfg.write(CONFIG.format(root=root))
+    os.environ[constants.CONFIG_LOCATION_ENV_VARIABLE] = path
+    config.load()
+
+
+def provision(node_name):
+    start = time.time()
+    with BMI(credentials, backend=backend) as bmi:
+        ret = bmi.provision(node_name, IMAGE, NETWORK, NIC)
+    if ret[constants.STATUS_CODE_KEY] != 200:
+        raise RuntimeError("provision of %s failed: %s" % (
+            node_name, ret[constants.MESSAGE_KEY]))
+    return time.time() - start
+
+
+def run(name, size, workers):
+    nodes = ["%s-%d-%d" % (name, size, i) for i in range(size)]
+    write_leases(backend.dhcp.leases_loc,
+                 [hil.mac_addr(node, NIC) for node in nodes])
+    start = time.time()
+    if workers == 1:
+        timings = [provision(node) for node in nodes]
+    else:
+        pool = ThreadPool(workers)
+        try:
+            timings = pool.map(provision, nodes)
+        finally:
+            pool.close()
+            pool.join()
+    report(name, size, time.time() - start, timings)
+    with BMI(credentials, backend=backend) as bmi:
+        bmi.release_project(NETWORK, NIC)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10,100,1000")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--latency", action="append", default=[])
+    parser.add_argument("--online", action="store_true")
+    parser.add_argument("--commit-window", type=int, default=0)
+    parser.add_argument("--driver", default=constants.IET_DRIVER,
+                        choices=[constants.IET_DRIVER, constants.LIO_DRIVER])
+    args = parser.parse_args()
+    latencies = parse_latencies(args.latency)
+
+    root = tempfile.mkdtemp(prefix="bmi-bench-")
+    try:
+        import ims.common.config as config
+
+        setup(root)
+
+        from ims.database.database import Database
+        from ims.einstein.fake.backend import FakeBackend
+        from ims.einstein.fake.dnsmasq import write_leases
+        from ims.einstein.fake.hil import FakeHILServer
+        from ims.einstein.operations import BMI
+
+        with Database() as db:
+            db.project.insert(PROJECT, NETWORK)
+        credentials = (base64.b64encode("bench:bench"), PROJECT)
+
+        with FakeHILServer([NIC], latencies) as hil, \
+                FakeBackend(root, latencies, args.online,
+                            args.commit_window / 1000.0,
+                            args.driver) as backend:
+            config.get().haas_url = hil.url
+            backend.fs.create_image(IMAGE, 1024 * 1024 * 1024)
+            with BMI(credentials, backend=backend) as bmi:
+                bmi.import_ceph_image(IMAGE)
+
+            for size in [int(size) for size in args.sizes.split(',')]:
+                run("serial", size, 1)
+                run("concurrent", size, args.workers)
+    finally:
+        shutil.rmtree(root)
@@ -0,0 +1,55 @@
+#!/usr/bin/python
+# Measures the per call overhead of einstein by timing list_images the way
+# MainServer.execute_command runs it, first with a new BMI (and so a new ceph
+# connection) per call and then with the shared backend.
+#
+# Needs the same config and environment as the bmi cli:
+# BMI_CONFIG, HAAS_USERNAME, HAAS_PASSWORD and PROJECT
+#
+# Usage: python benchmarks/rpc_overhead.py [number of calls]
+import base64
+import sys
+import time
+
+import os
+
+import ims.common.config as config
+import ims.common.constants as constants
+
+config.load()
+
+from ims.einstein.backend import Backend
+from ims.einstein.operations import BMI
+
+
+def percentile(timings, p):
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(len(timings) * p / 100.0))]
+
+
+def report(name, timings):
+    print "%-16s mean = %8.2f ms  p50 = %8.2f ms  p99 = %8.2f ms" % (
+        name, 1000 * sum(timings) / len(timings),
+        1000 * percentile(timings, 50), 1000 * percentile(timings, 99))
+
+
+def run(calls, backend=None):
+    timings = []
+    for i in range(calls):
+        start = time.time()
+        with BMI(credentials, backend=backend) as bmi:
+            bmi.list_images()
+        timings.append(time.time() - start)
+    return timings
+
+
+if __name__ == "__main__":
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    credentials = (base64.b64encode(
+        os.environ[constants.HAAS_USERNAME_VARIABLE] + ":" +
+        os.environ[constants.HAAS_PASSWORD_VARIABLE]),
+                   os.environ[constants.PROJECT_ENV_VARIABLE])
+
+    report("new per call", run(calls))
+    with Backend(config.get()) as backend:
+        report("shared backend", run(calls, backend))
@@ -1,7 +1,9 @@
 #!/usr/bin/python
 
+import hashlib
 import json
 import sys
+import time
 
 import click
 import requests
@@ -31,6 +33,9 @@ else:
     click.echo(constants.HAAS_PASSWORD_VARIABLE + " Variable Not Set")
     sys.exit(1)
 
+# Set by the --job-timeout option of the cli group
+_job_timeout = constants.DEFAULT_JOB_TIMEOUT
+
 
 def bmi_exception_wrapper(func):
     def function_wrapper(*args, **kwargs):
@@ -42,8 +47,57 @@ def bmi_exception_wrapper(func):
     return function_wrapper
 
 
+# Formats a number of bytes with the largest unit that keeps it above 1, the
+# usage of images that have not been measured yet is None and shown as -
+def _format_bytes(size):
+    if size is None:
+        return "-"
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return "%.1f %s" % (size, unit) if unit != "B" else "%d B" % size
+        size /= 1024.0
+    return "%.1f TB" % size
+
+
+# Polls einstein until the job that was queued by the request has finished
+# and returns the response with its result. Other responses are returned as is.
+# Exits with the id of the job if it has not finished within the job timeout.
+def _wait_for_job(res, project):
+    if res.status_code != 202:
+        return res
+    job_id = json.loads(res.content)[constants.JOB_ID_PARAMETER]
+    data = {constants.PROJECT_PARAMETER: project,
+            constants.JOB_ID_PARAMETER: job_id}
+    deadline = time.time() + _job_timeout
+    while True:
+        res = requests.post(_url + "job_result/", data=data,
+                            auth=(_username, _password))
+        if res.status_code != 202:
+            return res
+        if time.time() >= deadline:
+            click.echo("Timed out waiting for job " + str(job_id))
+            sys.exit(1)
+        time.sleep(constants.JOB_POLL_INTERVAL)
+
+
+# Prints the result of every node of an operation on many nodes as a table
+def _echo_report(res):
+    if res.status_code == 200:
+        report = json.loads(res.content)
+        table = PrettyTable(field_names=["Node", "Status", "Message"])
+        for name, ret in sorted(report.items()):
+            table.add_row([name, ret[constants.STATUS_CODE_KEY],
+                           ret.get(constants.MESSAGE_KEY, "Success")])
+        click.echo(table.get_string())
+    else:
+        click.echo(res.content)
+
+
 @click.group()
-def cli():
+@click.option('--job-timeout', default=constants.DEFAULT_JOB_TIMEOUT,
+              type=int, help='Seconds to wait for a queued operation to '
+                             'finish')
+def cli(job_timeout):
     """
     The Bare Metal Imaging (BMI) is a core component of the Massachusetts Open
     Cloud and a image management system(ims) that
@@ -56,7 +110,8 @@ def cli():
     (2) Introduces the image management techniques that are supported by
     virtual machines, with little to no impact on application performance.
     """
-    pass
+    global _job_timeout
+    _job_timeout = job_timeout
 
 
 @cli.command(name='pro', short_help="Provision a Node")
@@ -72,19 +127,31 @@ def provision(project, node, img, network, nic):
     \b
     Arguments:
     PROJECT = The HIL Project attached to your credentials
-    NODE    = The Node to Provision
+    NODE    = The Node to Provision (A comma separated list provisions all
+              the nodes together)
     IMG     = The Name of the Image to Provision
     NETWORK = The Name of the Provisioning Network
     CHANNEL = The Channel to Provision On (For HIL It is 'vlan/native')
     NIC     = The NIC to use for Network Boot (For HIL IT is 'enp130s0f0')
     """
+    if constants.NODES_SEPARATOR in node:
+        data = {constants.PROJECT_PARAMETER: project,
+                constants.NODES_PARAMETER: node,
+                constants.IMAGE_NAME_PARAMETER: img,
+                constants.NETWORK_PARAMETER: network,
+                constants.NIC_PARAMETER: nic}
+        res = _wait_for_job(requests.put(_url + "provision_many/", data=data,
+                                         auth=(_username, _password)), project)
+        _echo_report(res)
+        return
+
     data = {constants.PROJECT_PARAMETER: project,
             constants.NODE_NAME_PARAMETER: node,
             constants.IMAGE_NAME_PARAMETER: img,
             constants.NETWORK_PARAMETER: network,
             constants.NIC_PARAMETER: nic}
-    res = requests.put(_url + "provision/", data=data,
-                       auth=(_username, _password))
+    res = _wait_for_job(requests.put(_url + "provision/", data=data,
+                                     auth=(_username, _password)), project)
     click.echo(res.content)
 
 
@@ -108,11 +175,33 @@ def deprovision(project, node, network, nic):
             constants.NODE_NAME_PARAMETER: node,
             constants.NETWORK_PARAMETER: network,
             constants.NIC_PARAMETER: nic}
-    res = requests.delete(_url + "deprovision/", data=data, auth=(
-        _username, _password))
+    res = _wait_for_job(requests.delete(_url + "deprovision/", data=data,
+                                        auth=(_username, _password)), project)
     click.echo(res.content)
 
 
+@cli.command(name='release', short_help='Deprovision all nodes of a project')
+@click.argument(constants.PROJECT_PARAMETER)
+@click.argument(constants.NETWORK_PARAMETER)
+@click.argument(constants.NIC_PARAMETER)
+def release_project(project, network, nic):
+    """
+    Deprovision All the Provisioned Nodes of a Project
+
+    \b
+    Arguments:
+    PROJECT = The HIL Project attached to your credentials
+    NETWORK = The Name of the Provisioning Network
+    NIC     = The NIC that was used for Network Boot (For HIL IT is 'enp130s0f0')
+    """
+    data = {constants.PROJECT_PARAMETER: project,
+            constants.NETWORK_PARAMETER: network,
+            constants.NIC_PARAMETER: nic}
+    res = _wait_for_job(requests.delete(_url + "release_project/", data=data,
+                                        auth=(_username, _password)), project)
+    _echo_report(res)
+
+
 @cli.command(name='showpro',
              short_help='Lists Provisioned Nodes')
 @click.argument(constants.PROJECT_PARAMETER)
@@ -170,9 +259,10 @@ def list_images(project):
                         auth=(_username, _password))
     if res.status_code == 200:
         images = json.loads(res.content)
-        table = PrettyTable(field_names=["Image"])
+        table = PrettyTable(field_names=["Image", "Provisioned", "Used"])
         for image in images:
-            table.add_row([image])
+            table.add_row([image[0], _format_bytes(image[1]),
+                           _format_bytes(image[2])])
         click.echo(table.get_string())
     else:
         click.echo(res.content)
@@ -206,8 +296,8 @@ def create_snapshot(project, node, snap_name):
     data = {constants.PROJECT_PARAMETER: project,
             constants.NODE_NAME_PARAMETER: node,
             constants.SNAP_NAME_PARAMETER: snap_name}
-    res = requests.put(_url + "create_snapshot/", data=data,
-                       auth=(_username, _password))
+    res = _wait_for_job(requests.put(_url + "create_snapshot/", data=data,
+                                     auth=(_username, _password)), project)
     click.echo(res.content)
 
 
@@ -253,6 +343,57 @@ def remove_snapshot(project, snap_name):
     click.echo(res.content)
 
 
+@cli.group(short_help='Flatten Related Commands')
+def flatten():
+    """
+    Use The Subcommands under this command to follow and cancel the flattens
+    of imported images and snapshots
+    """
+    pass
+
+
+@flatten.command(name='ls', short_help='List Images Being Flattened')
+@click.argument(constants.PROJECT_PARAMETER)
+def list_flattens(project):
+    """
+    Lists The Images Under a Project Which Are Being Flattened
+
+    \b
+    Arguments:
+    PROJECT = The HIL Project attached to your credentials
+    """
+    data = {constants.PROJECT_PARAMETER: project}
+    res = requests.post(_url + "list_flattens/", data=data,
+                        auth=(_username, _password))
+    if res.status_code == 200:
+        flattens = json.loads(res.content)
+        table = PrettyTable(field_names=["Image", "Status", "Progress (%)"])
+        for row in flattens:
+            table.add_row(row)
+        click.echo(table.get_string())
+    else:
+        click.echo(res.content)
+
+
+@flatten.command(name='cancel', short_help='Cancel a Flatten')
+@click.argument(constants.PROJECT_PARAMETER)
+@click.argument(constants.IMAGE_NAME_PARAMETER)
+def cancel_flatten(project, img):
+    """
+    Cancel the Flatten of an Image, the Image is Removed
+
+    \b
+    Arguments:
+    PROJECT = The HIL Project attached to your credentials
+    IMG     = The Name of the Image being Flattened
+    """
+    data = {constants.PROJECT_PARAMETER: project,
+            constants.IMAGE_NAME_PARAMETER: img}
+    res = requests.delete(_url + "cancel_flatten/", data=data,
+                          auth=(_username, _password))
+    click.echo(res.content)
+
+
 @cli.group(name='project', help='Project Related Commands')
 def project_grp():
     """
@@ -457,7 +598,6 @@ def list_all_images(s, c, p, project, name, ceph):
 @click.option('--snap', default=None, help='Specifies what snapshot to import')
 @click.option('--protect', is_flag=True,
               help="Set if snapshot should be protected before cloning")
-@bmi_exception_wrapper
 def import_ceph_image(project, img, snap, protect):
     """
     Import an existing CEPH image into BMI
@@ -467,17 +607,17 @@ def import_ceph_image(project, img, snap, protect):
     PROJECT = The HIL Project attached to your credentials
     IMG = The Name of the CEPH Image to import
     """
-    with BMI(_username, _password, project) as bmi:
-        ret = None
-        if snap is None:
-            ret = bmi.import_ceph_image(img)
-        else:
-            ret = bmi.import_ceph_snapshot(img, snap, protect)
-
-        if ret[constants.STATUS_CODE_KEY] == 200:
-            click.echo("Success")
-        else:
-            click.echo(ret[constants.MESSAGE_KEY])
+    data = {constants.PROJECT_PARAMETER: project,
+            constants.IMAGE_NAME_PARAMETER: img}
+    if snap is None:
+        res = requests.put(_url + "import_image/", data=data,
+                           auth=(_username, _password))
+    else:
+        data[constants.SNAP_NAME_PARAMETER] = snap
+        data[constants.PROTECT_PARAMETER] = protect
+        res = requests.put(_url + "import_snapshot/", data=data,
+                           auth=(_username, _password))
+    click.echo(_wait_for_job(res, project).content)
 
 
 @cli.command(name='export', short_help='Export a BMI image to ceph')
@@ -651,20 +791,125 @@ def show_mappings(project):
             click.echo(ret[constants.MESSAGE_KEY])
 
 
+# The part of a file from offset to its end. requests takes the length of the
+# body from len so that it is streamed with a content length instead of being
+# read into memory.
+class _FileSlice:
+    def __init__(self, fi, offset, size):
+        fi.seek(offset)
+        self.fi = fi
+        self.length = size - offset
+        self.remaining = self.length
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.fi.read(size)
+        self.remaining -= len(data)
+        return data
+
+
 @cli.command(name='upload', help='Upload Image to BMI')
-def upload():
-    """
-    Coming Soon
+@click.argument(constants.PROJECT_PARAMETER)
+@click.argument(constants.IMAGE_NAME_PARAMETER)
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def upload(project, img, path):
     """
-    click.echo('Not Yet Implemented')
+    Upload a Raw Image, an Interrupted Upload is Resumed by Running it Again
+
+    \b
+    Arguments:
+    PROJECT = The HIL Project attached to your credentials
+    IMG     = The Name of the Image
+    PATH    = The Raw Image File
+    """
+    with open(path, 'rb') as fi:
+        if fi.read(len(constants.QCOW2_MAGIC)) == constants.QCOW2_MAGIC:
+            click.echo("qcow2 images have to be converted to raw with "
+                       "qemu-img convert -O raw first")
+            return
+        size = os.fstat(fi.fileno()).st_size
+        data = {constants.PROJECT_PARAMETER: project,
+                constants.IMAGE_NAME_PARAMETER: img,
+                constants.SIZE_PARAMETER: size}
+        res = requests.post(_url + "start_upload/", data=data,
+                            auth=(_username, _password))
+        if res.status_code != 200:
+            click.echo(res.content)
+            return
+        offset = json.loads(res.content)
+        params = {constants.PROJECT_PARAMETER: project,
+                  constants.IMAGE_NAME_PARAMETER: img,
+                  constants.OFFSET_PARAMETER: offset}
+        res = requests.put(_url + "upload_image/", params=params,
+                           data=_FileSlice(fi, offset, size),
+                           auth=(_username, _password))
+        if res.status_code == 200:
+            click.echo("Success")
+        else:
+            click.echo(res.content)
+
+
+# Writes the frames streamed by download_image to fi, only the extents are
+# written so the file stays sparse. Returns None once the end frame is read
+# and its checksum matches, otherwise the reason the download failed.
+def _receive_image(stream, fi):
+    checksum = hashlib.sha256()
+    while True:
+        frame = stream.readline().split()
+        if not frame:
+            return "Download was interrupted"
+        if frame[0] == constants.DOWNLOAD_SIZE_FRAME:
+            fi.truncate(int(frame[1]))
+        elif frame[0] == constants.DOWNLOAD_DATA_FRAME:
+            fi.seek(int(frame[1]))
+            remaining = int(frame[2])
+            while remaining > 0:
+                data = stream.read(min(remaining, constants.UPLOAD_BLOCK_SIZE))
+                if not data:
+                    return "Download was interrupted"
+                checksum.update(data)
+                fi.write(data)
+                remaining -= len(data)
+        elif frame[0] == constants.DOWNLOAD_END_FRAME:
+            if frame[1] != checksum.hexdigest():
+                return "Checksum of the download does not match"
+            return None
+        else:
+            return " ".join(frame[1:])
 
 
 @cli.command(name='download', help='Download Image from BMI')
-def download():
-    """
-    Coming Soon
+@click.argument(constants.PROJECT_PARAMETER)
+@click.argument(constants.IMAGE_NAME_PARAMETER)
+@click.argument('path', type=click.Path(dir_okay=False))
+def download(project, img, path):
     """
-    click.echo('Not Yet Implemented')
+    Download an Image to a Sparse Raw File
+
+    \b
+    Arguments:
+    PROJECT = The HIL Project attached to your credentials
+    IMG     = The Name of the Image
+    PATH    = The File to Write the Image to
+    """
+    params = {constants.PROJECT_PARAMETER: project,
+              constants.IMAGE_NAME_PARAMETER: img}
+    res = requests.get(_url + "download_image/", params=params,
+                       auth=(_username, _password), stream=True)
+    if res.status_code != 200:
+        click.echo(res.content)
+        return
+    with open(path, 'wb') as fi:
+        error = _receive_image(res.raw, fi)
+    if error is None:
+        click.echo("Success")
+    else:
+        os.remove(path)
+        click.echo(error)
 
 
 if __name__ == '__main__':
@@ -37,7 +37,15 @@ class __BMIConfig:
         self.db_url = None
         self.iscsi_update_password = None
         self.iscsi_ip = None
+        self.iscsi_online = False
+        self.iscsi_commit_window = constants.DEFAULT_ISCSI_COMMIT_WINDOW
+        self.iscsi_commit_batch_size = \
+            constants.DEFAULT_ISCSI_COMMIT_BATCH_SIZE
+        self.iscsi_driver = constants.IET_DRIVER
+        self.iscsi_configfs_root = constants.CONFIGFS_ROOT
         self.haas_url = None
+        self.haas_username = ""
+        self.haas_password = ""
         self.nameserver_ip = None
         self.nameserver_port = None
         self.rpcserver_ip = None
@@ -49,6 +57,16 @@ class __BMIConfig:
         self.logs_verbose = None
         self.pxelinux_loc = None
         self.ipxe_loc = None
+        self.workers = constants.DEFAULT_WORKERS
+        self.job_workers = constants.DEFAULT_JOB_WORKERS
+        self.flatten_workers = constants.DEFAULT_FLATTEN_WORKERS
+        self.flatten_bandwidth = constants.DEFAULT_FLATTEN_BANDWIDTH
+        self.flatten_cluster_slots = constants.DEFAULT_FLATTEN_CLUSTER_SLOTS
+        self.usage_refresh_interval = constants.DEFAULT_USAGE_REFRESH_INTERVAL
+        self.pool_images = {}
+        self.pool_refill_interval = constants.DEFAULT_POOL_REFILL_INTERVAL
+        self.placement_policy = constants.DEFAULT_PLACEMENT_POLICY
+        self.placement_projects = {}
 
     def parse_config(self):
         config = ConfigParser.SafeConfigParser()
@@ -62,6 +80,41 @@ class __BMIConfig:
             self.is_service = config.get(constants.BMI_CONFIG_SECTION_NAME,
                                          constants.SERVICE_KEY) == 'True'
 
+            if config.has_option(constants.BMI_CONFIG_SECTION_NAME,
+                                 constants.WORKERS_KEY):
+                self.workers = config.getint(
+                    constants.BMI_CONFIG_SECTION_NAME, constants.WORKERS_KEY)
+
+            if config.has_option(constants.BMI_CONFIG_SECTION_NAME,
+                                 constants.JOB_WORKERS_KEY):
+                self.job_workers = config.getint(
+                    constants.BMI_CONFIG_SECTION_NAME,
+                    constants.JOB_WORKERS_KEY)
+
+            if config.has_option(constants.BMI_CONFIG_SECTION_NAME,
+                                 constants.FLATTEN_WORKERS_KEY):
+                self.flatten_workers = config.getint(
+                    constants.BMI_CONFIG_SECTION_NAME,
+                    constants.FLATTEN_WORKERS_KEY)
+
+            if config.has_option(constants.BMI_CONFIG_SECTION_NAME,
+                                 constants.FLATTEN_BANDWIDTH_KEY):
+                self.flatten_bandwidth = config.getint(
+                    constants.BMI_CONFIG_SECTION_NAME,
+                    constants.FLATTEN_BANDWIDTH_KEY)
+
+            if config.has_option(constants.BMI_CONFIG_SECTION_NAME,
+                                 constants.FLATTEN_CLUSTER_SLOTS_KEY):
+                self.flatten_cluster_slots = config.getint(
+                    constants.BMI_CONFIG_SECTION_NAME,
+                    constants.FLATTEN_CLUSTER_SLOTS_KEY)
+
+            if config.has_option(constants.BMI_CONFIG_SECTION_NAME,
+                                 constants.USAGE_REFRESH_INTERVAL_KEY):
+                self.usage_refresh_interval = config.getint(
+                    constants.BMI_CONFIG_SECTION_NAME,
+                    constants.USAGE_REFRESH_INTERVAL_KEY)
+
             self.db_url = config.get(constants.DB_CONFIG_SECTION_NAME,
                                      constants.DB_URL_KEY)
 
@@ -72,9 +125,55 @@ class __BMIConfig:
             self.iscsi_ip = config.get(constants.ISCSI_CONFIG_SECTION_NAME,
                                        constants.ISCSI_IP_KEY)
 
+            if config.has_option(constants.ISCSI_CONFIG_SECTION_NAME,
+                                 constants.ISCSI_ONLINE_KEY):
+                self.iscsi_online = config.get(
+                    constants.ISCSI_CONFIG_SECTION_NAME,
+                    constants.ISCSI_ONLINE_KEY) == 'True'
+
+            if config.has_option(constants.ISCSI_CONFIG_SECTION_NAME,
+                                 constants.ISCSI_COMMIT_WINDOW_KEY):
+                self.iscsi_commit_window = config.getint(
+                    constants.ISCSI_CONFIG_SECTION_NAME,
+                    constants.ISCSI_COMMIT_WINDOW_KEY)
+
+            if config.has_option(constants.ISCSI_CONFIG_SECTION_NAME,
+                                 constants.ISCSI_COMMIT_BATCH_SIZE_KEY):
+                self.iscsi_commit_batch_size = config.getint(
+                    constants.ISCSI_CONFIG_SECTION_NAME,
+                    constants.ISCSI_COMMIT_BATCH_SIZE_KEY)
+
+            if config.has_option(constants.ISCSI_CONFIG_SECTION_NAME,
+                                 constants.ISCSI_DRIVER_KEY):
+                self.iscsi_driver = config.get(
+                    constants.ISCSI_CONFIG_SECTION_NAME,
+                    constants.ISCSI_DRIVER_KEY)
+                if self.iscsi_driver not in (constants.IET_DRIVER,
+                                             constants.LIO_DRIVER):
+                    raise config_exceptions.InvalidOptionInConfigException(
+                        constants.ISCSI_DRIVER_KEY)
+
+            if config.has_option(constants.ISCSI_CONFIG_SECTION_NAME,
+                                 constants.ISCSI_CONFIGFS_ROOT_KEY):
+                self.iscsi_configfs_root = config.get(
+                    constants.ISCSI_CONFIG_SECTION_NAME,
+                    constants.ISCSI_CONFIGFS_ROOT_KEY)
+
             self.haas_url = config.get(constants.HAAS_CONFIG_SECTION_NAME,
                                        constants.HAAS_URL_KEY)
 
+            if config.has_option(constants.HAAS_CONFIG_SECTION_NAME,
+                                 constants.HAAS_USERNAME_KEY):
+                self.haas_username = config.get(
+                    constants.HAAS_CONFIG_SECTION_NAME,
+                    constants.HAAS_USERNAME_KEY)
+
+            if config.has_option(constants.HAAS_CONFIG_SECTION_NAME,
+                                 constants.HAAS_PASSWORD_KEY):
+                self.haas_password = config.get(
+                    constants.HAAS_CONFIG_SECTION_NAME,
+                    constants.HAAS_PASSWORD_KEY)
+
             self.nameserver_ip = config.get(constants.RPC_CONFIG_SECTION_NAME,
                                             constants.RPC_NAME_SERVER_IP_KEY)
             self.nameserver_port = int(
@@ -102,6 +201,40 @@ class __BMIConfig:
             self.ipxe_loc = config.get(constants.TFTP_CONFIG_SECTION_NAME,
                                        constants.IPXE_URL_KEY)
 
+            # The warm pool is optional, images is a comma separated list of
+            # <project>/<image>:<number of clones to keep ready>
+            if config.has_section(constants.POOL_CONFIG_SECTION_NAME):
+                images = config.get(constants.POOL_CONFIG_SECTION_NAME,
+                                    constants.POOL_IMAGES_KEY)
+                for entry in images.split(','):
+                    if entry.strip():
+                        name, size = entry.strip().rsplit(':', 1)
+                        project, img = name.split('/', 1)
+                        self.pool_images[(project, img)] = int(size)
+                if config.has_option(constants.POOL_CONFIG_SECTION_NAME,
+                                     constants.POOL_REFILL_INTERVAL_KEY):
+                    self.pool_refill_interval = config.getint(
+                        constants.POOL_CONFIG_SECTION_NAME,
+                        constants.POOL_REFILL_INTERVAL_KEY)
+
+            # The placement is optional, projects is a comma separated list
+            # of <project>:<ceph backend> used by the project policy
+            if config.has_section(constants.PLACEMENT_CONFIG_SECTION_NAME):
+                if config.has_option(constants.PLACEMENT_CONFIG_SECTION_NAME,
+                                     constants.PLACEMENT_POLICY_KEY):
+                    self.placement_policy = config.get(
+                        constants.PLACEMENT_CONFIG_SECTION_NAME,
+                        constants.PLACEMENT_POLICY_KEY)
+                if config.has_option(constants.PLACEMENT_CONFIG_SECTION_NAME,
+                                     constants.PLACEMENT_PROJECTS_KEY):
+                    projects = config.get(
+                        constants.PLACEMENT_CONFIG_SECTION_NAME,
+                        constants.PLACEMENT_PROJECTS_KEY)
+                    for entry in projects.split(','):
+                        if entry.strip():
+                            project, backend = entry.strip().split(':', 1)
+                            self.placement_projects[project] = backend
+
             for k, v in config.items(constants.FILESYSTEM_CONFIG_SECTION_NAME):
                 if v == 'True':
                     self.fs[k] = {}
@@ -22,11 +22,25 @@ RPC_CONFIG_SECTION_NAME = 'rpc'
 HTTP_CONFIG_SECTION_NAME = 'http'
 LOGS_CONFIG_SECTION_NAME = 'logs'
 TFTP_CONFIG_SECTION_NAME = 'tftp'
+POOL_CONFIG_SECTION_NAME = 'pool'
+PLACEMENT_CONFIG_SECTION_NAME = 'placement'
 
 # Non FS Keys in Config File
 HAAS_URL_KEY = 'url'
+HAAS_USERNAME_KEY = 'username'
+HAAS_PASSWORD_KEY = 'password'
 ISCSI_PASSWORD_KEY = 'password'
 ISCSI_IP_KEY = 'ip'
+ISCSI_ONLINE_KEY = 'online'
+ISCSI_COMMIT_WINDOW_KEY = 'commit_window'
+ISCSI_COMMIT_BATCH_SIZE_KEY = 'commit_batch_size'
+DEFAULT_ISCSI_COMMIT_WINDOW = 0
+DEFAULT_ISCSI_COMMIT_BATCH_SIZE = 64
+ISCSI_DRIVER_KEY = 'driver'
+ISCSI_CONFIGFS_ROOT_KEY = 'configfs_root'
+IET_DRIVER = 'iet'
+LIO_DRIVER = 'lio'
+ISCSI_PORT = 3260
 
 # DB
 DB_URL_KEY = 'url'
@@ -36,6 +50,12 @@ CEPH_ID_KEY = 'id'
 CEPH_POOL_KEY = 'pool'
 CEPH_CONFIG_FILE_KEY = 'conf_file'
 CEPH_KEY_RING_KEY = 'keyring'
+CEPH_CONNECTIONS_KEY = 'connections'
+CEPH_IMAGE_CACHE_SIZE_KEY = 'image_cache_size'
+CEPH_IMAGE_CACHE_TTL_KEY = 'image_cache_ttl'
+CEPH_MAP_BACKEND_KEY = 'map_backend'
+CEPH_QUEUE_DEPTH_KEY = 'queue_depth'
+CEPH_SYSFS_ROOT_KEY = 'sysfs_root'
 
 # ISCSI
 ISCSI_UPDATE_SUCCESS = 'successfully'
@@ -64,15 +84,102 @@ LOGS_VERBOSE_KEY = 'verbose'
 PXELINUX_URL_KEY = 'pxelinux_url'
 IPXE_URL_KEY = 'ipxe_url'
 
+# POOL
+POOL_IMAGES_KEY = 'images'
+POOL_REFILL_INTERVAL_KEY = 'refill_interval'
+POOL_IMAGE_PREFIX = 'bmi-pool-'
+DEFAULT_POOL_REFILL_INTERVAL = 30
+
+# PLACEMENT
+# The other ceph backends are the filesystems named ceph.<name>
+CEPH_BACKEND_PREFIX = 'ceph.'
+PLACEMENT_POLICY_KEY = 'policy'
+PLACEMENT_PROJECTS_KEY = 'projects'
+PARENT_PLACEMENT_POLICY = 'parent'
+LEAST_LOADED_PLACEMENT_POLICY = 'least_loaded'
+PROJECT_PLACEMENT_POLICY = 'project'
+DEFAULT_PLACEMENT_POLICY = PARENT_PLACEMENT_POLICY
+PLACEMENT_LOAD_TTL = 60
+
 # BMI
 UID_KEY = 'uid'
 SERVICE_KEY = 'service'
+WORKERS_KEY = 'workers'
+JOB_WORKERS_KEY = 'job_workers'
+FLATTEN_WORKERS_KEY = 'flatten_workers'
+FLATTEN_BANDWIDTH_KEY = 'flatten_bandwidth'
+FLATTEN_CLUSTER_SLOTS_KEY = 'flatten_cluster_slots'
+USAGE_REFRESH_INTERVAL_KEY = 'usage_refresh_interval'
 
 # Response Related Keys
 STATUS_CODE_KEY = 'status_code'
 RETURN_VALUE_KEY = 'retval'
 MESSAGE_KEY = 'msg'
 
+# Jobs
+JOB_QUEUED_STATUS = "queued"
+JOB_RUNNING_STATUS = "running"
+JOB_DONE_STATUS = "done"
+JOB_FAILED_STATUS = "failed"
+JOB_POLL_INTERVAL = 2
+# Seconds the cli waits for a job before giving up on it
+DEFAULT_JOB_TIMEOUT = 1800
+
+# Flatten
+FLATTEN_QUEUED_STATUS = "queued"
+FLATTEN_RUNNING_STATUS = "running"
+FLATTEN_FAILED_STATUS = "failed"
+FLATTEN_CANCELLING_STATUS = "cancelling"
+
+# Node States
+NODE_STARTED_STATE = "started"
+NODE_ATTACHED_STATE = "attached"
+NODE_CLONED_STATE = "cloned"
+NODE_EXPORTED_STATE = "exported"
+NODE_REGISTERED_STATE = "registered"
+NODE_DETACHED_STATE = "detached"
+NODE_UNEXPORTED_STATE = "unexported"
+
+# Saga Steps
+HIL_STEP = "hil"
+DB_STEP = "db"
+RBD_STEP = "rbd"
+ISCSI_STEP = "iscsi"
+REGISTER_STEP = "register"
+
+# Pool Stats Keys
+POOL_HITS_KEY = "hits"
+POOL_MISSES_KEY = "misses"
+POOL_READY_KEY = "ready"
+
+# Metrics
+METRICS_BUCKETS_KEY = "buckets"
+METRICS_SUM_KEY = "sum"
+METRICS_COUNT_KEY = "count"
+METRICS_NAME = "bmi_stage_duration_seconds"
+METRICS_LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5,
+                           10, 30, 60, 120, 300]
+
+# Metric Stages
+HIL_ATTACH_STAGE = "hil_attach"
+HIL_DETACH_STAGE = "hil_detach"
+DB_INSERT_STAGE = "db_insert"
+DB_DELETE_STAGE = "db_delete"
+RBD_CLONE_STAGE = "rbd_clone"
+RBD_REMOVE_STAGE = "rbd_remove"
+RBD_FLATTEN_STAGE = "rbd_flatten"
+RBD_MAP_STAGE = "rbd_map"
+RBD_UNMAP_STAGE = "rbd_unmap"
+RBD_WRITE_STAGE = "rbd_write"
+RBD_READ_STAGE = "rbd_read"
+ISCSI_CONFIG_STAGE = "iscsi_config_update"
+ISCSI_RESTART_STAGE = "iscsi_restart"
+ISCSI_STOP_STAGE = "iscsi_stop"
+ISCSI_STATUS_STAGE = "iscsi_check_status"
+ISCSI_ONLINE_STAGE = "iscsi_online_update"
+IPXE_FILE_STAGE = "ipxe_file"
+PXELINUX_FILE_STAGE = "pxelinux_file"
+
 # Commands
 LIST_IMAGES_COMMAND = "list_images"
 CREATE_SNAPSHOT_COMMAND = "create_snapshot"
@@ -80,9 +187,21 @@ PROVISION_COMMAND = "provision"
 DEPROVISION_COMMAND = "deprovision"
 LIST_SNAPSHOTS_COMMAND = "list_snapshots"
 REMOVE_IMAGE_COMMAND = "remove_image"
+PROVISION_MANY_COMMAND = "provision_many"
+IMPORT_IMAGE_COMMAND = "import_ceph_image"
+IMPORT_SNAPSHOT_COMMAND = "import_ceph_snapshot"
+RELEASE_PROJECT_COMMAND = "release_project"
+LIST_FLATTENS_COMMAND = "list_flattens"
+CANCEL_FLATTEN_COMMAND = "cancel_flatten"
+DRAIN_POOL_COMMAND = "drain_pool"
+START_UPLOAD_COMMAND = "start_upload"
+UPLOAD_CHUNK_COMMAND = "upload_chunk"
+START_DOWNLOAD_COMMAND = "start_download"
+DOWNLOAD_CHUNK_COMMAND = "download_chunk"
 
 # Parameters
 NODE_NAME_PARAMETER = 'node'
+NODES_PARAMETER = 'nodes'
 IMAGE_NAME_PARAMETER = "img"
 SNAP_NAME_PARAMETER = "snap_name"
 PROJECT_PARAMETER = "project"
@@ -93,6 +212,11 @@ IMAGE2_NAME_PARAMETER = "img2"
 NETWORK_PARAMETER = "network"
 NIC_PARAMETER = "nic"
 CHANNEL_PARAMETER = "channel"
+PROTECT_PARAMETER = "protect"
+JOB_ID_PARAMETER = "job_id"
+SIZE_PARAMETER = "size"
+OFFSET_PARAMETER = "offset"
+LENGTH_PARAMETER = "length"
 
 # Template Parameters
 IPXE_TARGET_NAME = "${target_name}"
@@ -108,10 +232,70 @@ IET_ISCSI_CONFIG_LOC = '/etc/iet/ietd.conf'
 IET_ISCSI_CONFIG_TEMP_LOC = '/etc/iet/ietd.temp'
 IET_TARGET_STARTING = 'Target'
 IET_LUN_STARTING = "Lun"
+IET_TARGET_PREFIX = 'iqn.2015.'
+IET_LUN_PARAMS = 'Path=${rbd_name},Type=blockio,ScsiId=lun0,ScsiSN=lun0'
+IET_VOLUME_LOC = '/proc/net/iet/volume'
+CONFIGFS_ROOT = '/sys/kernel/config'
+LIO_HBA = 'iblock_0'
+LIO_TPG = 'tpgt_1'
+LIO_LUN = 'lun_0'
 
 DNSMASQ_LEASES_LOC = '/var/lib/misc/dnsmasq.leases'
 
 HAAS_CALL_TIMEOUT = 10
+HAAS_POLL_INTERVAL = 0.5
+HAAS_POLL_MAX_INTERVAL = 8
+HAAS_POLL_TIMEOUT = 120
+ROLLBACK_RETRIES = 3
+DEFAULT_WORKERS = 8
+DEFAULT_JOB_WORKERS = 4
+DEFAULT_FLATTEN_WORKERS = 2
+# In MB/s, 0 means the flattens are not throttled
+DEFAULT_FLATTEN_BANDWIDTH = 0
+# Flattens running at a time across all the einsteins using the ceph pool
+DEFAULT_FLATTEN_CLUSTER_SLOTS = 4
+# Seconds between the measures of the usage of the images, 0 turns it off
+DEFAULT_USAGE_REFRESH_INTERVAL = 300
+# The slots are rados locks on the objects <name>.<slot> in the pool, a lock
+# expires after the duration in seconds unless it is renewed
+FLATTEN_SLOT_NAME = "bmi_flatten_slot"
+FLATTEN_SLOT_DURATION = 60
+FLATTEN_SLOT_RETRY_INTERVAL = 5
+# LIBRADOS_LOCK_FLAG_RENEW
+RADOS_LOCK_FLAG_RENEW = 1
+DEFAULT_CEPH_CONNECTIONS = 4
+DEFAULT_IMAGE_CACHE_SIZE = 64
+# Asynchronous reads or writes in flight per chunk read from or written to
+# an image
+DEFAULT_QUEUE_DEPTH = 8
+# Uploads are sent from picasso to einstein in chunks which are written in
+# blocks, the blocks which are all zeros are skipped to keep the image sparse
+UPLOAD_CHUNK_SIZE = 16 * 1024 * 1024
+UPLOAD_BLOCK_SIZE = 1024 * 1024
+QCOW2_MAGIC = "QFI\xfb"
+# Downloads are read from einstein in chunks and streamed by picasso as
+# frames, each a line with the frame type and its fields. A size frame comes
+# first, then a data frame with the offset and length of every allocated
+# extent followed by its bytes, and last an end frame with the sha256 of the
+# data sent. An error frame with the message ends a failed download.
+DOWNLOAD_CHUNK_SIZE = 16 * 1024 * 1024
+DOWNLOAD_SIZE_FRAME = "size"
+DOWNLOAD_DATA_FRAME = "data"
+DOWNLOAD_END_FRAME = "end"
+DOWNLOAD_ERROR_FRAME = "error"
+# Seconds an open image and its snapshots and parent info are cached for
+DEFAULT_IMAGE_CACHE_TTL = 60
+# Seconds a pooled ceph connection can be idle before it is checked again
+CEPH_HEALTH_CHECK_INTERVAL = 30
+# How the images are mapped, cli runs rbd map through sudo and sysfs writes
+# to the rbd bus of the kernel
+CLI_MAP_BACKEND = "cli"
+SYSFS_MAP_BACKEND = "sysfs"
+SYSFS_ROOT = "/sys"
+RBD_DEVICE_PREFIX = "/dev/rbd"
+# Seconds between the reconciles of the index of mapped images with the host
+MAPPING_RECONCILE_INTERVAL = 30
+NODES_SEPARATOR = ","
 DEFAULT_SNAPSHOT_NAME = "snapshot"
 
 BMI_ADMIN_PROJECT = "bmi_infra"
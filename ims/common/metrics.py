@@ -0,0 +1,94 @@
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+import ims.common.constants as constants
+
+
+# A latency histogram with fixed buckets, the counts are kept per bucket and
+# are made cumulative when the snapshot is taken
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    # Returns a dict with the cumulative count of every bucket as a list of
+    # [upper bound, count], the last bucket has None as its upper bound
+    def snapshot(self):
+        with self.lock:
+            buckets = []
+            total = 0
+            for bound, count in zip(self.buckets + [None], self.counts):
+                total += count
+                buckets.append([bound, total])
+            return {constants.METRICS_BUCKETS_KEY: buckets,
+                    constants.METRICS_SUM_KEY: self.sum,
+                    constants.METRICS_COUNT_KEY: self.count}
+
+
+# Holds the histogram of every stage that has been timed in this process
+class Registry:
+    def __init__(self):
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def observe(self, stage, value):
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = Histogram(constants.METRICS_LATENCY_BUCKETS)
+                self.histograms[stage] = histogram
+        histogram.observe(value)
+
+    def snapshot(self):
+        with self.lock:
+            histograms = self.histograms.items()
+        return dict(
+            (stage, histogram.snapshot()) for stage, histogram in histograms)
+
+
+_registry = Registry()
+
+
+# Context manager which records how long the block took under stage
+# The time is recorded even if the block raises
+@contextmanager
+def timer(stage):
+    start = time.time()
+    try:
+        yield
+    finally:
+        _registry.observe(stage, time.time() - start)
+
+
+# Decorator which records how long every call of the function took under stage
+def timed(stage):
+    def decorator(func):
+        @functools.wraps(func)
+        def func_wrapper(*args, **kwargs):
+            with timer(stage):
+                return func(*args, **kwargs)
+
+        return func_wrapper
+
+    return decorator
+
+
+# Returns the histograms of all the stages as a dict of stage to histogram
+def snapshot():
+    return _registry.snapshot()
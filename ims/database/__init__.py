@@ -1,5 +1,12 @@
 # Added here so that single import can be used whenever this package is used
 from ims.database.database import *
 from ims.database.db_connection import DatabaseConnection
+from ims.database.flatten import *
 from ims.database.image import *
+from ims.database.image_location import *
+from ims.database.image_usage import *
+from ims.database.job import *
+from ims.database.node_state import *
+from ims.database.pool_image import *
 from ims.database.project import *
+from ims.database.upload import *
@@ -1,4 +1,11 @@
+from ims.database.flatten import *
 from ims.database.image import *
+from ims.database.image_location import *
+from ims.database.image_usage import *
+from ims.database.job import *
+from ims.database.node_state import *
+from ims.database.pool_image import *
+from ims.database.upload import *
 
 
 class Database:
@@ -7,6 +14,13 @@ class Database:
         self.__connection = DatabaseConnection()
         self.project = ProjectRepository(self.__connection)
         self.image = ImageRepository(self.__connection)
+        self.job = JobRepository(self.__connection)
+        self.pool = PoolImageRepository(self.__connection)
+        self.flatten = FlattenRepository(self.__connection)
+        self.node_state = NodeStateRepository(self.__connection)
+        self.usage = ImageUsageRepository(self.__connection)
+        self.upload = UploadRepository(self.__connection)
+        self.location = ImageLocationRepository(self.__connection)
 
     def __enter__(self):
         return self
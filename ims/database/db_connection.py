@@ -1,3 +1,5 @@
+import threading
+
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
@@ -26,9 +28,19 @@ class DatabaseConnection:
     # creates a session maker for creating sessions
     session_maker = sessionmaker(bind=engine)
 
-    # creates all tables if not present
+    # set once the tables have been created by this process
+    tables_created = False
+    tables_lock = threading.Lock()
+
+    # creates all tables if not present, this is done only by the first
+    # connection of the process
     def __init__(self):
-        DatabaseConnection.Base.metadata.create_all(DatabaseConnection.engine)
+        if not DatabaseConnection.tables_created:
+            with DatabaseConnection.tables_lock:
+                if not DatabaseConnection.tables_created:
+                    DatabaseConnection.Base.metadata.create_all(
+                        DatabaseConnection.engine)
+                    DatabaseConnection.tables_created = True
         self.session = DatabaseConnection.session_maker()
 
     def close(self):
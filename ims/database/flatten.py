@@ -0,0 +1,125 @@
+import datetime
+
+from sqlalchemy import Boolean, DateTime, ForeignKey
+
+import ims.common.constants as constants
+from ims.database.image import Image
+from ims.database.project import *
+from ims.exception import *
+
+logger = create_logger(__name__)
+
+
+# This class is responsible for doing CRUD operations on the Flatten Table
+# The table holds the images whose flatten has been queued to the flatten
+# scheduler, an image is not usable until its row is removed
+class FlattenRepository:
+    @trace
+    def __init__(self, connection):
+        self.connection = connection
+
+    # inserts a queued flatten of the image along with what has to be done
+    # to its parent once it is flattened
+    @log
+    def insert(self, image_id, ceph_name, parent_ceph_name, parent_snap_name,
+               remove_parent_snap):
+        try:
+            flatten = Flatten()
+            flatten.image_id = image_id
+            flatten.ceph_name = ceph_name
+            flatten.parent_ceph_name = parent_ceph_name
+            flatten.parent_snap_name = parent_snap_name
+            flatten.remove_parent_snap = remove_parent_snap
+            flatten.status = constants.FLATTEN_QUEUED_STATUS
+            self.connection.session.add(flatten)
+            self.connection.session.commit()
+        except SQLAlchemyError as e:
+            self.connection.session.rollback()
+            raise db_exceptions.ORMException(e.message)
+
+    # deletes the flatten of the image, done once the image is usable
+    @log
+    def delete_with_image_id(self, image_id):
+        try:
+            flatten = self.connection.session.query(Flatten).filter_by(
+                image_id=image_id).one_or_none()
+            if flatten is not None:
+                self.connection.session.delete(flatten)
+                self.connection.session.commit()
+        except SQLAlchemyError as e:
+            self.connection.session.rollback()
+            raise db_exceptions.ORMException(e.message)
+
+    @log
+    def update_status(self, image_id, status):
+        try:
+            flatten = self.connection.session.query(Flatten).filter_by(
+                image_id=image_id).one_or_none()
+            if flatten is not None:
+                flatten.status = status
+                self.connection.session.commit()
+        except SQLAlchemyError as e:
+            self.connection.session.rollback()
+            raise db_exceptions.ORMException(e.message)
+
+    # returns the flatten of the image as a dict, None if there is none
+    @log
+    def fetch_with_image_id(self, image_id):
+        try:
+            flatten = self.connection.session.query(Flatten).filter_by(
+                image_id=image_id).one_or_none()
+            if flatten is None:
+                return None
+            return flatten.to_dict()
+        except SQLAlchemyError as e:
+            raise db_exceptions.ORMException(e.message)
+
+    # returns the ids of the images whose flatten is in one of the statuses
+    @log
+    def fetch_image_ids_with_status(self, statuses):
+        try:
+            flattens = self.connection.session.query(Flatten).filter(
+                Flatten.status.in_(statuses))
+            return [flatten.image_id for flatten in flattens]
+        except SQLAlchemyError as e:
+            raise db_exceptions.ORMException(e.message)
+
+    # returns the id, name and status of every image of the project which is
+    # being flattened
+    @log
+    def fetch_from_project(self, project_name):
+        try:
+            rows = self.connection.session.query(Flatten, Image).filter(
+                Flatten.image_id == Image.id).filter(
+                Image.project.has(name=project_name))
+            return [[image.id, image.name, flatten.status] for flatten, image
+                    in rows]
+        except SQLAlchemyError as e:
+            raise db_exceptions.ORMException(e.message)
+
+
+# This class represents the flatten table
+# ceph_name is the clone being flattened, the snapshot parent_snap_name of
+# parent_ceph_name is unprotected and removed after it if remove_parent_snap
+class Flatten(DatabaseConnection.Base):
+    __tablename__ = "flatten"
+
+    # Columns in the table
+    id = Column(Integer, primary_key=True, nullable=False, autoincrement=True)
+    image_id = Column(Integer, ForeignKey("image.id"), nullable=False,
+                      unique=True)
+    ceph_name = Column(String, nullable=False)
+    parent_ceph_name = Column(String, nullable=False)
+    parent_snap_name = Column(String, nullable=False)
+    remove_parent_snap = Column(Boolean, nullable=False, default=False)
+    status = Column(String, nullable=False)
+    created_at = Column(DateTime, nullable=False,
+                        default=datetime.datetime.utcnow)
+
+    def to_dict(self):
+        return {"image_id": self.image_id, "ceph_name": self.ceph_name,
+                "parent_ceph_name": self.parent_ceph_name,
+                "parent_snap_name": self.parent_snap_name,
+                "remove_parent_snap": self.remove_parent_snap,
+                "status": self.status,
+                "created_at": str(self.created_at)}
@@ -1,6 +1,9 @@
 from sqlalchemy import Boolean, ForeignKey
 from sqlalchemy import UniqueConstraint
 
+import ims.common.constants as constants
+from ims.common.metrics import timed
+from ims.database.pool_image import PoolImage
 from ims.database.project import *
 from ims.exception import *
 
@@ -18,6 +21,7 @@ class ImageRepository:
     # inserts the arguments into table
     # Commits if inserted successfully otherwise rollbacks if some issue occured and bubbles the exception
     @log
+    @timed(constants.DB_INSERT_STAGE)
     def insert(self, image_name, project_id, parent_id=None, is_public=False,
                is_snapshot=False, id=None):
         try:
@@ -38,6 +42,7 @@ class ImageRepository:
     # deletes images with name under the given project name
     # commits if deletion was successful otherwise rollback occurs and exception is bubbled up
     @log
+    @timed(constants.DB_DELETE_STAGE)
     def delete_with_name_from_project(self, name, project_name):
         try:
             image = self.connection.session.query(Image). \
@@ -185,12 +190,14 @@ class ImageRepository:
         except SQLAlchemyError as e:
             raise db_exceptions.ORMException(e.message)
 
+    # The clones which are waiting in the warm pool are not returned
     @log
     def fetch_clones_from_project(self, project_name):
         try:
             images = self.connection.session.query(Image).filter(
                 Image.project.has(name=project_name)).filter_by(
-                is_snapshot=False)
+                is_snapshot=False).filter(~Image.id.in_(
+                self.connection.session.query(PoolImage.image_id)))
             rows = []
             for image in images:
                 row = []
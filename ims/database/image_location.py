@@ -0,0 +1,62 @@
+from ims.database.project import *
+from ims.exception import *
+
+logger = create_logger(__name__)
+
+
+# This class is responsible for doing CRUD operations on the Image Location
+# Table. The table holds the ceph backend each image was placed in when
+# several of them are configured, keyed by the ceph name of the image
+class ImageLocationRepository:
+    @trace
+    def __init__(self, connection):
+        self.connection = connection
+
+    # inserts or updates the backend of the image, the name of a removed
+    # image can be given to a new one which then replaces its row
+    @log
+    def upsert(self, ceph_name, backend):
+        try:
+            location = self.connection.session.query(ImageLocation).filter_by(
+                ceph_name=ceph_name).one_or_none()
+            if location is None:
+                location = ImageLocation()
+                location.ceph_name = ceph_name
+                self.connection.session.add(location)
+            location.backend = backend
+            self.connection.session.commit()
+        except SQLAlchemyError as e:
+            self.connection.session.rollback()
+            raise db_exceptions.ORMException(e.message)
+
+    @log
+    def delete_with_ceph_name(self, ceph_name):
+        try:
+            self.connection.session.query(ImageLocation).filter_by(
+                ceph_name=ceph_name).delete()
+            self.connection.session.commit()
+        except SQLAlchemyError as e:
+            self.connection.session.rollback()
+            raise db_exceptions.ORMException(e.message)
+
+    # returns the backend of the image, None if it was not placed
+    @log
+    def fetch_backend_with_ceph_name(self, ceph_name):
+        try:
+            location = self.connection.session.query(ImageLocation).filter_by(
+                ceph_name=ceph_name).one_or_none()
+            if location is None:
+                return None
+            return location.backend
+        except SQLAlchemyError as e:
+            raise db_exceptions.ORMException(e.message)
+
+
+# This class represents the image location table
+class ImageLocation(DatabaseConnection.Base):
+    __tablename__ = "image_location"
+
+    # Columns in the table
+    id = Column(Integer, primary_key=True, nullable=False, autoincrement=True)
+    ceph_name = Column(String, nullable=False, unique=True)
+    backend = Column(String, nullable=False)
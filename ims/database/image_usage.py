@@ -0,0 +1,93 @@
+import datetime
+
+from sqlalchemy import BigInteger, DateTime, ForeignKey
+
+from ims.database.image import Image
+from ims.database.project import *
+from ims.exception import *
+
+logger = create_logger(__name__)
+
+
+# This class is responsible for doing CRUD operations on the Image Usage Table
+# The table holds the provisioned and used bytes of the images as last
+# measured by the usage refresher so that they can be listed without going
+# to ceph
+class ImageUsageRepository:
+    @trace
+    def __init__(self, connection):
+        self.connection = connection
+
+    # inserts or updates the usage of the image
+    @log
+    def upsert(self, image_id, provisioned, used):
+        try:
+            usage = self.connection.session.query(ImageUsage).filter_by(
+                image_id=image_id).one_or_none()
+            if usage is None:
+                usage = ImageUsage()
+                usage.image_id = image_id
+                self.connection.session.add(usage)
+            usage.provisioned = provisioned
+            usage.used = used
+            usage.updated_at = datetime.datetime.utcnow()
+            self.connection.session.commit()
+        except SQLAlchemyError as e:
+            self.connection.session.rollback()
+            raise db_exceptions.ORMException(e.message)
+
+    # deletes the usage of the images which no longer exist
+    @log
+    def delete_stale(self):
+        try:
+            self.connection.session.query(ImageUsage).filter(
+                ~ImageUsage.image_id.in_(
+                    self.connection.session.query(Image.id))).delete(
+                synchronize_session=False)
+            self.connection.session.commit()
+        except SQLAlchemyError as e:
+            self.connection.session.rollback()
+            raise db_exceptions.ORMException(e.message)
+
+    # returns the usage of the image as a dict, None if it was not measured
+    @log
+    def fetch_with_image_id(self, image_id):
+        try:
+            usage = self.connection.session.query(ImageUsage).filter_by(
+                image_id=image_id).one_or_none()
+            if usage is None:
+                return None
+            return usage.to_dict()
+        except SQLAlchemyError as e:
+            raise db_exceptions.ORMException(e.message)
+
+    # returns a dict of the name of every measured image of the project to
+    # its provisioned and used bytes
+    @log
+    def fetch_from_project(self, project_name):
+        try:
+            rows = self.connection.session.query(ImageUsage, Image).filter(
+                ImageUsage.image_id == Image.id).filter(
+                Image.project.has(name=project_name))
+            return dict((image.name, [usage.provisioned, usage.used]) for
+                        usage, image in rows)
+        except SQLAlchemyError as e:
+            raise db_exceptions.ORMException(e.message)
+
+
+# This class represents the image usage table
+class ImageUsage(DatabaseConnection.Base):
+    __tablename__ = "image_usage"
+
+    # Columns in the table
+    id = Column(Integer, primary_key=True, nullable=False, autoincrement=True)
+    image_id = Column(Integer, ForeignKey("image.id"), nullable=False,
+                      unique=True)
+    provisioned = Column(BigInteger, nullable=False)
+    used = Column(BigInteger, nullable=False)
+    updated_at = Column(DateTime, nullable=False,
+                        default=datetime.datetime.utcnow)
+
+    def to_dict(self):
+        return {"image_id": self.image_id, "provisioned": self.provisioned,
+                "used": self.used, "updated_at": str(self.updated_at)}
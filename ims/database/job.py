@@ -0,0 +1,117 @@
+import datetime
+import json
+
+from sqlalchemy import DateTime, Text
+
+import ims.common.constants as constants
+from ims.database.project import *
+from ims.exception import *
+
+logger = create_logger(__name__)
+
+
+# This class is responsible for doing CRUD operations on the Job Table in DB
+# Jobs are the operations that einstein runs in the background, the table
+# persists their arguments, status and result so that they can be polled
+class JobRepository:
+    @trace
+    def __init__(self, connection):
+        self.connection = connection
+
+    # inserts a queued job and returns its id
+    # Commits if inserted successfully otherwise rollbacks and bubbles the
+    # exception
+    @log
+    def insert(self, command, project_name, args):
+        try:
+            job = Job()
+            job.command = command
+            job.project = project_name
+            job.args = json.dumps(args)
+            job.status = constants.JOB_QUEUED_STATUS
+            self.connection.session.add(job)
+            self.connection.session.commit()
+            return job.id
+        except SQLAlchemyError as e:
+            self.connection.session.rollback()
+            raise db_exceptions.ORMException(e.message)
+
+    # deletes the job with id
+    @log
+    def delete_with_id(self, id):
+        try:
+            job = self.connection.session.query(Job).filter_by(
+                id=id).one_or_none()
+            if job is not None:
+                self.connection.session.delete(job)
+                self.connection.session.commit()
+        except SQLAlchemyError as e:
+            self.connection.session.rollback()
+            raise db_exceptions.ORMException(e.message)
+
+    # updates the status of the job with id, result is stored as json if given
+    @log
+    def update_status(self, id, status, result=None):
+        try:
+            job = self.connection.session.query(Job).filter_by(
+                id=id).one_or_none()
+            if job is None:
+                raise db_exceptions.JobNotFoundException(id)
+            job.status = status
+            job.updated_at = datetime.datetime.utcnow()
+            if result is not None:
+                job.result = json.dumps(result)
+            self.connection.session.commit()
+        except SQLAlchemyError as e:
+            self.connection.session.rollback()
+            raise db_exceptions.ORMException(e.message)
+
+    # returns the job with id as a dict, the project is checked so that users
+    # cannot poll jobs of other projects
+    @log
+    def fetch_with_id_from_project(self, id, project_name):
+        try:
+            job = self.connection.session.query(Job).filter_by(
+                id=id, project=project_name).one_or_none()
+            if job is None:
+                raise db_exceptions.JobNotFoundException(id)
+            return job.to_dict()
+        except SQLAlchemyError as e:
+            raise db_exceptions.ORMException(e.message)
+
+    # returns the ids of the jobs which are in one of the given statuses
+    @log
+    def fetch_ids_with_status(self, statuses):
+        try:
+            jobs = self.connection.session.query(Job).filter(
+                Job.status.in_(statuses))
+            return [job.id for job in jobs]
+        except SQLAlchemyError as e:
+            raise db_exceptions.ORMException(e.message)
+
+
+# This class represents the job table
+# args and result are stored as json strings
+class Job(DatabaseConnection.Base):
+    __tablename__ = "job"
+
+    # Columns in the table
+    id = Column(Integer, primary_key=True, nullable=False, autoincrement=True)
+    command = Column(String, nullable=False)
+    project = Column(String, nullable=False)
+    args = Column(Text, nullable=False)
+    status = Column(String, nullable=False)
+    result = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False,
+                        default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False,
+                        default=datetime.datetime.utcnow)
+
+    def to_dict(self):
+        return {"id": self.id, "command": self.command,
+                "project": self.project, "args": json.loads(self.args),
+                "status": self.status,
+                "result": json.loads(
+                    self.result) if self.result is not None else None,
+                "created_at": str(self.created_at),
+                "updated_at": str(self.updated_at)}
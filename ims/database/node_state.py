@@ -0,0 +1,126 @@
+import datetime
+
+from sqlalchemy import DateTime
+from sqlalchemy import UniqueConstraint
+
+import ims.common.constants as constants
+from ims.database.project import *
+from ims.exception import *
+
+logger = create_logger(__name__)
+
+
+# This class is responsible for doing CRUD operations on the Node State Table
+# The table holds the nodes which are being provisioned or deprovisioned along
+# with the last step that was completed, so that einstein can resume or roll
+# them back if it goes down in the middle of the operation
+class NodeStateRepository:
+    @trace
+    def __init__(self, connection):
+        self.connection = connection
+
+    # inserts the node in the started state, raises if an operation is
+    # already in progress on the node
+    @log
+    def insert(self, project_name, node_name, operation, network, nic,
+               img_name=None, ceph_name=None):
+        try:
+            if self.connection.session.query(NodeState).filter_by(
+                    project=project_name, node=node_name).count() > 0:
+                raise db_exceptions.NodeInProgressException(node_name)
+            node_state = NodeState()
+            node_state.project = project_name
+            node_state.node = node_name
+            node_state.operation = operation
+            node_state.network = network
+            node_state.nic = nic
+            node_state.img = img_name
+            node_state.ceph_name = ceph_name
+            node_state.state = constants.NODE_STARTED_STATE
+            self.connection.session.add(node_state)
+            self.connection.session.commit()
+        except SQLAlchemyError as e:
+            self.connection.session.rollback()
+            raise db_exceptions.ORMException(e.message)
+
+    # records that the node has reached state, the name of the ceph image of
+    # the node is stored along with it once it is known
+    @log
+    def update_state(self, project_name, node_name, state, ceph_name=None):
+        try:
+            node_state = self.connection.session.query(NodeState).filter_by(
+                project=project_name, node=node_name).one_or_none()
+            if node_state is not None:
+                node_state.state = state
+                if ceph_name is not None:
+                    node_state.ceph_name = ceph_name
+                node_state.updated_at = datetime.datetime.utcnow()
+                self.connection.session.commit()
+        except SQLAlchemyError as e:
+            self.connection.session.rollback()
+            raise db_exceptions.ORMException(e.message)
+
+    # deletes the node once its operation has finished or has been rolled back
+    @log
+    def delete_with_node_from_project(self, project_name, node_name):
+        try:
+            node_state = self.connection.session.query(NodeState).filter_by(
+                project=project_name, node=node_name).one_or_none()
+            if node_state is not None:
+                self.connection.session.delete(node_state)
+                self.connection.session.commit()
+        except SQLAlchemyError as e:
+            self.connection.session.rollback()
+            raise db_exceptions.ORMException(e.message)
+
+    # returns the node as a dict, None if no operation is in progress on it
+    @log
+    def fetch_with_node_from_project(self, project_name, node_name):
+        try:
+            node_state = self.connection.session.query(NodeState).filter_by(
+                project=project_name, node=node_name).one_or_none()
+            if node_state is None:
+                return None
+            return node_state.to_dict()
+        except SQLAlchemyError as e:
+            raise db_exceptions.ORMException(e.message)
+
+    # returns the project and name of every node in progress
+    @log
+    def fetch_nodes(self):
+        try:
+            return [[node_state.project, node_state.node] for node_state in
+                    self.connection.session.query(NodeState)]
+        except SQLAlchemyError as e:
+            raise db_exceptions.ORMException(e.message)
+
+
+# This class represents the node state table
+# operation is either provision or deprovision and state is the last step
+# of it that was completed
+class NodeState(DatabaseConnection.Base):
+    __tablename__ = "node_state"
+
+    # Columns in the table
+    id = Column(Integer, primary_key=True, nullable=False, autoincrement=True)
+    project = Column(String, nullable=False)
+    node = Column(String, nullable=False)
+    operation = Column(String, nullable=False)
+    network = Column(String, nullable=False)
+    nic = Column(String, nullable=False)
+    img = Column(String, nullable=True)
+    ceph_name = Column(String, nullable=True)
+    state = Column(String, nullable=False)
+    updated_at = Column(DateTime, nullable=False,
+                        default=datetime.datetime.utcnow)
+
+    # Only one operation can be in progress on a node
+    __table_args__ = (UniqueConstraint("project", "node",
+                                       name="_project_node_unique_constraint"),)
+
+    def to_dict(self):
+        return {"project": self.project, "node": self.node,
+                "operation": self.operation, "network": self.network,
+                "nic": self.nic, "img": self.img,
+                "ceph_name": self.ceph_name, "state": self.state,
+                "updated_at": str(self.updated_at)}
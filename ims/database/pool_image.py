@@ -0,0 +1,66 @@
+from sqlalchemy import ForeignKey
+
+from ims.database.project import *
+from ims.exception import *
+
+logger = create_logger(__name__)
+
+
+# This class is responsible for doing CRUD operations on the Pool Image Table
+# The table holds the clones which were created ahead of time by the warm pool
+# and are ready to be claimed by provision
+class PoolImageRepository:
+    @trace
+    def __init__(self, connection):
+        self.connection = connection
+
+    # inserts the image as a ready clone of the golden image
+    @log
+    def insert(self, image_id, golden_id):
+        try:
+            pool_image = PoolImage()
+            pool_image.image_id = image_id
+            pool_image.golden_id = golden_id
+            self.connection.session.add(pool_image)
+            self.connection.session.commit()
+        except SQLAlchemyError as e:
+            self.connection.session.rollback()
+            raise db_exceptions.ORMException(e.message)
+
+    # removes one ready clone of the golden image from the pool and returns
+    # its image id, None is returned if the pool is empty
+    @log
+    def claim(self, golden_id):
+        try:
+            pool_image = self.connection.session.query(PoolImage).filter_by(
+                golden_id=golden_id).first()
+            if pool_image is None:
+                return None
+            image_id = pool_image.image_id
+            self.connection.session.delete(pool_image)
+            self.connection.session.commit()
+            return image_id
+        except SQLAlchemyError as e:
+            self.connection.session.rollback()
+            raise db_exceptions.ORMException(e.message)
+
+    # returns the number of ready clones of the golden image
+    @log
+    def count_with_golden_id(self, golden_id):
+        try:
+            return self.connection.session.query(PoolImage).filter_by(
+                golden_id=golden_id).count()
+        except SQLAlchemyError as e:
+            raise db_exceptions.ORMException(e.message)
+
+
+# This class represents the pool image table
+# image_id is the clone and golden_id is the image it was cloned from
+class PoolImage(DatabaseConnection.Base):
+    __tablename__ = "pool_image"
+
+    # Columns in the table
+    id = Column(Integer, primary_key=True, nullable=False, autoincrement=True)
+    image_id = Column(Integer, ForeignKey("image.id"), nullable=False,
+                      unique=True)
+    golden_id = Column(Integer, ForeignKey("image.id"), nullable=False)
@@ -0,0 +1,90 @@
+import datetime
+
+from sqlalchemy import BigInteger, DateTime, ForeignKey
+
+from ims.database.project import *
+from ims.exception import *
+
+logger = create_logger(__name__)
+
+
+# This class is responsible for doing CRUD operations on the Upload Table
+# The table holds the images which are being uploaded along with the offset
+# up to which their data has been written, so that an interrupted upload can
+# be resumed. An image is not usable until its row is removed.
+class UploadRepository:
+    @trace
+    def __init__(self, connection):
+        self.connection = connection
+
+    # inserts the upload of the image of size bytes, starting at offset 0
+    @log
+    def insert(self, image_id, size):
+        try:
+            upload = Upload()
+            upload.image_id = image_id
+            upload.size = size
+            upload.offset = 0
+            self.connection.session.add(upload)
+            self.connection.session.commit()
+        except SQLAlchemyError as e:
+            self.connection.session.rollback()
+            raise db_exceptions.ORMException(e.message)
+
+    # records that the data of the image has been written up to offset
+    @log
+    def update_offset(self, image_id, offset):
+        try:
+            upload = self.connection.session.query(Upload).filter_by(
+                image_id=image_id).one_or_none()
+            if upload is not None:
+                upload.offset = offset
+                upload.updated_at = datetime.datetime.utcnow()
+                self.connection.session.commit()
+        except SQLAlchemyError as e:
+            self.connection.session.rollback()
+            raise db_exceptions.ORMException(e.message)
+
+    # deletes the upload of the image, done once the image is usable
+    @log
+    def delete_with_image_id(self, image_id):
+        try:
+            upload = self.connection.session.query(Upload).filter_by(
+                image_id=image_id).one_or_none()
+            if upload is not None:
+                self.connection.session.delete(upload)
+                self.connection.session.commit()
+        except SQLAlchemyError as e:
+            self.connection.session.rollback()
+            raise db_exceptions.ORMException(e.message)
+
+    # returns the upload of the image as a dict, None if there is none
+    @log
+    def fetch_with_image_id(self, image_id):
+        try:
+            upload = self.connection.session.query(Upload).filter_by(
+                image_id=image_id).one_or_none()
+            if upload is None:
+                return None
+            return upload.to_dict()
+        except SQLAlchemyError as e:
+            raise db_exceptions.ORMException(e.message)
+
+
+# This class represents the upload table
+# offset is the number of bytes of the image which have been written
+class Upload(DatabaseConnection.Base):
+    __tablename__ = "upload"
+
+    # Columns in the table
+    id = Column(Integer, primary_key=True, nullable=False, autoincrement=True)
+    image_id = Column(Integer, ForeignKey("image.id"), nullable=False,
+                      unique=True)
+    size = Column(BigInteger, nullable=False)
+    offset = Column(BigInteger, nullable=False)
+    updated_at = Column(DateTime, nullable=False,
+                        default=datetime.datetime.utcnow)
+
+    def to_dict(self):
+        return {"image_id": self.image_id, "size": self.size,
+                "offset": self.offset, "updated_at": str(self.updated_at)}
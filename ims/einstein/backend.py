@@ -0,0 +1,63 @@
+import ims.common.constants as constants
+from ims.common.log import *
+from ims.einstein.ceph import RBD
+from ims.einstein.committer import TargetCommitter
+from ims.einstein.dnsmasq import DNSMasq
+from ims.einstein.hil import HTTPSessions
+from ims.einstein.iscsi import IET
+from ims.einstein.lio import LIO, ConfigFS
+from ims.einstein.placement import RBDRouter
+
+logger = create_logger(__name__)
+
+
+# Holds the resources which are expensive to create and do not depend on the
+# credentials of the request, like the ceph connection and the http sessions
+# used for HIL. Einstein creates one per process and passes it to every BMI
+# so that only the project and credentials are set up per call.
+class Backend:
+    @log
+    def __init__(self, cfg):
+        self.fs = self.__create_fs(cfg)
+        if cfg.iscsi_driver == constants.LIO_DRIVER:
+            self.iscsi = LIO(self.fs,
+                             cfg.iscsi_ip + ":" + str(constants.ISCSI_PORT),
+                             ConfigFS(cfg.iscsi_configfs_root))
+        else:
+            self.iscsi = IET(self.fs, cfg.iscsi_update_password,
+                             online=cfg.iscsi_online)
+        if cfg.iscsi_commit_window > 0:
+            self.iscsi = TargetCommitter(self.iscsi,
+                                         cfg.iscsi_commit_window / 1000.0,
+                                         cfg.iscsi_commit_batch_size)
+        self.dhcp = DNSMasq()
+        self.http = HTTPSessions()
+
+    # The images are spread over the ceph backends by a router when other
+    # ones are declared besides ceph
+    @trace
+    def __create_fs(self, cfg):
+        names = [name for name in cfg.fs if
+                 name == constants.CEPH_CONFIG_SECTION_NAME or
+                 name.startswith(constants.CEPH_BACKEND_PREFIX)]
+        if len(names) <= 1:
+            return RBD(cfg.fs[constants.CEPH_CONFIG_SECTION_NAME],
+                       cfg.iscsi_update_password)
+        backends = dict((name, RBD(cfg.fs[name], cfg.iscsi_update_password))
+                        for name in names)
+        clusters = dict((name, backend.r_conf) for name, backend in
+                        backends.items())
+        return RBDRouter(backends, clusters,
+                         constants.CEPH_CONFIG_SECTION_NAME,
+                         cfg.placement_policy, cfg.placement_projects, cfg.uid)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    @log
+    def shutdown(self):
+        self.fs.tear_down()
+        self.http.close()
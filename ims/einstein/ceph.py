@@ -1,14 +1,17 @@
 #! /bin/python
-import subprocess
+import errno
+import threading
 from contextlib import contextmanager
 
 import rados
 import rbd
-import sh
 
 import ims.common.constants as constants
+import ims.einstein.krbd as krbd
+import ims.einstein.rados_pool as rados_pool
 import ims.exception.file_system_exceptions as file_system_exceptions
 from ims.common.log import *
+from ims.common.metrics import timed, timer
 
 logger = create_logger(__name__)
 
@@ -20,9 +23,13 @@ class RBD:
     def __init__(self, config, password):
         self.__validate(config)
         self.password = password
-        self.cluster = self.__init_cluster()
-        self.context = self.__init_context()
+        self.connections = rados_pool.get(self.rid, self.r_conf, self.pool,
+                                          self.size, self.cache_size,
+                                          self.cache_ttl)
+        self.images = self.connections.images
         self.rbd = rbd.RBD()
+        self.mappings = krbd.get(self.map_backend, self.rid, self.r_conf,
+                                 self.keyring, password, self.sysfs_root)
 
     # Validates the config arguments passed
     # If all are present then the values are copied to variables
@@ -41,15 +48,32 @@ class RBD:
             raise file_system_exceptions.InvalidConfigArgumentException(
                 constants.CEPH_CONFIG_FILE_KEY)
 
-    @trace
-    def __init_context(self):
-        return self.cluster.open_ioctx(self.pool.encode('utf-8'))
+        self.size = self.__get_int(config, constants.CEPH_CONNECTIONS_KEY,
+                                   constants.DEFAULT_CEPH_CONNECTIONS)
+        self.cache_size = self.__get_int(config,
+                                         constants.CEPH_IMAGE_CACHE_SIZE_KEY,
+                                         constants.DEFAULT_IMAGE_CACHE_SIZE)
+        self.cache_ttl = self.__get_int(config,
+                                        constants.CEPH_IMAGE_CACHE_TTL_KEY,
+                                        constants.DEFAULT_IMAGE_CACHE_TTL)
+        self.queue_depth = self.__get_int(config,
+                                          constants.CEPH_QUEUE_DEPTH_KEY,
+                                          constants.DEFAULT_QUEUE_DEPTH)
+        self.map_backend = config.get(constants.CEPH_MAP_BACKEND_KEY,
+                                      constants.CLI_MAP_BACKEND)
+        if self.map_backend not in (constants.CLI_MAP_BACKEND,
+                                    constants.SYSFS_MAP_BACKEND):
+            raise file_system_exceptions.InvalidConfigArgumentException(
+                constants.CEPH_MAP_BACKEND_KEY)
+        self.sysfs_root = config.get(constants.CEPH_SYSFS_ROOT_KEY,
+                                     constants.SYSFS_ROOT)
 
     @trace
-    def __init_cluster(self):
-        cluster = rados.Rados(rados_id=self.rid, conffile=self.r_conf)
-        cluster.connect()
-        return cluster
+    def __get_int(self, config, key, default):
+        try:
+            return int(config.get(key, default))
+        except ValueError:
+            raise file_system_exceptions.InvalidConfigArgumentException(key)
 
     def __enter__(self):
         return self
@@ -58,46 +82,109 @@ class RBD:
         self.tear_down()
 
     # Written to use 'with' for opening and closing images
-    # Passing context as it is outside class
-    # Need to see if it is ok to put it inside the class
+    # A read only image is kept open in the image cache of the pool after the
+    # block
     @trace
     @contextmanager
-    def __open_image(self, img_name):
-        img = None
-        try:
-            img = rbd.Image(self.context, img_name)
+    def __open_image(self, img_name, read_only=False):
+        with self.connections.open_image(img_name, read_only) as img:
             yield (img)
-        finally:
-            if img is not None:
-                img.close()
 
+    # The connections belong to the pool of the process and stay open for
+    # the next RBD
     @log
     def tear_down(self):
-        self.context.close()
-        logger.info("Successfully Closed Context")
-        self.cluster.shutdown()
+        pass
+
+    # Reads the metadata of the image for the image cache
+    @trace
+    def __read(self, img_id, key):
+        with self.__open_image(img_id, True) as img:
+            if key == 'size':
+                return img.size()
+            if key == 'snaps':
+                return tuple(snap['name'] for snap in img.list_snaps())
+            return img.parent_info()
+
+    # Returns a Batch to run several operations on the images as one, fs is
+    # what the batch routes the images through and defaults to this RBD
+    @log
+    def batch(self, fs=None):
+        return Batch(fs if fs is not None else self)
+
+    # Returns the RBD holding the image, which is this one. RBDRouter routes
+    # the images across several of them.
+    @trace
+    def route(self, img_id):
+        return self
+
+    # Returns the RBD the clone of the parent image is created in
+    @trace
+    def place(self, parent_img_name, clone_img_name):
+        return self
+
+    # Called once the clone is created, there is nothing to record as the
+    # images are not placed
+    @trace
+    def record(self, img_id, backend):
+        pass
+
+    # Called once the image is removed, there is nothing to forget as the
+    # images are not placed
+    @trace
+    def forget(self, img_id):
+        pass
+
+    # Returns the bytes stored in the pool, used to place the images on the
+    # least loaded pool
+    @log
+    def get_load(self):
+        with self.connections.borrow() as context:
+            return context.get_stats()['num_bytes']
+
+    # Borrows the contexts of the parent and of the clone for a clone into
+    # child, one context is shared when the clone is in the same pool so that
+    # the pool is not borrowed from twice
+    @trace
+    @contextmanager
+    def clone_contexts(self, child):
+        with self.connections.borrow() as context:
+            if child is self:
+                yield context, context
+            else:
+                with child.connections.borrow() as child_context:
+                    yield context, child_context
 
     # RBD Operations Section
     @log
     def list_images(self):
-        return self.rbd.list(self.context)
+        with self.connections.borrow() as context:
+            return self.rbd.list(context)
 
     @log
     def create_image(self, img_id, img_size):
         try:
-            self.rbd.create(self.context, img_id, img_size)
+            with self.connections.borrow() as context:
+                self.rbd.create(context, img_id, img_size)
             return True
         except rbd.ImageExists:
             raise file_system_exceptions.ImageExistsException(img_id)
         except rbd.FunctionNotSupported:
             raise file_system_exceptions.FunctionNotSupportedException()
 
+    # child is the RBD the clone is created in, by default the pool of the
+    # parent. It has to be in the same cluster.
     @log
-    def clone(self, parent_img_name, parent_snap_name, clone_img_name):
+    @timed(constants.RBD_CLONE_STAGE)
+    def clone(self, parent_img_name, parent_snap_name, clone_img_name,
+              child=None):
         try:
-            parent_context = child_context = self.context
-            self.rbd.clone(parent_context, parent_img_name, parent_snap_name,
-                           child_context, clone_img_name, features=1)
+            with self.clone_contexts(
+                    child if child is not None else self) as contexts:
+                parent_context, child_context = contexts
+                self.rbd.clone(parent_context, parent_img_name,
+                               parent_snap_name, child_context,
+                               clone_img_name, features=1)
             return True
         except rbd.ImageNotFound:
             # Can be raised if the img or snap is not found
@@ -116,9 +203,12 @@ class RBD:
             raise file_system_exceptions.ArgumentsOutOfRangeException()
 
     @log
+    @timed(constants.RBD_REMOVE_STAGE)
     def remove(self, img_id):
         try:
-            self.rbd.remove(self.context, img_id)
+            self.images.evict(img_id)
+            with self.connections.borrow() as context:
+                self.rbd.remove(context, img_id)
             return True
         except rbd.ImageNotFound:
             raise file_system_exceptions.ImageNotFoundException(img_id)
@@ -137,6 +227,42 @@ class RBD:
         except rbd.ImageNotFound:
             raise file_system_exceptions.ImageNotFoundException(img_id)
 
+    # Writes data at offset in blocks with up to the queue depth of them in
+    # flight at a time. The blocks which are all zeros are skipped so that the
+    # image stays sparse, which expects the image to be zeroed there already
+    # as a new image is. Returns the number of bytes written.
+    @log
+    @timed(constants.RBD_WRITE_STAGE)
+    def write_blocks(self, img_id, data, offset):
+        slots = threading.Semaphore(self.queue_depth)
+        failures = []
+
+        def done(completion):
+            if completion.get_return_value() < 0:
+                failures.append(completion.get_return_value())
+            slots.release()
+
+        written = 0
+        try:
+            with self.__open_image(img_id) as img:
+                completions = []
+                for start in range(0, len(data), constants.UPLOAD_BLOCK_SIZE):
+                    block = data[start:start + constants.UPLOAD_BLOCK_SIZE]
+                    if not block.lstrip('\0'):
+                        continue
+                    slots.acquire()
+                    completions.append(img.aio_write(block, offset + start,
+                                                     done))
+                    written += len(block)
+                for completion in completions:
+                    completion.wait_for_complete_and_cb()
+        except rbd.ImageNotFound:
+            raise file_system_exceptions.ImageNotFoundException(img_id)
+        if failures:
+            logger.info("Raising Write Failed Exception for %s", img_id)
+            raise file_system_exceptions.WriteFailedException(img_id)
+        return written
+
     @log
     def snap_image(self, img_id, name):
         try:
@@ -147,6 +273,7 @@ class RBD:
 
             with self.__open_image(img_id) as img:
                 img.create_snap(name)
+                self.images.invalidate(img_id)
                 return True
         # Was having issue with ceph implemented work around (stack dump issue)
         except rbd.ImageExists:
@@ -164,6 +291,7 @@ class RBD:
 
             with self.__open_image(img_id) as img:
                 img.protect_snap(snap_name)
+                self.images.invalidate(img_id)
                 return True
         except rbd.ImageNotFound:
             raise file_system_exceptions.ImageNotFoundException(img_id)
@@ -178,6 +306,7 @@ class RBD:
 
             with self.__open_image(img_id) as img:
                 img.unprotect_snap(snap_name)
+                self.images.invalidate(img_id)
                 return True
         except rbd.ImageNotFound:
             raise file_system_exceptions.ImageNotFoundException(img_id)
@@ -185,20 +314,158 @@ class RBD:
             raise file_system_exceptions.ImageBusyException(img_id)
 
     @log
-    def flatten(self, img_id):
+    def is_snap_protected(self, img_id, snap_name):
         try:
+            with self.__open_image(img_id, True) as img:
+                return img.is_protected_snap(snap_name)
+        except rbd.ImageNotFound:
+            raise file_system_exceptions.ImageNotFoundException(img_id)
 
-            with self.__open_image(img_id) as img:
-                img.flatten()
-                return True
+    # on_progress is called with the bytes flattened so far and the size of
+    # the image, the flatten is cancelled if it returns False
+    @log
+    def flatten(self, img_id, on_progress=None):
+        return self.batch().flatten(img_id, on_progress).run()
+
+    # Takes one of the cluster wide slots called name by locking its rados
+    # object and returns it, None is returned if all of them are taken. The
+    # lock expires after duration seconds unless it is renewed so that the
+    # slot is freed if einstein goes down while holding it.
+    @log
+    def acquire_slot(self, name, slots, cookie, duration):
+        with self.connections.locking() as context:
+            for slot in range(slots):
+                try:
+                    context.lock_exclusive(name + "." + str(slot), name,
+                                           cookie, duration=duration)
+                    return slot
+                except (rados.ObjectBusy, rados.ObjectExists):
+                    continue
+        return None
+
+    @log
+    def renew_slot(self, name, slot, cookie, duration):
+        with self.connections.locking() as context:
+            context.lock_exclusive(name + "." + str(slot), name, cookie,
+                                   duration=duration,
+                                   flags=constants.RADOS_LOCK_FLAG_RENEW)
+
+    @log
+    def release_slot(self, name, slot, cookie):
+        try:
+            with self.connections.locking() as context:
+                context.unlock(name + "." + str(slot), name, cookie)
+        except rados.ObjectNotFound:
+            # The lock expired
+            logger.info("Slot %s of %s was already released", slot, name)
+
+    # Returns the size of the image in bytes
+    @log
+    def get_size(self, img_id):
+        try:
+            return self.images.get_metadata(img_id, 'size',
+                                            lambda: self.__read(img_id,
+                                                                'size'))
+        except rbd.ImageNotFound:
+            raise file_system_exceptions.ImageNotFoundException(img_id)
+
+    # Returns the provisioned and used bytes of the image. The used bytes
+    # are the extents allocated to the image itself, not to its parent,
+    # which diff_iterate reads from the object map when fast-diff is enabled
+    # instead of checking every object.
+    @log
+    def usage(self, img_id):
+        used = [0]
+
+        def count(offset, length, exists):
+            if exists:
+                used[0] += length
+            return 0
+
+        try:
+            with self.__open_image(img_id, True) as img:
+                size = img.size()
+                try:
+                    img.diff_iterate(0, size, None, count,
+                                     include_parent=False, whole_object=True)
+                except TypeError:
+                    # Older bindings without include_parent and whole_object
+                    used[0] = 0
+                    img.diff_iterate(0, size, None, count)
+                return size, used[0]
+        except rbd.ImageNotFound:
+            raise file_system_exceptions.ImageNotFoundException(img_id)
+
+    # Returns the allocated extents of the image, its parent included, as
+    # [offset, length] lists with the adjacent ones merged. What is not in
+    # them reads as zeros.
+    @log
+    def list_extents(self, img_id):
+        extents = []
+
+        def add(offset, length, exists):
+            if not exists:
+                return 0
+            if extents and extents[-1][0] + extents[-1][1] == offset:
+                extents[-1][1] += length
+            else:
+                extents.append([offset, length])
+            return 0
+
+        try:
+            with self.__open_image(img_id, True) as img:
+                try:
+                    img.diff_iterate(0, img.size(), None, add,
+                                     whole_object=True)
+                except TypeError:
+                    del extents[:]
+                    img.diff_iterate(0, img.size(), None, add)
+            return extents
         except rbd.ImageNotFound:
             raise file_system_exceptions.ImageNotFoundException(img_id)
 
+    # Reads length bytes at offset in blocks with up to the queue depth of
+    # them in flight at a time
+    @log
+    @timed(constants.RBD_READ_STAGE)
+    def read_blocks(self, img_id, offset, length):
+        slots = threading.Semaphore(self.queue_depth)
+        blocks = {}
+        failures = []
+
+        def done(start):
+            def callback(completion, data):
+                if completion.get_return_value() < 0:
+                    failures.append(completion.get_return_value())
+                else:
+                    blocks[start] = data
+                slots.release()
+
+            return callback
+
+        try:
+            with self.__open_image(img_id, True) as img:
+                completions = []
+                for start in range(0, length, constants.UPLOAD_BLOCK_SIZE):
+                    slots.acquire()
+                    completions.append(img.aio_read(
+                        offset + start,
+                        min(constants.UPLOAD_BLOCK_SIZE, length - start),
+                        done(start)))
+                for completion in completions:
+                    completion.wait_for_complete_and_cb()
+        except rbd.ImageNotFound:
+            raise file_system_exceptions.ImageNotFoundException(img_id)
+        if failures:
+            logger.info("Raising Read Failed Exception for %s", img_id)
+            raise file_system_exceptions.ReadFailedException(img_id)
+        return "".join(blocks[start] for start in sorted(blocks))
+
     @log
     def list_snapshots(self, img_id):
         try:
-            with self.__open_image(img_id) as img:
-                return [snap['name'] for snap in img.list_snaps()]
+            return list(self.images.get_metadata(
+                img_id, 'snaps', lambda: self.__read(img_id, 'snaps')))
         except rbd.ImageNotFound:
             raise file_system_exceptions.ImageNotFoundException(img_id)
 
@@ -207,6 +474,7 @@ class RBD:
         try:
             with self.__open_image(img_id) as img:
                 img.remove_snap(name)
+                self.images.invalidate(img_id)
                 return True
         except rbd.ImageNotFound:
             raise file_system_exceptions.ImageNotFoundException(img_id)
@@ -214,61 +482,245 @@ class RBD:
         except rbd.ImageBusy:
             raise file_system_exceptions.ImageBusyException(img_id)
 
+    # The image is opened on a pooled context which stays open after it is
+    # returned, the caller has to close the image
     @log
     def get_image(self, img_id):
         try:
-            return rbd.Image(self.context, img_id)
+            with self.connections.borrow() as context:
+                return rbd.Image(context, img_id)
         except rbd.ImageNotFound:
             raise file_system_exceptions.ImageNotFoundException(img_id)
 
     @log
     def get_parent_info(self, img_id):
         try:
-            with self.__open_image(img_id) as img:
-                return img.parent_info()
+            return self.images.get_metadata(
+                img_id, 'parent', lambda: self.__read(img_id, 'parent'))
         except rbd.ImageNotFound:
             # Should be changed to special exception
             raise file_system_exceptions.ImageNotFoundException(img_id)
 
     @log
+    @timed(constants.RBD_MAP_STAGE)
     def map(self, ceph_img_name):
-        command = "echo {0} | sudo -S rbd --keyring {1} --id {2} map {3}/{4}".format(
-            self.password, self.keyring, self.rid, self.pool, ceph_img_name)
-        p = subprocess.Popen(command, shell=True,
-                             stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
-        output, err = p.communicate()
-        # output = sh.rbd.map(ceph_img_name, keyring=self.keyring, id=self.rid,
-        #            pool=self.pool)
-        if p.returncode == 0:
-            if output.find("sudo") != -1:
-                return output.split(":")[1].strip()
-            else:
-                return output.strip()
-        else:
-            raise file_system_exceptions.MapFailedException(ceph_img_name)
+        return self.mappings.map(self.pool, ceph_img_name)
 
     @log
+    @timed(constants.RBD_UNMAP_STAGE)
     def unmap(self, rbd_name):
-        command = "echo {0} | sudo -S rbd --keyring {1} --id {2} unmap {3}".format(
-            self.password, self.keyring, self.rid, rbd_name)
-        p = subprocess.Popen(command, shell=True,
-                             stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
-        output, err = p.communicate()
-        # output = sh.rbd.unmap(rbd_name, keyring=self.keyring, id=self.rid)
-        if p.returncode == 0:
-            return output.strip()
-        else:
-            raise file_system_exceptions.UnmapFailedException(rbd_name)
+        return self.mappings.unmap(rbd_name)
 
     @log
     def showmapped(self):
-        output = sh.rbd.showmapped()
-        if output.exit_code == 0:
-            lines = output.split('\n')[1:-1]
-            maps = {}
-            for line in lines:
-                parts = line.split()
-                maps[parts[2]] = parts[4]
-            return maps
+        return self.mappings.showmapped()
+
+
+# Runs a list of image operations as one. The images are opened once and
+# shared by the operations, the rbd errors are mapped to the file system
+# exceptions in one place and the completed operations are undone in reverse
+# order if a later one fails. flatten, remove_snapshot and remove are not
+# undone as they cannot be. Every operation returns the batch so that
+# they can be chained, run executes them.
+class Batch:
+    @trace
+    def __init__(self, fs):
+        self.fs = fs
+        self.steps = []
+
+    def snap_image(self, img_id, name):
+        self.steps.append(('snap_image', img_id, name))
+        return self
+
+    def snap_protect(self, img_id, snap_name):
+        self.steps.append(('snap_protect', img_id, snap_name))
+        return self
+
+    def snap_unprotect(self, img_id, snap_name):
+        self.steps.append(('snap_unprotect', img_id, snap_name))
+        return self
+
+    def clone(self, parent_img_name, parent_snap_name, clone_img_name):
+        self.steps.append(('clone', parent_img_name, parent_snap_name,
+                           clone_img_name))
+        return self
+
+    def flatten(self, img_id, on_progress=None):
+        self.steps.append(('flatten', img_id, on_progress))
+        return self
+
+    def remove_snapshot(self, img_id, name):
+        self.steps.append(('remove_snapshot', img_id, name))
+        return self
+
+    def remove(self, img_id):
+        self.steps.append(('remove', img_id))
+        return self
+
+    @log
+    def run(self):
+        handles = {}
+        created = set()
+        done = []
+        failed = False
+        try:
+            for step in self.steps:
+                self.__do(handles, created, step)
+                done.append(step)
+            return True
+        except rbd.Error as e:
+            logger.exception('')
+            failed = isinstance(e, rados_pool.CONNECTION_ERRORS)
+            if not failed:
+                self.__undo(handles, done)
+            raise self.__map_error(step, e)
+        except file_system_exceptions.FileSystemException:
+            self.__undo(handles, done)
+            raise
+        finally:
+            for img_id, (fs, cached) in handles.items():
+                fs.connections.release_image(img_id, cached, failed)
+
+    # The handles are kept along with the RBD the image was routed to so that
+    # they are released to its pool
+    @trace
+    def __image(self, handles, img_id):
+        if img_id not in handles:
+            fs = self.fs.route(img_id)
+            handles[img_id] = (fs, fs.connections.acquire_image(img_id))
+        return handles[img_id][1].image
+
+    # Raises if the snapshot is not there, the ones created by the batch are
+    # known to be there without listing them
+    @trace
+    def __check_snap(self, created, img_id, snap_name, exists):
+        if (img_id, snap_name) in created:
+            found = True
         else:
-            pass
+            found = snap_name in self.fs.list_snapshots(img_id)
+        if found and not exists:
+            raise file_system_exceptions.ImageExistsException(snap_name)
+        if not found and exists:
+            raise file_system_exceptions.ImageNotFoundException(snap_name)
+
+    @trace
+    def __do(self, handles, created, step):
+        operation = step[0]
+        if operation == 'snap_image':
+            img_id, name = step[1:]
+            # Work around for Ceph problem
+            self.__check_snap(created, img_id, name, False)
+            self.__image(handles, img_id).create_snap(name)
+            created.add((img_id, name))
+        elif operation == 'snap_protect':
+            img_id, snap_name = step[1:]
+            self.__check_snap(created, img_id, snap_name, True)
+            self.__image(handles, img_id).protect_snap(snap_name)
+        elif operation == 'snap_unprotect':
+            img_id, snap_name = step[1:]
+            self.__check_snap(created, img_id, snap_name, True)
+            self.__image(handles, img_id).unprotect_snap(snap_name)
+        elif operation == 'clone':
+            parent_img_name, parent_snap_name, clone_img_name = step[1:]
+            fs = self.fs.route(parent_img_name)
+            child = self.fs.place(parent_img_name, clone_img_name)
+            with timer(constants.RBD_CLONE_STAGE):
+                with fs.clone_contexts(child) as contexts:
+                    parent_context, child_context = contexts
+                    fs.rbd.clone(parent_context, parent_img_name,
+                                 parent_snap_name, child_context,
+                                 clone_img_name, features=1)
+            self.fs.record(clone_img_name, child)
+        elif operation == 'flatten':
+            img_id, on_progress = step[1:]
+            with timer(constants.RBD_FLATTEN_STAGE):
+                self.__flatten(self.__image(handles, img_id), img_id,
+                               on_progress)
+        elif operation == 'remove_snapshot':
+            img_id, name = step[1:]
+            self.__image(handles, img_id).remove_snap(name)
+            created.discard((img_id, name))
+        elif operation == 'remove':
+            img_id = step[1]
+            fs = self.fs.route(img_id)
+            if img_id in handles:
+                fs.connections.release_image(img_id, handles.pop(img_id)[1])
+            fs.images.evict(img_id)
+            with timer(constants.RBD_REMOVE_STAGE):
+                with fs.connections.borrow() as context:
+                    fs.rbd.remove(context, img_id)
+            self.fs.forget(img_id)
+        if operation not in ('clone', 'remove'):
+            self.fs.route(step[1]).images.invalidate(step[1])
+
+    # Flattens the image reporting the progress to on_progress, librbd stops
+    # the flatten when the progress callback returns an error
+    @trace
+    def __flatten(self, img, img_id, on_progress):
+        if on_progress is None:
+            img.flatten()
+            return
+        cancelled = []
+
+        def progress(offset, total):
+            if on_progress(offset, total) is False:
+                cancelled.append(True)
+                return -errno.ECANCELED
+            return 0
+
+        try:
+            img.flatten(on_progress=progress)
+        except rbd.Error:
+            if cancelled:
+                raise file_system_exceptions.FlattenCancelledException(
+                    img_id)
+            raise
+
+    # Undoes the completed steps, a step that fails to be undone is logged
+    # and the rest are still undone
+    @trace
+    def __undo(self, handles, done):
+        for step in reversed(done):
+            operation = step[0]
+            try:
+                if operation == 'snap_image':
+                    self.__image(handles, step[1]).remove_snap(step[2])
+                elif operation == 'snap_protect':
+                    self.__image(handles, step[1]).unprotect_snap(step[2])
+                elif operation == 'snap_unprotect':
+                    self.__image(handles, step[1]).protect_snap(step[2])
+                elif operation == 'clone':
+                    fs = self.fs.route(step[3])
+                    fs.images.evict(step[3])
+                    with fs.connections.borrow() as context:
+                        fs.rbd.remove(context, step[3])
+                    self.fs.forget(step[3])
+                else:
+                    logger.info("Cannot undo %s of %s", operation, step[1])
+                    continue
+                self.fs.route(step[1]).images.invalidate(step[1])
+            except rbd.Error:
+                logger.exception('')
+
+    @trace
+    def __map_error(self, step, e):
+        operation = step[0]
+        img_id = step[1]
+        if isinstance(e, rbd.ImageNotFound):
+            # Can be raised if the img or snap is not found
+            if operation == 'clone' and img_id in self.fs.list_images():
+                img_id = step[2]
+            return file_system_exceptions.ImageNotFoundException(img_id)
+        if isinstance(e, rbd.ImageExists):
+            if operation == 'clone':
+                img_id = step[3]
+            return file_system_exceptions.ImageExistsException(img_id)
+        if isinstance(e, rbd.ImageBusy):
+            return file_system_exceptions.ImageBusyException(img_id)
+        if isinstance(e, rbd.ImageHasSnapshots):
+            return file_system_exceptions.ImageHasSnapshotException(img_id)
+        if isinstance(e, rbd.FunctionNotSupported):
+            return file_system_exceptions.FunctionNotSupportedException()
+        if isinstance(e, rbd.ArgumentOutOfRange):
+            return file_system_exceptions.ArgumentsOutOfRangeException()
+        return e
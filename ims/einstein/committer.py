@@ -0,0 +1,131 @@
+import threading
+import time
+
+from ims.common.log import *
+
+logger = create_logger(__name__)
+
+CREATE = 'create'
+DELETE = 'delete'
+
+
+# A create or delete of the target of an image waiting to be committed,
+# error is the exception it failed with once done is set
+class MappingRequest:
+    def __init__(self, operation, ceph_img_name):
+        self.operation = operation
+        self.ceph_img_name = ceph_img_name
+        self.error = None
+        self.done = threading.Event()
+
+
+# Coalesces the targets created and deleted by concurrent provisions and
+# deprovisions so that they share one ietd.conf write and one reload of the
+# iscsi target instead of each restarting it. A request waits for up to
+# window seconds after the first one of a group for others to join it,
+# unless batch_size of them are already waiting, and every caller is woken
+# with its own result once the group is committed. The requests for an
+# image already in the group wait for the next one. It has the methods of
+# IET, the ones other than create_mapping and delete_mapping go straight to
+# iscsi. The ones changing the targets take the same lock as the commits, so
+# that they never rewrite ietd.conf or restart the daemon during one.
+class TargetCommitter:
+    @log
+    def __init__(self, iscsi, window, batch_size):
+        self.iscsi = iscsi
+        self.window = window
+        self.batch_size = batch_size
+        self.pending = []
+        self.condition = threading.Condition()
+        # Held around every change of the targets by iscsi
+        self.lock = threading.Lock()
+        committer = threading.Thread(target=self.__commit_loop,
+                                     name="target-committer")
+        committer.daemon = True
+        committer.start()
+
+    @log
+    def create_mapping(self, ceph_img_name):
+        self.__submit(CREATE, ceph_img_name)
+
+    @log
+    def delete_mapping(self, ceph_img_name):
+        self.__submit(DELETE, ceph_img_name)
+
+    @log
+    def create_mappings(self, ceph_img_names):
+        with self.lock:
+            return self.iscsi.create_mappings(ceph_img_names)
+
+    @log
+    def delete_mappings(self, ceph_img_names):
+        with self.lock:
+            return self.iscsi.delete_mappings(ceph_img_names)
+
+    @log
+    def show_mappings(self):
+        return self.iscsi.show_mappings()
+
+    @log
+    def remake_mappings(self):
+        with self.lock:
+            return self.iscsi.remake_mappings()
+
+    # Queues the request and waits for its group to be committed
+    @trace
+    def __submit(self, operation, ceph_img_name):
+        request = MappingRequest(operation, ceph_img_name)
+        with self.condition:
+            self.pending.append(request)
+            self.condition.notify()
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+
+    # Waits for the window to pass or for the group to be full and takes
+    # the group out of the pending requests
+    @trace
+    def __gather(self):
+        with self.condition:
+            while not self.pending:
+                self.condition.wait()
+            deadline = time.time() + self.window
+            while len(self.pending) < self.batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            group = []
+            names = set()
+            waiting = []
+            for request in self.pending:
+                if len(group) < self.batch_size and \
+                        request.ceph_img_name not in names:
+                    group.append(request)
+                    names.add(request.ceph_img_name)
+                else:
+                    waiting.append(request)
+            self.pending = waiting
+            return group
+
+    @trace
+    def __commit(self, group):
+        create = [request.ceph_img_name for request in group if
+                  request.operation == CREATE]
+        delete = [request.ceph_img_name for request in group if
+                  request.operation == DELETE]
+        try:
+            with self.lock:
+                failed = self.iscsi.update_mappings(create, delete,
+                                                    unmap=True)
+        except Exception as e:
+            logger.exception('')
+            failed = dict((request.ceph_img_name, e) for request in group)
+        for request in group:
+            request.error = failed.get(request.ceph_img_name)
+            request.done.set()
+
+    @trace
+    def __commit_loop(self):
+        while True:
+            self.__commit(self.__gather())
@@ -2,8 +2,12 @@ from ims.exception.dhcp_exceptions import *
 import ims.common.constants as constants
 
 class DNSMasq:
+    # leases_loc is the path of the leases file written by dnsmasq
+    def __init__(self, leases_loc=constants.DNSMASQ_LEASES_LOC):
+        self.leases_loc = leases_loc
+
     def get_ip(self, mac_addr):
-        with open(constants.DNSMASQ_LEASES_LOC, 'r') as file:
+        with open(self.leases_loc, 'r') as file:
             for line in file:
                 parts = line.strip().split(' ')
                 if parts[1] == mac_addr and parts[4] == '01:' + mac_addr:
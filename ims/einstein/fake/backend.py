@@ -0,0 +1,50 @@
+import os
+
+import ims.common.constants as constants
+from ims.common.log import *
+from ims.einstein.committer import TargetCommitter
+from ims.einstein.fake.ceph import FakeRBD
+from ims.einstein.fake.dnsmasq import FakeDNSMasq
+from ims.einstein.fake.iscsi import FakeIET
+from ims.einstein.fake.lio import FakeLIO
+from ims.einstein.hil import HTTPSessions
+
+logger = create_logger(__name__)
+
+
+# A Backend made of the fakes so that BMI can run without ceph, iscsitarget
+# and dnsmasq. ietd.conf and the leases file are kept in the directory root.
+# latencies is shared by all the fakes, see each of them for the operations.
+# driver picks FakeIET or FakeLIO, which keeps its configfs in root too.
+# online is passed on to FakeIET and the targets go through a
+# TargetCommitter with a window of commit_window seconds unless it is 0.
+# HIL is reached through the url in the config, so FakeHILServer is started
+# separately and its url is set there.
+class FakeBackend:
+    @log
+    def __init__(self, root, latencies=None, online=False, commit_window=0,
+                 driver=constants.IET_DRIVER):
+        self.fs = FakeRBD(latencies)
+        if driver == constants.LIO_DRIVER:
+            self.iscsi = FakeLIO(self.fs, os.path.join(root, "configfs"),
+                                 latencies)
+        else:
+            self.iscsi = FakeIET(self.fs, root, latencies, online)
+        if commit_window > 0:
+            self.iscsi = TargetCommitter(
+                self.iscsi, commit_window,
+                constants.DEFAULT_ISCSI_COMMIT_BATCH_SIZE)
+        self.dhcp = FakeDNSMasq(os.path.join(root, "dnsmasq.leases"),
+                                latencies)
+        self.http = HTTPSessions()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    @log
+    def shutdown(self):
+        self.fs.tear_down()
+        self.http.close()
@@ -0,0 +1,388 @@
+import threading
+
+import ims.common.constants as constants
+import ims.exception.file_system_exceptions as file_system_exceptions
+from ims.common.log import *
+from ims.einstein.fake.latency import delay
+
+logger = create_logger(__name__)
+
+FLATTEN_STEPS = 4
+
+
+# An in memory stand in for RBD which keeps the images, their snapshots and
+# the rbd mappings in dicts. It raises the same exceptions as RBD so that BMI
+# behaves the same on top of it. latencies is a dict of method name to the
+# seconds the method should take, like {'clone': 0.05, 'map': 0.1}. pool is
+# only reported as the pool of the parents.
+class FakeRBD:
+    @log
+    def __init__(self, latencies=None, pool="rbd"):
+        self.latencies = latencies if latencies is not None else {}
+        self.pool = pool
+        # name -> {'size', 'used', 'blocks' (offset -> data), 'snaps' (name ->
+        # protected), 'parent', 'parent_fs'}
+        self.images = {}
+        # The other fakes holding clones of the images of this one
+        self.linked = set()
+        self.mappings = {}
+        self.next_device = 0
+        # (name, slot) -> cookie
+        self.slots = {}
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.tear_down()
+
+    @trace
+    def __get(self, img_id):
+        if img_id not in self.images:
+            raise file_system_exceptions.ImageNotFoundException(img_id)
+        return self.images[img_id]
+
+    @log
+    def tear_down(self):
+        pass
+
+    @log
+    def batch(self, fs=None):
+        return FakeBatch(fs if fs is not None else self)
+
+    @trace
+    def route(self, img_id):
+        return self
+
+    @trace
+    def place(self, parent_img_name, clone_img_name):
+        return self
+
+    @trace
+    def record(self, img_id, backend):
+        pass
+
+    @trace
+    def forget(self, img_id):
+        pass
+
+    # The load is the bytes used by the images
+    @log
+    def get_load(self):
+        with self.lock:
+            return sum(image['used'] for image in self.images.values())
+
+    @log
+    def list_images(self):
+        delay(self.latencies, 'list_images')
+        with self.lock:
+            return self.images.keys()
+
+    @log
+    def create_image(self, img_id, img_size):
+        delay(self.latencies, 'create_image')
+        with self.lock:
+            if img_id in self.images:
+                raise file_system_exceptions.ImageExistsException(img_id)
+            self.images[img_id] = {'size': img_size, 'used': 0, 'blocks': {},
+                                   'snaps': {}, 'parent': None,
+                                   'parent_fs': None}
+            return True
+
+    # child is the fake the clone is created in, by default this one
+    @log
+    def clone(self, parent_img_name, parent_snap_name, clone_img_name,
+              child=None):
+        delay(self.latencies, 'clone')
+        child = child if child is not None else self
+        with self.lock:
+            parent = self.__get(parent_img_name)
+            if not parent['snaps'].get(parent_snap_name, False):
+                # librbd only clones protected snapshots
+                raise file_system_exceptions.ImageNotFoundException(
+                    parent_snap_name)
+            size = parent['size']
+            blocks = dict(parent['blocks'])
+            if child is not self:
+                self.linked.add(child)
+        with child.lock:
+            if clone_img_name in child.images:
+                raise file_system_exceptions.ImageExistsException(
+                    clone_img_name)
+            child.images[clone_img_name] = {
+                'size': size, 'used': 0, 'blocks': blocks, 'snaps': {},
+                'parent': (parent_img_name, parent_snap_name),
+                'parent_fs': self}
+            return True
+
+    @log
+    def remove(self, img_id):
+        delay(self.latencies, 'remove')
+        with self.lock:
+            image = self.__get(img_id)
+            if image['snaps']:
+                raise file_system_exceptions.ImageHasSnapshotException(img_id)
+            if img_id in self.mappings:
+                raise file_system_exceptions.ImageBusyException(img_id)
+            del self.images[img_id]
+            return True
+
+    @log
+    def write(self, img_id, data, offset):
+        delay(self.latencies, 'write')
+        with self.lock:
+            image = self.__get(img_id)
+            image['used'] = min(image['size'], image['used'] + len(data))
+
+    @log
+    def write_blocks(self, img_id, data, offset):
+        delay(self.latencies, 'write')
+        written = 0
+        with self.lock:
+            image = self.__get(img_id)
+            if offset + len(data) > image['size']:
+                raise file_system_exceptions.ArgumentsOutOfRangeException()
+            # The blocks which are all zeros are skipped like RBD does
+            for start in range(0, len(data), constants.UPLOAD_BLOCK_SIZE):
+                block = data[start:start + constants.UPLOAD_BLOCK_SIZE]
+                if block.lstrip('\0'):
+                    image['blocks'][offset + start] = block
+                    written += len(block)
+            image['used'] = min(image['size'], image['used'] + written)
+        return written
+
+    # The extents are the blocks written with write_blocks
+    @log
+    def list_extents(self, img_id):
+        delay(self.latencies, 'list_extents')
+        extents = []
+        with self.lock:
+            blocks = self.__get(img_id)['blocks']
+            for start in sorted(blocks):
+                if extents and extents[-1][0] + extents[-1][1] == start:
+                    extents[-1][1] += len(blocks[start])
+                else:
+                    extents.append([start, len(blocks[start])])
+        return extents
+
+    # Expects offset to be at the start of a block written with write_blocks
+    # or in the zeros between them
+    @log
+    def read_blocks(self, img_id, offset, length):
+        delay(self.latencies, 'read')
+        with self.lock:
+            blocks = self.__get(img_id)['blocks']
+            data = []
+            position = offset
+            while position < offset + length:
+                block = blocks.get(position,
+                                   '\0' * constants.UPLOAD_BLOCK_SIZE)
+                block = block[:offset + length - position]
+                data.append(block)
+                position += len(block)
+        return "".join(data)
+
+    @log
+    def snap_image(self, img_id, name):
+        delay(self.latencies, 'snap_image')
+        with self.lock:
+            image = self.__get(img_id)
+            if name in image['snaps']:
+                raise file_system_exceptions.ImageExistsException(name)
+            image['snaps'][name] = False
+            return True
+
+    @log
+    def snap_protect(self, img_id, snap_name):
+        delay(self.latencies, 'snap_protect')
+        with self.lock:
+            image = self.__get(img_id)
+            if snap_name not in image['snaps']:
+                raise file_system_exceptions.ImageNotFoundException(snap_name)
+            image['snaps'][snap_name] = True
+            return True
+
+    @log
+    def snap_unprotect(self, img_id, snap_name):
+        delay(self.latencies, 'snap_unprotect')
+        with self.lock:
+            image = self.__get(img_id)
+            if snap_name not in image['snaps']:
+                raise file_system_exceptions.ImageNotFoundException(snap_name)
+            for fs in [self] + list(self.linked):
+                for child in fs.images.values():
+                    if child['parent_fs'] is self and \
+                            child['parent'] == (img_id, snap_name):
+                        raise file_system_exceptions.ImageBusyException(
+                            img_id)
+            image['snaps'][snap_name] = False
+            return True
+
+    @log
+    def is_snap_protected(self, img_id, snap_name):
+        with self.lock:
+            image = self.__get(img_id)
+            if snap_name not in image['snaps']:
+                raise file_system_exceptions.ImageNotFoundException(snap_name)
+            return image['snaps'][snap_name]
+
+    # The flatten latency is spread over FLATTEN_STEPS progress reports
+    @log
+    def flatten(self, img_id, on_progress=None):
+        with self.lock:
+            size = self.__get(img_id)['size']
+        for step in range(1, FLATTEN_STEPS + 1):
+            delay({'flatten': self.latencies.get('flatten', 0) / float(
+                FLATTEN_STEPS)}, 'flatten')
+            if on_progress is not None and on_progress(
+                    size * step / FLATTEN_STEPS, size) is False:
+                raise file_system_exceptions.FlattenCancelledException(img_id)
+        with self.lock:
+            image = self.__get(img_id)
+            if image['parent'] is not None:
+                # The data of the parent is copied into the clone
+                image['used'] = max(image['used'], image['parent_fs'].images[
+                    image['parent'][0]]['used'])
+            image['parent'] = None
+            image['parent_fs'] = None
+            return True
+
+    @log
+    def acquire_slot(self, name, slots, cookie, duration):
+        with self.lock:
+            for slot in range(slots):
+                if (name, slot) not in self.slots:
+                    self.slots[(name, slot)] = cookie
+                    return slot
+        return None
+
+    @log
+    def renew_slot(self, name, slot, cookie, duration):
+        pass
+
+    @log
+    def release_slot(self, name, slot, cookie):
+        with self.lock:
+            if self.slots.get((name, slot)) == cookie:
+                del self.slots[(name, slot)]
+
+    @log
+    def get_size(self, img_id):
+        with self.lock:
+            return self.__get(img_id)['size']
+
+    @log
+    def usage(self, img_id):
+        delay(self.latencies, 'usage')
+        with self.lock:
+            image = self.__get(img_id)
+            return image['size'], image['used']
+
+    @log
+    def list_snapshots(self, img_id):
+        delay(self.latencies, 'list_snapshots')
+        with self.lock:
+            return self.__get(img_id)['snaps'].keys()
+
+    @log
+    def remove_snapshot(self, img_id, name):
+        delay(self.latencies, 'remove_snapshot')
+        with self.lock:
+            image = self.__get(img_id)
+            if image['snaps'].get(name, False):
+                raise file_system_exceptions.ImageBusyException(img_id)
+            image['snaps'].pop(name, None)
+            return True
+
+    @log
+    def get_parent_info(self, img_id):
+        with self.lock:
+            image = self.__get(img_id)
+            if image['parent'] is None:
+                raise file_system_exceptions.ImageNotFoundException(img_id)
+            return (image['parent_fs'].pool,) + image['parent']
+
+    @log
+    def map(self, ceph_img_name):
+        delay(self.latencies, 'map')
+        with self.lock:
+            if ceph_img_name not in self.images:
+                raise file_system_exceptions.MapFailedException(ceph_img_name)
+            rbd_name = "/dev/rbd" + str(self.next_device)
+            self.next_device += 1
+            self.mappings[ceph_img_name] = rbd_name
+            return rbd_name
+
+    @log
+    def unmap(self, rbd_name):
+        delay(self.latencies, 'unmap')
+        with self.lock:
+            for ceph_img_name, mapped in self.mappings.items():
+                if mapped == rbd_name:
+                    del self.mappings[ceph_img_name]
+                    return ""
+            raise file_system_exceptions.UnmapFailedException(rbd_name)
+
+    @log
+    def showmapped(self):
+        delay(self.latencies, 'showmapped')
+        with self.lock:
+            return dict(self.mappings)
+
+
+# The Batch of FakeRBD, it runs the operations through the fake one at a time
+# and undoes the completed ones in reverse order if one of them fails
+class FakeBatch:
+    UNDO = {'snap_image': lambda fs, img_id, name: fs.remove_snapshot(
+        img_id, name),
+            'snap_protect': lambda fs, img_id, name: fs.snap_unprotect(
+                img_id, name),
+            'snap_unprotect': lambda fs, img_id, name: fs.snap_protect(
+                img_id, name),
+            'clone': lambda fs, parent, snap, clone: fs.remove(clone)}
+
+    @trace
+    def __init__(self, fs):
+        self.fs = fs
+        self.steps = []
+
+    def __add(self, operation, *args):
+        self.steps.append((operation, args))
+        return self
+
+    def snap_image(self, img_id, name):
+        return self.__add('snap_image', img_id, name)
+
+    def snap_protect(self, img_id, snap_name):
+        return self.__add('snap_protect', img_id, snap_name)
+
+    def snap_unprotect(self, img_id, snap_name):
+        return self.__add('snap_unprotect', img_id, snap_name)
+
+    def clone(self, parent_img_name, parent_snap_name, clone_img_name):
+        return self.__add('clone', parent_img_name, parent_snap_name,
+                          clone_img_name)
+
+    def flatten(self, img_id, on_progress=None):
+        return self.__add('flatten', img_id, on_progress)
+
+    def remove_snapshot(self, img_id, name):
+        return self.__add('remove_snapshot', img_id, name)
+
+    def remove(self, img_id):
+        return self.__add('remove', img_id)
+
+    @log
+    def run(self):
+        done = []
+        try:
+            for operation, args in self.steps:
+                getattr(self.fs, operation)(*args)
+                done.append((operation, args))
+            return True
+        except file_system_exceptions.FileSystemException:
+            for operation, args in reversed(done):
+                if operation in FakeBatch.UNDO:
+                    FakeBatch.UNDO[operation](self.fs, *args)
+            raise
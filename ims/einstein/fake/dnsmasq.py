@@ -0,0 +1,30 @@
+import time
+
+from ims.common.log import *
+from ims.einstein.dnsmasq import DNSMasq
+from ims.einstein.fake.latency import delay
+
+logger = create_logger(__name__)
+
+
+# Writes a leases file in the format of dnsmasq with a lease for every mac
+# address, the addresses are given out from 10.0.0.1 upwards
+@log
+def write_leases(leases_loc, mac_addrs):
+    expiry = int(time.time()) + 3600
+    with open(leases_loc, 'w') as leases:
+        for i, mac_addr in enumerate(mac_addrs):
+            ip = "10.0.%d.%d" % ((i + 1) / 256, (i + 1) % 256)
+            leases.write("%d %s %s node%d 01:%s\n" % (expiry, mac_addr, ip, i,
+                                                      mac_addr))
+
+
+# A DNSMasq which reads the leases from leases_loc after the get_ip latency
+class FakeDNSMasq(DNSMasq):
+    def __init__(self, leases_loc, latencies=None):
+        DNSMasq.__init__(self, leases_loc)
+        self.latencies = latencies if latencies is not None else {}
+
+    def get_ip(self, mac_addr):
+        delay(self.latencies, 'get_ip')
+        return DNSMasq.get_ip(self, mac_addr)
@@ -0,0 +1,131 @@
+import BaseHTTPServer
+import SocketServer
+import hashlib
+import json
+import threading
+
+import ims.common.constants as constants
+from ims.common.log import *
+from ims.einstein.fake.latency import delay
+
+logger = create_logger(__name__)
+
+
+class ThreadingHTTPServer(SocketServer.ThreadingMixIn,
+                          BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+# A stub of the HIL rest api which serves the calls made by the HIL class.
+# Every node exists and has the nics given, the networks connected to them
+# are kept in memory. latencies can have show_node, connect_network,
+# detach_network and list_nodes. The server listens on a free port of host
+# and its url is in url.
+class FakeHILServer:
+    @log
+    def __init__(self, nics, latencies=None, host='127.0.0.1'):
+        self.nics = nics
+        self.latencies = latencies if latencies is not None else {}
+        # node -> nic -> channel -> network
+        self.networks = {}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, 0), self.__handler())
+        self.url = "http://%s:%d/" % self.server.server_address
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       name="fake-hil")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    @log
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    # Returns the mac address of the nic of the node, it is derived from the
+    # names so that it is the same across runs
+    def mac_addr(self, node, nic):
+        digest = hashlib.md5(node + "/" + nic).hexdigest()
+        return "52:54:00:" + ":".join(digest[i:i + 2] for i in (0, 2, 4))
+
+    def __show_node(self, node):
+        delay(self.latencies, 'show_node')
+        with self.lock:
+            networks = self.networks.get(node, {})
+            return 200, {"name": node, "project": None,
+                         "nics": [{"label": nic,
+                                   "macaddr": self.mac_addr(node, nic),
+                                   "networks": dict(networks.get(nic, {}))}
+                                  for nic in self.nics]}
+
+    def __connect_network(self, node, nic, body):
+        delay(self.latencies, 'connect_network')
+        if nic not in self.nics:
+            return 404, {constants.MESSAGE_KEY: "nic " + nic + " not found"}
+        channel = body.get(constants.CHANNEL_PARAMETER,
+                           constants.HAAS_BMI_CHANNEL)
+        with self.lock:
+            channels = self.networks.setdefault(node, {}).setdefault(nic, {})
+            if body[constants.NETWORK_PARAMETER] in channels.values():
+                return 409, {constants.MESSAGE_KEY: "already connected"}
+            channels[channel] = body[constants.NETWORK_PARAMETER]
+        return 202, None
+
+    def __detach_network(self, node, nic, body):
+        delay(self.latencies, 'detach_network')
+        with self.lock:
+            channels = self.networks.get(node, {}).get(nic, {})
+            for channel, network in channels.items():
+                if network == body[constants.NETWORK_PARAMETER]:
+                    del channels[channel]
+                    return 202, None
+        return 409, {constants.MESSAGE_KEY: "not connected"}
+
+    # Returns the status code and body of the response to the request
+    def route(self, method, path, body):
+        parts = [part for part in path.split('/') if part]
+        if method == 'GET' and len(parts) == 2 and parts[0] == 'node':
+            return self.__show_node(parts[1])
+        if method == 'GET' and len(parts) == 3 and parts[0] == 'project':
+            delay(self.latencies, 'list_nodes')
+            return 200, []
+        if method == 'GET' and parts == ['free_nodes']:
+            delay(self.latencies, 'list_nodes')
+            return 200, []
+        if method == 'POST' and len(parts) == 5 and parts[0] == 'node':
+            if parts[4] == 'connect_network':
+                return self.__connect_network(parts[1], parts[3], body)
+            if parts[4] == 'detach_network':
+                return self.__detach_network(parts[1], parts[3], body)
+        return 404, {constants.MESSAGE_KEY: path + " not found"}
+
+    def __handler(self):
+        fake = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def __respond(self, method):
+                length = int(self.headers.getheader('content-length') or 0)
+                body = self.rfile.read(length) if length else ""
+                status, obj = fake.route(method, self.path,
+                                         json.loads(body) if body else {})
+                self.send_response(status)
+                data = json.dumps(obj) if obj is not None else ""
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self.__respond('GET')
+
+            def do_POST(self):
+                self.__respond('POST')
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
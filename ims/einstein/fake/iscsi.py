@@ -0,0 +1,99 @@
+import errno
+import threading
+
+import os
+
+import ims.common.constants as constants
+from ims.common.log import *
+from ims.einstein.fake.latency import delay
+from ims.einstein.iscsi import IET, IETConfig
+
+logger = create_logger(__name__)
+
+
+# Stands in for the iscsitarget service, its targets are kept in exported
+# which a restart loads from the ietd.conf at config_loc and a stop clears,
+# like the volumes of the daemon. The luns on the devices in failing cannot
+# be created, so their targets come up without them. latencies can have
+# restart, stop and ietadm.
+class FakeIETService:
+    @log
+    def __init__(self, config_loc, latencies=None):
+        self.config = IETConfig(config_loc, None)
+        self.latencies = latencies if latencies is not None else {}
+        self.running = True
+        self.restarts = 0
+        self.failing = set()
+        # name -> (tid, lun -> rbd device)
+        self.exported = {}
+        self.lock = threading.Lock()
+
+    @log
+    def restart(self):
+        delay(self.latencies, 'restart')
+        with self.lock:
+            self.exported = {}
+            for tid, (ceph_img_name, rbd_name) in enumerate(
+                    sorted(self.config.mappings().items()), 1):
+                luns = {} if rbd_name in self.failing else {0: rbd_name}
+                self.exported[constants.IET_TARGET_PREFIX + ceph_img_name] = \
+                    (tid, luns)
+            self.running = True
+            self.restarts += 1
+        return True
+
+    @log
+    def stop(self):
+        delay(self.latencies, 'stop')
+        with self.lock:
+            self.exported = {}
+            self.running = False
+        return True
+
+    @log
+    def volumes(self):
+        with self.lock:
+            if not self.running:
+                raise IOError(errno.ENOENT, os.strerror(errno.ENOENT))
+            return dict((name, (tid, dict(luns))) for name, (tid, luns) in
+                        self.exported.items())
+
+    @log
+    def targets(self):
+        return dict((name, tid) for name, (tid, luns) in
+                    self.volumes().items())
+
+    @log
+    def add_target(self, tid, name, rbd_name):
+        delay(self.latencies, 'ietadm')
+        with self.lock:
+            if name in self.exported or tid in [
+                    volume[0] for volume in self.exported.values()]:
+                return False
+            if rbd_name in self.failing:
+                return False
+            self.exported[name] = (tid, {0: rbd_name})
+            return True
+
+    @log
+    def delete_target(self, tid):
+        delay(self.latencies, 'ietadm')
+        with self.lock:
+            for name, volume in self.exported.items():
+                if volume[0] == tid:
+                    del self.exported[name]
+                    return True
+            return False
+
+
+# An IET which keeps its ietd.conf in the directory root and runs on top of
+# the fake service instead of iscsitarget
+class FakeIET(IET):
+    @log
+    def __init__(self, fs, root, latencies=None, online=False):
+        config_loc = os.path.join(root, "ietd.conf")
+        open(config_loc, 'a').close()
+        IET.__init__(self, fs, "", config_loc=config_loc,
+                     temp_loc=os.path.join(root, "ietd.temp"),
+                     service=FakeIETService(config_loc, latencies),
+                     online=online)
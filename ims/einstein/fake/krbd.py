@@ -0,0 +1,66 @@
+import threading
+
+import os
+
+from ims.common.log import *
+from ims.einstein.fake.latency import delay
+from ims.einstein.krbd import SysfsBus
+
+logger = create_logger(__name__)
+
+
+# A sysfs root in the directory root whose rbd bus acts like the kernel one,
+# a write of a map spec to add_single_major creates the device under
+# devices and a write of its id to remove_single_major removes it. The specs
+# written are kept in specs. Images in missing fail to map like a missing
+# image does. latencies can have map and unmap.
+class FakeSysfsBus(SysfsBus):
+    @log
+    def __init__(self, root, latencies=None):
+        SysfsBus.__init__(self, root)
+        self.latencies = latencies if latencies is not None else {}
+        self.missing = set()
+        self.specs = []
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(self.path, "devices"))
+        for control in ("add_single_major", "remove_single_major"):
+            open(os.path.join(self.path, control), 'w').close()
+
+    @log
+    def write(self, control, data):
+        if control == "add_single_major":
+            delay(self.latencies, 'map')
+            self.__add(data)
+        elif control == "remove_single_major":
+            delay(self.latencies, 'unmap')
+            self.__remove(data)
+        else:
+            raise IOError(2, "No such file or directory", control)
+
+    @trace
+    def __add(self, spec):
+        monitors, options, pool, name = spec.split()
+        if name in self.missing:
+            raise IOError(2, "No such file or directory", name)
+        with self.lock:
+            self.specs.append(spec)
+            devices = os.path.join(self.path, "devices")
+            dev_id = 0
+            while os.path.exists(os.path.join(devices, str(dev_id))):
+                dev_id += 1
+            path = os.path.join(devices, str(dev_id))
+            os.mkdir(path)
+            for attr, value in (("pool", pool), ("name", name),
+                                ("current_snap", "-")):
+                with open(os.path.join(path, attr), 'w') as fi:
+                    fi.write(value + "\n")
+
+    @trace
+    def __remove(self, dev_id):
+        with self.lock:
+            path = os.path.join(self.path, "devices", dev_id.strip())
+            if not os.path.isdir(path):
+                raise IOError(2, "No such file or directory", dev_id)
+            for attr in os.listdir(path):
+                os.remove(os.path.join(path, attr))
+            os.rmdir(path)
@@ -0,0 +1,10 @@
+import time
+
+
+# Sleeps for the latency configured for operation in latencies, which is a
+# dict of operation name to seconds. Operations that are not in the dict
+# return right away.
+def delay(latencies, operation):
+    seconds = latencies.get(operation, 0)
+    if seconds > 0:
+        time.sleep(seconds)
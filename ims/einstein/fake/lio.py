@@ -0,0 +1,76 @@
+import errno
+
+import os
+
+from ims.common.log import *
+from ims.einstein.fake.latency import delay
+from ims.einstein.lio import ConfigFS, LIO
+
+logger = create_logger(__name__)
+
+# The entries the kernel creates in the directories made under target,
+# keyed by the first part and the depth of their path, directories end with
+# a slash
+KERNEL_ENTRIES = {
+    ("core", 2): ["hba_info", "hba_mode"],
+    ("core", 3): ["attrib/", "control", "enable", "udev_path"],
+    ("iscsi", 3): ["acls/", "attrib/", "auth/", "lun/", "np/", "param/",
+                   "enable", "attrib/authentication",
+                   "attrib/generate_node_acls", "attrib/cache_dynamic_acls",
+                   "attrib/demo_mode_write_protect"],
+}
+
+
+# A configfs root in the directory root whose target tree acts like the one
+# of LIO, making a directory creates the entries the kernel would create in
+# it and removing it removes them, so a directory still holding ones made by
+# einstein cannot be removed. latencies can have configfs which every change
+# takes.
+class FakeConfigFS(ConfigFS):
+    @log
+    def __init__(self, root, latencies=None):
+        ConfigFS.__init__(self, root)
+        self.latencies = latencies if latencies is not None else {}
+        os.makedirs(os.path.join(self.path, "core"))
+
+    @trace
+    def __entries(self, path):
+        parts = path.split("/")
+        return KERNEL_ENTRIES.get((parts[0], len(parts)), [])
+
+    @trace
+    def mkdir(self, path):
+        delay(self.latencies, 'configfs')
+        ConfigFS.mkdir(self, path)
+        for entry in self.__entries(path):
+            entry_path = os.path.join(self.path, path, entry)
+            if entry.endswith("/"):
+                os.mkdir(entry_path)
+            else:
+                open(entry_path, 'w').close()
+
+    @trace
+    def rmdir(self, path):
+        delay(self.latencies, 'configfs')
+        for entry in self.__entries(path):
+            entry_path = os.path.join(self.path, path, entry)
+            if entry.endswith("/") and set(os.listdir(entry_path)) - set(
+                    other[len(entry):] for other in self.__entries(path)
+                    if other.startswith(entry)):
+                raise OSError(errno.ENOTEMPTY, os.strerror(errno.ENOTEMPTY),
+                              path)
+        for entry in reversed(self.__entries(path)):
+            entry_path = os.path.join(self.path, path, entry)
+            if entry.endswith("/"):
+                os.rmdir(entry_path)
+            else:
+                os.remove(entry_path)
+        ConfigFS.rmdir(self, path)
+
+
+# A LIO which keeps its configfs in the directory root
+class FakeLIO(LIO):
+    @log
+    def __init__(self, fs, root, latencies=None):
+        LIO.__init__(self, fs, "127.0.0.1:3260",
+                     FakeConfigFS(root, latencies))
@@ -0,0 +1,331 @@
+import Queue
+import threading
+import time
+import uuid
+
+import ims.common.constants as constants
+from ims.common.log import *
+from ims.database import *
+from ims.exception import *
+
+logger = create_logger(__name__)
+
+__scheduler = None
+
+
+# Limits the average rate of the flattens. The flattens take what librbd
+# has copied since the last progress report from the bucket and wait as long
+# as the bucket says before letting librbd go on. The bucket can go into debt
+# so a report never waits for more than what it has copied. A rate of 0
+# disables the limit.
+class TokenBucket:
+    # rate is in bytes per second
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self.available = self.rate
+        self.last = time.time()
+        self.lock = threading.Lock()
+
+    # Returns the number of seconds the caller has to wait before using amount
+    # bytes, the amount is taken from the bucket right away
+    def reserve(self, amount):
+        if self.rate == 0:
+            return 0
+        with self.lock:
+            now = time.time()
+            self.available = min(self.rate, self.available + (
+                now - self.last) * self.rate)
+            self.last = now
+            wait = max(0.0, -self.available / self.rate)
+            self.available -= amount
+            return wait
+
+    def acquire(self, amount):
+        wait = self.reserve(amount)
+        if wait > 0:
+            time.sleep(wait)
+
+
+# Makes a clone usable as an image by flattening it, creating and protecting
+# its snapshot and removing the snapshot of its parent if asked to.
+# on_progress is passed on to RBD.flatten. The steps that are already done
+# are skipped so that it can be run again after being interrupted or failing.
+@log
+def complete_clone(fs, ceph_name, parent_ceph_name, parent_snap_name,
+                   remove_parent_snap, on_progress=None):
+    batch = fs.batch()
+    try:
+        fs.get_parent_info(ceph_name)
+        batch.flatten(ceph_name, on_progress)
+    except file_system_exceptions.ImageNotFoundException:
+        logger.info("%s was already flattened", ceph_name)
+    snap_name = constants.DEFAULT_SNAPSHOT_NAME
+    if snap_name not in fs.list_snapshots(ceph_name):
+        batch.snap_image(ceph_name, snap_name).snap_protect(ceph_name,
+                                                            snap_name)
+    elif not fs.is_snap_protected(ceph_name, snap_name):
+        batch.snap_protect(ceph_name, snap_name)
+    if remove_parent_snap and __has_snapshot(fs, parent_ceph_name,
+                                             parent_snap_name):
+        if fs.is_snap_protected(parent_ceph_name, parent_snap_name):
+            batch.snap_unprotect(parent_ceph_name, parent_snap_name)
+        batch.remove_snapshot(parent_ceph_name, parent_snap_name)
+    batch.run()
+
+
+# The parent can be gone along with its snapshot when complete_clone is run
+# again
+@trace
+def __has_snapshot(fs, img_id, snap_name):
+    try:
+        return snap_name in fs.list_snapshots(img_id)
+    except file_system_exceptions.ImageNotFoundException:
+        return False
+
+
+# Removes a clone whose flatten was cancelled along with the snapshot of its
+# parent if the snapshot was taken for the clone. What is already gone is
+# skipped so that it can be run again after a failure.
+@log
+def discard_clone(fs, ceph_name, parent_ceph_name, parent_snap_name,
+                  remove_parent_snap):
+    try:
+        fs.remove(ceph_name)
+    except file_system_exceptions.ImageNotFoundException:
+        logger.info("%s was already removed", ceph_name)
+    if remove_parent_snap:
+        try:
+            fs.batch().snap_unprotect(parent_ceph_name,
+                                      parent_snap_name).remove_snapshot(
+                parent_ceph_name, parent_snap_name).run()
+        except file_system_exceptions.ImageNotFoundException:
+            logger.info("%s of %s was already removed", parent_snap_name,
+                        parent_ceph_name)
+
+
+# Flattens the clones created by snapshot and import in the background so
+# that the operations can return as soon as the clone exists. The number of
+# workers caps the flattens running at a time in einstein, the cluster slots
+# cap them across all the einsteins using the ceph pool and the bucket caps
+# their bandwidth so that they do not starve the io of the provisioned nodes.
+# Queued flattens are persisted in the flatten table and are picked up
+# again when einstein restarts. The progress of the running flattens is kept
+# in memory and a flatten can be cancelled, which removes its image.
+class FlattenScheduler:
+    # bandwidth is in MB/s, 0 does not limit the flattens
+    # cluster_slots is the number of flattens that can run at a time across
+    # the cluster, 0 does not limit them
+    @log
+    def __init__(self, fs, workers, bandwidth, cluster_slots):
+        self.fs = fs
+        self.bucket = TokenBucket(bandwidth * 1024 * 1024)
+        self.cluster_slots = cluster_slots
+        # Identifies the slots taken by this einstein
+        self.cookie = uuid.uuid4().hex
+        self.queue = Queue.Queue()
+        # image id -> percent of the image flattened
+        self.progress = {}
+        # image id -> what librbd had copied at the last progress report
+        self.copied = {}
+        # image id -> cluster slot held by the flatten of the image
+        self.slots = {}
+        self.cancelled = set()
+        self.lock = threading.Lock()
+        self.workers = []
+        self.__requeue_interrupted()
+        for i in range(workers):
+            worker = threading.Thread(target=self.__work,
+                                      name="flatten-worker-" + str(i))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+        if cluster_slots > 0:
+            renewer = threading.Thread(target=self.__renew_slots,
+                                       name="flatten-slot-renewer")
+            renewer.daemon = True
+            renewer.start()
+
+    @trace
+    def __requeue_interrupted(self):
+        with Database() as db:
+            for image_id in db.flatten.fetch_image_ids_with_status(
+                    [constants.FLATTEN_CANCELLING_STATUS]):
+                self.cancelled.add(image_id)
+                self.queue.put(image_id)
+            # The failed flattens are retried along with the interrupted
+            # ones, complete_clone skips what they had already done
+            for image_id in db.flatten.fetch_image_ids_with_status(
+                    [constants.FLATTEN_QUEUED_STATUS,
+                     constants.FLATTEN_RUNNING_STATUS,
+                     constants.FLATTEN_FAILED_STATUS]):
+                self.queue.put(image_id)
+
+    # Queues the flatten of the image, its row has to be inserted already
+    @log
+    def submit(self, image_id):
+        self.queue.put(image_id)
+
+    # Cancels the flatten of the image, the image is removed by a worker
+    # once the flatten has stopped. A failed flatten is queued again to be
+    # removed.
+    @log
+    def cancel(self, db, image_id):
+        flatten = db.flatten.fetch_with_image_id(image_id)
+        if flatten is None:
+            return
+        db.flatten.update_status(image_id,
+                                 constants.FLATTEN_CANCELLING_STATUS)
+        with self.lock:
+            self.cancelled.add(image_id)
+        if flatten["status"] == constants.FLATTEN_FAILED_STATUS:
+            self.queue.put(image_id)
+
+    # Returns the percent of the image that has been flattened, None if
+    # the flatten is not running
+    @log
+    def get_progress(self, image_id):
+        with self.lock:
+            return self.progress.get(image_id)
+
+    @trace
+    def __is_cancelled(self, image_id):
+        with self.lock:
+            return image_id in self.cancelled
+
+    # Records the progress of the flatten, holds it back to the bandwidth for
+    # the bytes copied since the last report and returns False to stop it if
+    # it was cancelled. done and total are in the units of librbd, size is
+    # the size of the image in bytes.
+    @trace
+    def __report(self, image_id, size, done, total):
+        with self.lock:
+            self.progress[image_id] = 100.0 * done / total if total else 100.0
+            copied = done - self.copied.get(image_id, 0)
+            self.copied[image_id] = done
+        if total:
+            self.bucket.acquire(copied * size / float(total))
+        return not self.__is_cancelled(image_id)
+
+    @trace
+    def __work(self):
+        while True:
+            image_id = self.queue.get()
+            try:
+                self.__run(image_id)
+            except Exception:
+                logger.exception('')
+            finally:
+                self.queue.task_done()
+
+    # Waits for a cluster slot and returns it, None is returned if the
+    # slots are not limited or the flatten was cancelled while waiting
+    @trace
+    def __acquire_slot(self, image_id):
+        if self.cluster_slots == 0:
+            return None
+        while not self.__is_cancelled(image_id):
+            slot = self.fs.acquire_slot(constants.FLATTEN_SLOT_NAME,
+                                        self.cluster_slots, self.cookie,
+                                        constants.FLATTEN_SLOT_DURATION)
+            if slot is not None:
+                with self.lock:
+                    self.slots[image_id] = slot
+                return slot
+            time.sleep(constants.FLATTEN_SLOT_RETRY_INTERVAL)
+        return None
+
+    @trace
+    def __release_slot(self, image_id):
+        with self.lock:
+            slot = self.slots.pop(image_id, None)
+        if slot is not None:
+            self.fs.release_slot(constants.FLATTEN_SLOT_NAME, slot,
+                                 self.cookie)
+
+    # Renews the locks of the slots held so that they do not expire while
+    # the flattens are running
+    @trace
+    def __renew_slots(self):
+        while True:
+            time.sleep(constants.FLATTEN_SLOT_DURATION / 3.0)
+            with self.lock:
+                slots = self.slots.values()
+            for slot in slots:
+                try:
+                    self.fs.renew_slot(constants.FLATTEN_SLOT_NAME, slot,
+                                       self.cookie,
+                                       constants.FLATTEN_SLOT_DURATION)
+                except Exception:
+                    logger.exception('')
+
+    @log
+    def __run(self, image_id):
+        with Database() as db:
+            flatten = db.flatten.fetch_with_image_id(image_id)
+            if flatten is None:
+                return
+            try:
+                # The debt left by the other flattens is paid back before
+                # taking a cluster slot so that the slot is not held idle
+                self.bucket.acquire(0)
+                self.__acquire_slot(image_id)
+                if not self.__is_cancelled(image_id):
+                    db.flatten.update_status(image_id,
+                                             constants.FLATTEN_RUNNING_STATUS)
+                    size = self.fs.get_size(flatten["ceph_name"])
+                    complete_clone(self.fs, flatten["ceph_name"],
+                                   flatten["parent_ceph_name"],
+                                   flatten["parent_snap_name"],
+                                   flatten["remove_parent_snap"],
+                                   lambda done, total: self.__report(
+                                       image_id, size, done, total))
+                    db.flatten.delete_with_image_id(image_id)
+                    return
+            except file_system_exceptions.FlattenCancelledException:
+                logger.info("Flatten of %s was cancelled", image_id)
+            # The errors of librados and librbd that are not mapped are failed
+            # too so that the flatten is not left running
+            except Exception:
+                logger.exception('')
+                db.flatten.update_status(image_id,
+                                         constants.FLATTEN_FAILED_STATUS)
+                return
+            finally:
+                self.__release_slot(image_id)
+                with self.lock:
+                    self.progress.pop(image_id, None)
+                    self.copied.pop(image_id, None)
+                    self.cancelled.discard(image_id)
+            self.__discard(db, image_id, flatten)
+
+    # Removes the image of the cancelled flatten. If it fails the flatten is
+    # left cancelling rather than failed, so that it is removed again instead
+    # of being completed when einstein restarts.
+    @log
+    def __discard(self, db, image_id, flatten):
+        try:
+            discard_clone(self.fs, flatten["ceph_name"],
+                          flatten["parent_ceph_name"],
+                          flatten["parent_snap_name"],
+                          flatten["remove_parent_snap"])
+        except BMIException:
+            logger.exception('')
+            return
+        img_name = db.image.fetch_name_with_id(image_id)
+        project = db.image.fetch_project_with_id(image_id)
+        db.flatten.delete_with_image_id(image_id)
+        db.image.delete_with_name_from_project(img_name, project)
+
+
+# Starts the flatten scheduler of the process
+def start(fs, workers, bandwidth, cluster_slots):
+    global __scheduler
+    __scheduler = FlattenScheduler(fs, workers, bandwidth, cluster_slots)
+    return __scheduler
+
+
+# Returns the flatten scheduler of the process, None if it was not started
+# in which case the flattens are run synchronously
+def get():
+    global __scheduler
+    return __scheduler
@@ -1,4 +1,6 @@
 import json
+import threading
+import time
 import urlparse
 
 import requests
@@ -6,10 +8,36 @@ import requests
 import ims.common.constants as constants
 import ims.exception.haas_exceptions as haas_exceptions
 from ims.common.log import *
+from ims.common.metrics import timed
 
 logger = create_logger(__name__)
 
 
+# Gives each thread its own requests session, a session is not safe to share
+# between the threads serving different users. The credentials are passed
+# with every request so the session only holds the pooled connections.
+class HTTPSessions:
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.sessions = []
+
+    def get(self):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            self.local.session = session
+            with self.lock:
+                self.sessions.append(session)
+        return session
+
+    def close(self):
+        with self.lock:
+            for session in self.sessions:
+                session.close()
+            del self.sessions[:]
+
+
 class HIL:
     class Request:
         def __init__(self, method, data, auth=None):
@@ -25,21 +53,24 @@ class HIL:
                  "auth": self.auth})
 
     class Communicator:
+        # session is the requests session to send the request on, the
+        # connections of a shared session are reused across requests
         @trace
-        def __init__(self, url, request):
+        def __init__(self, url, request, session=None):
             self.url = url
             self.request = request
+            self.session = session if session is not None else requests
 
         @trace
         def send_request(self):
             try:
                 if self.request.method == "get":
                     return self.resp_parse(
-                        requests.get(self.url, auth=self.request.auth))
+                        self.session.get(self.url, auth=self.request.auth))
                 if self.request.method == "post":
                     return self.resp_parse(
-                        requests.post(self.url, data=self.request.data,
-                                      auth=self.request.auth))
+                        self.session.post(self.url, data=self.request.data,
+                                          auth=self.request.auth))
             except requests.RequestException:
                 raise haas_exceptions.ConnectionException()
 
@@ -63,22 +94,23 @@ class HIL:
                                                            constants.MESSAGE_KEY])
 
     @log
-    def __init__(self, base_url, usr, passwd):
+    def __init__(self, base_url, usr, passwd, session=None):
         self.base_url = base_url
         self.usr = usr
         self.passwd = passwd
+        self.session = session
 
     @trace
     def __call_rest_api(self, api):
         link = urlparse.urljoin(self.base_url, api)
         request = HIL.Request('get', None, auth=(self.usr, self.passwd))
-        return HIL.Communicator(link, request).send_request()
+        return HIL.Communicator(link, request, self.session).send_request()
 
     @trace
     def __call_rest_api_with_body(self, api, body):
         link = urlparse.urljoin(self.base_url, api)
         request = HIL.Request('post', body, auth=(self.usr, self.passwd))
-        return HIL.Communicator(link, request).send_request()
+        return HIL.Communicator(link, request, self.session).send_request()
 
     @log
     def list_free_nodes(self):
@@ -97,6 +129,7 @@ class HIL:
         return self.__call_rest_api_with_body(api=api, body=body)
 
     @log
+    @timed(constants.HIL_ATTACH_STAGE)
     def attach_node_to_project_network(self, node, network, nic):
         api = '/node/' + node + '/nic/' + nic + '/connect_network'
         body = {"network": network, "channel": constants.HAAS_BMI_CHANNEL}
@@ -109,6 +142,7 @@ class HIL:
         return self.__call_rest_api_with_body(api=api, body=body)
 
     @log
+    @timed(constants.HIL_DETACH_STAGE)
     def detach_node_from_project_network(self, node,
                                          network, nic):
         api = '/node/' + node + '/nic/' + nic + '/detach_network'
@@ -122,6 +156,34 @@ class HIL:
         logger.debug("The Node Info = %s", node_info)
         return node_info[constants.RETURN_VALUE_KEY]['nics'][0]['macaddr']
 
+    # Returns the networks the nic of the node is connected to as a dict of
+    # channel to network
+    @log
+    def get_node_networks(self, node, nic):
+        api = "node/" + node
+        node_info = self.__call_rest_api(api)
+        for node_nic in node_info[constants.RETURN_VALUE_KEY]['nics']:
+            if node_nic['label'] == nic:
+                return node_nic.get('networks', {})
+        return {}
+
+    # HIL applies network changes asynchronously, so this polls the node with
+    # exponential backoff until the network is (or is no longer) connected to
+    # the nic. Returns whether the expected state was reached before timeout.
+    @log
+    def wait_for_network(self, node, nic, network, connected):
+        interval = constants.HAAS_POLL_INTERVAL
+        deadline = time.time() + constants.HAAS_POLL_TIMEOUT
+        while True:
+            networks = self.get_node_networks(node, nic)
+            if (network in networks.values()) == connected:
+                return True
+            if time.time() + interval > deadline:
+                logger.info("Timed out waiting for %s on %s", network, node)
+                return False
+            time.sleep(interval)
+            interval = min(interval * 2, constants.HAAS_POLL_MAX_INTERVAL)
+
     @log
     def validate_project(self, project):
         api = '/project/' + project + '/nodes'
@@ -0,0 +1,141 @@
+import collections
+import threading
+import time
+
+import rbd
+
+from ims.common.log import *
+
+logger = create_logger(__name__)
+
+
+# An open rbd image along with the pooled connection whose context it was
+# opened on, only the read only images are cached
+class CachedImage:
+    @trace
+    def __init__(self, image, connection, read_only=False):
+        self.image = image
+        self.connection = connection
+        self.read_only = read_only
+        self.opened = time.time()
+
+    @trace
+    def close(self):
+        try:
+            self.image.close()
+        except rbd.Error:
+            logger.exception('')
+
+
+# Keeps up to size open images and the snapshots and parent info read from
+# them so that the RBD operations do not reopen the image and reread its
+# header every time. A handle is taken out of the cache while it is in use
+# so that it is only used by one thread at a time, a thread which needs an
+# image that is in use opens another handle and the extra one is closed when
+# it is put back. Handles and metadata are dropped after ttl seconds and
+# whenever RBD changes the image. The handles are opened read only, which
+# does not watch the header, so that other clients of the pool can still
+# remove the images. The changes they make are seen once the ttl is over.
+class ImageCache:
+    @log
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.images = collections.OrderedDict()
+        self.metadata = collections.OrderedDict()
+        # Incremented by every invalidation so that metadata read while the
+        # image was being changed is not stored
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    @trace
+    def __expired(self, at):
+        return time.time() - at > self.ttl
+
+    # Takes the open image out of the cache, None if it is not cached
+    @trace
+    def take(self, name):
+        with self.lock:
+            cached = self.images.pop(name, None)
+        if cached is not None and (self.__expired(cached.opened) or
+                                   cached.connection.closed):
+            cached.close()
+            return None
+        return cached
+
+    # Puts the open image back, the least recently used images are closed
+    # when the cache is full
+    @trace
+    def put(self, name, cached):
+        closed = []
+        with self.lock:
+            if name in self.images or cached.connection.closed or \
+                    self.size == 0:
+                closed.append(cached)
+            else:
+                self.images[name] = cached
+                while len(self.images) > self.size:
+                    closed.append(self.images.popitem(last=False)[1])
+        for image in closed:
+            image.close()
+
+    # Drops the metadata of the image, called after RBD changes it. The
+    # handle does not watch the header so it is closed too rather than read
+    # the old one.
+    @trace
+    def invalidate(self, name):
+        self.evict(name)
+
+    # Closes the cached image and drops its metadata, the image cannot be
+    # removed while it is open
+    @trace
+    def evict(self, name):
+        with self.lock:
+            self.generation += 1
+            self.metadata.pop(name, None)
+            cached = self.images.pop(name, None)
+        if cached is not None:
+            cached.close()
+
+    # Closes the cached images which were opened on the connection
+    @trace
+    def evict_connection(self, connection):
+        with self.lock:
+            names = [name for name, cached in self.images.items()
+                     if cached.connection is connection]
+            closed = [self.images.pop(name) for name in names]
+        for cached in closed:
+            cached.close()
+
+    # Returns the key of the metadata of the image, load is called to read
+    # it from the image when it is not cached
+    @trace
+    def get_metadata(self, name, key, load):
+        with self.lock:
+            generation = self.generation
+            cached = self.metadata.get(name)
+            if cached is not None and not self.__expired(cached[0]) and \
+                    key in cached[1]:
+                self.metadata[name] = self.metadata.pop(name)
+                return cached[1][key]
+        value = load()
+        with self.lock:
+            if self.generation == generation and self.size > 0:
+                cached = self.metadata.pop(name, None)
+                if cached is None or self.__expired(cached[0]):
+                    cached = (time.time(), {})
+                cached[1][key] = value
+                self.metadata[name] = cached
+                while len(self.metadata) > self.size:
+                    self.metadata.popitem(last=False)
+        return value
+
+    # Closes all the cached images
+    @trace
+    def clear(self):
+        with self.lock:
+            closed = self.images.values()
+            self.images.clear()
+            self.metadata.clear()
+        for cached in closed:
+            cached.close()
@@ -1,20 +1,279 @@
 import subprocess
-
-import re
-import sh
+import threading
+from abc import ABCMeta
+from abc import abstractmethod
+from collections import OrderedDict
 
 import ims.common.constants as constants
 from ims.common.log import *
+from ims.common.metrics import timed
 from ims.exception import *
 
 logger = create_logger(__name__)
 
 
-class IET:
+# Runs the commands which control the iscsitarget service. IET takes it as an
+# argument so that the daemon can be replaced, the fakes replace it to run
+# without iscsitarget. The targets of the running daemon are read from
+# volume_loc and changed with ietadm.
+class IETService:
     @log
-    def __init__(self, fs, password):
+    def __init__(self, password, volume_loc=constants.IET_VOLUME_LOC):
+        self.password = password
+        self.volume_loc = volume_loc
+
+    # Runs service iscsitarget with action, returns whether it succeeded
+    @trace
+    def __run(self, action):
+        command = "echo {0} | sudo -S service iscsitarget {1}".format(
+            self.password, action)
+        p = subprocess.Popen(command, shell=True, stderr=subprocess.STDOUT,
+                             stdout=subprocess.PIPE)
+        output, err = p.communicate()
+        # output = sh.service.iscsitarget.restart()
+        return p.returncode == 0
+
+    @log
+    def restart(self):
+        return self.__run("restart")
+
+    @log
+    def stop(self):
+        return self.__run("stop")
+
+    # Runs ietadm with args, returns whether it succeeded
+    @trace
+    def __admin(self, args):
+        command = "echo {0} | sudo -S ietadm {1}".format(self.password, args)
+        p = subprocess.Popen(command, shell=True, stderr=subprocess.STDOUT,
+                             stdout=subprocess.PIPE)
+        output, err = p.communicate()
+        if p.returncode != 0:
+            logger.info("ietadm %s failed with %s", args, output)
+        return p.returncode == 0
+
+    # Returns a dict of the name of every target of the running daemon to its
+    # tid and a dict of its luns to their paths. The targets are the lines
+    # like tid:1 name:iqn.2015.1img1, each followed by the lines of its luns
+    # like lun:0 state:0 iotype:blockio ... path:/dev/rbd1. Raises IOError
+    # when the daemon is not loaded.
+    @log
+    def volumes(self):
+        volumes = {}
+        luns = None
+        with open(self.volume_loc, 'r') as fi:
+            for line in fi:
+                fields = dict(field.split(':', 1) for field in line.split()
+                              if ':' in field)
+                if 'tid' in fields and 'name' in fields:
+                    luns = {}
+                    volumes[fields['name']] = (int(fields['tid']), luns)
+                elif 'lun' in fields and luns is not None:
+                    luns[int(fields['lun'])] = fields.get('path')
+        return volumes
+
+    # Returns a dict of the name of every target of the running daemon to its
+    # tid
+    @log
+    def targets(self):
+        return dict((name, tid) for name, (tid, luns) in
+                    self.volumes().items())
+
+    # Adds the target with its lun on rbd_name to the running daemon, the
+    # target is deleted again if the lun cannot be added
+    @log
+    def add_target(self, tid, name, rbd_name):
+        if not self.__admin("--op new --tid={0} --params Name={1}".format(
+                tid, name)):
+            return False
+        if self.__admin("--op new --tid={0} --lun=0 --params {1}".format(
+                tid, constants.IET_LUN_PARAMS.replace(constants.RBD_NAME,
+                                                      rbd_name))):
+            return True
+        self.delete_target(tid)
+        return False
+
+    @log
+    def delete_target(self, tid):
+        return self.__admin("--op delete --tid={0}".format(tid))
+
+
+# The targets of ietd.conf parsed into a dict of image -> the lines of its
+# target, so that the mappings are looked up without reading the file and
+# changed without matching its lines. The lines before the first target are
+# kept as they are. The file is parsed again only when it was changed by
+# someone else, which is noticed by its mtime, size and inode, and it is
+# rewritten with a single write of the temp file which is synced and
+# renamed over it.
+class IETConfig:
+    @log
+    def __init__(self, config_loc, temp_loc):
+        self.config_loc = config_loc
+        self.temp_loc = temp_loc
+        self.header = []
+        # image -> [rbd device, lines of the target]
+        self.targets = OrderedDict()
+        self.stamp = None
+        self.lock = threading.Lock()
+
+    @trace
+    def __stamp(self):
+        stat = os.stat(self.config_loc)
+        return stat.st_mtime, stat.st_size, stat.st_ino
+
+    # Parses the file again if it changed since it was last read or written
+    @trace
+    def __load(self):
+        try:
+            stamp = self.__stamp()
+            if stamp == self.stamp:
+                return
+            header = []
+            targets = OrderedDict()
+            target = None
+            with open(self.config_loc, 'r') as fi:
+                for line in fi:
+                    stripped = line.strip()
+                    if stripped.startswith(constants.IET_TARGET_STARTING):
+                        if target is not None and targets[target][0] is None:
+                            raise iscsi_exceptions.InvalidConfigException()
+                        target = stripped.split('.')[2]
+                        targets[target] = [None, [line]]
+                    elif stripped.startswith(constants.IET_LUN_STARTING):
+                        if target is None or targets[target][0] is not None:
+                            raise iscsi_exceptions.InvalidConfigException()
+                        targets[target][0] = \
+                            stripped.split(',')[0].split('=')[1]
+                        targets[target][1].append(line)
+                    elif target is None:
+                        header.append(line)
+                    else:
+                        targets[target][1].append(line)
+            self.header = header
+            self.targets = targets
+            self.stamp = stamp
+        except (IOError, OSError) as e:
+            logger.info("Raising Read Config Failed Exception")
+            raise iscsi_exceptions.ReadConfigFailedException(str(e))
+
+    @trace
+    def __write(self):
+        try:
+            with open(self.temp_loc, 'w') as temp:
+                temp.write("".join(self.header + [
+                    line for rbd_name, lines in self.targets.values()
+                    for line in lines]))
+                temp.flush()
+                os.fsync(temp.fileno())
+            os.rename(self.temp_loc, self.config_loc)
+            self.stamp = self.__stamp()
+        except (IOError, OSError) as e:
+            # The file is parsed again as the model no longer matches it
+            self.stamp = None
+            logger.info("Raising Update Config Failed Exception")
+            raise iscsi_exceptions.UpdateConfigFailedException(str(e))
+
+    # Returns a dict of image -> rbd device of every target with a lun
+    @log
+    def mappings(self):
+        with self.lock:
+            self.__load()
+            return dict((target, rbd_name) for target, (rbd_name, lines) in
+                        self.targets.items() if rbd_name is not None)
+
+    # Removes the targets of the images in removed and adds the targets of
+    # added, a dict of image -> rbd device
+    @log
+    def update(self, added, removed):
+        with self.lock:
+            self.__load()
+            for ceph_img_name in removed:
+                self.targets.pop(ceph_img_name, None)
+            for ceph_img_name, rbd_name in added.items():
+                self.targets[ceph_img_name] = [rbd_name, [
+                    line + '\n' for line in constants.IET_MAPPING_TEMP.replace(
+                        constants.CEPH_IMG_NAME, ceph_img_name).replace(
+                        constants.RBD_NAME, rbd_name).splitlines()]]
+            self.__write()
+
+
+# The interface of the iscsi target drivers, which map the images and
+# export their rbd devices as iscsi targets named after them. A driver has to
+# implement update_mappings, show_mappings and remake_mappings, the others
+# are built on top of update_mappings unless the driver has a better way.
+# A driver which misses one of them cannot be created.
+class TargetDriver(object):
+    __metaclass__ = ABCMeta
+
+    @log
+    def __init__(self, fs):
         self.fs = fs
+
+    # Maps and exports the images in create and removes the targets of the
+    # images in delete. The devices of the removed targets are unmapped when
+    # unmap is set, otherwise they are left to the caller. Returns a dict of
+    # the images that failed along with the exception for each of them.
+    @abstractmethod
+    def update_mappings(self, create, delete, unmap=False):
+        pass
+
+    # Returns a dict of image -> rbd device of every target
+    @abstractmethod
+    def show_mappings(self):
+        pass
+
+    # Exports the targets again on the devices the images are mapped to now,
+    # which can have changed since they were exported
+    @abstractmethod
+    def remake_mappings(self):
+        pass
+
+    @log
+    def create_mapping(self, ceph_img_name):
+        failed = self.update_mappings([ceph_img_name], [])
+        if ceph_img_name in failed:
+            raise failed[ceph_img_name]
+
+    @log
+    def delete_mapping(self, ceph_img_name):
+        failed = self.update_mappings([], [ceph_img_name], unmap=True)
+        if ceph_img_name in failed:
+            raise failed[ceph_img_name]
+
+    # Returns a dict of the images that could not be exported along with the
+    # exception for each of them
+    @log
+    def create_mappings(self, ceph_img_names):
+        return self.update_mappings(ceph_img_names, [])
+
+    # The rbd devices are left mapped, returns a dict of the images whose
+    # target could not be removed along with the exception for each of them
+    @log
+    def delete_mappings(self, ceph_img_names):
+        return self.update_mappings([], ceph_img_names)
+
+
+# The target driver of the iscsitarget daemon, which is configured through
+# ietd.conf and restarted to pick up the changes
+class IET(TargetDriver):
+    # config_loc and temp_loc are the paths of ietd.conf and of the file
+    # used to rewrite it, service controls the iscsitarget daemon.
+    # When online is set the targets are added to and deleted from the
+    # running daemon with ietadm instead of restarting it, ietd.conf is still
+    # updated so that they are there after a restart. The daemon is only
+    # restarted when ietadm fails, which reloads the targets from ietd.conf.
+    @log
+    def __init__(self, fs, password, config_loc=constants.IET_ISCSI_CONFIG_LOC,
+                 temp_loc=constants.IET_ISCSI_CONFIG_TEMP_LOC, service=None,
+                 online=False):
+        TargetDriver.__init__(self, fs)
         self.password = password
+        self.config = IETConfig(config_loc, temp_loc)
+        self.service = service if service is not None else IETService(
+            password)
+        self.online = online
+        # Keeps concurrent online updates from taking the same tid
+        self.online_lock = threading.Lock()
 
     @log
     def create_mapping(self, ceph_img_name):
@@ -25,8 +284,7 @@ class IET:
                 raise iscsi_exceptions.NodeAlreadyInUseException()
             rbd_name = self.fs.map(ceph_img_name)
             self.__add_mapping(ceph_img_name, rbd_name)
-            self.__restart()
-            self.__check_status(True)
+            self.__reload({ceph_img_name: rbd_name}, [])
         except iscsi_exceptions.UpdateConfigFailedException as e:
             maps = self.fs.showmapped()
             self.fs.unmap(maps[ceph_img_name])
@@ -46,151 +304,212 @@ class IET:
             iscsi_mappings = self.show_mappings()
             if ceph_img_name not in iscsi_mappings:
                 raise iscsi_exceptions.NodeAlreadyUnmappedException()
-            self.__stop()
-            self.__check_status(False)
+            # The device can only be unmapped once the target is gone, the
+            # daemon is stopped for it unless it is deleted online
+            online = self.__apply_online({}, [ceph_img_name])
+            if not online:
+                self.__stop()
+                self.__check_stopped()
             mappings = self.fs.showmapped()
             self.__remove_mapping(ceph_img_name, mappings[ceph_img_name])
             self.fs.unmap(mappings[ceph_img_name])
-            self.__restart()
-            self.__check_status(True)
+            if not online:
+                self.__restart()
+                self.__check_targets({})
         except iscsi_exceptions.UpdateConfigFailedException as e:
             self.__restart()
             raise e
         except file_system_exceptions.UnmapFailedException as e:
-            self.__add_mapping(ceph_img_name, mappings(ceph_img_name))
+            self.__add_mapping(ceph_img_name, mappings[ceph_img_name])
             self.__restart()
             raise e
         except (iscsi_exceptions.MountException,
                 iscsi_exceptions.DuplicatesException,
                 iscsi_exceptions.RestartFailedException) as e:
             self.fs.map(ceph_img_name)
-            self.__add_mapping(ceph_img_name, mappings(ceph_img_name))
+            self.__add_mapping(ceph_img_name, mappings[ceph_img_name])
             self.__restart()
             raise e
 
+    # Applies the changes with a single ietd.conf update and a single reload
     @log
-    def show_mappings(self):
-        mappings = {}
+    def update_mappings(self, create, delete, unmap=False):
+        failed = {}
+        mapped = {}
+        removed = {}
+        mappings = self.show_mappings()
+        for ceph_img_name in delete:
+            if ceph_img_name in mappings:
+                removed[ceph_img_name] = mappings[ceph_img_name]
+            else:
+                failed[ceph_img_name] = \
+                    iscsi_exceptions.NodeAlreadyUnmappedException()
+        for ceph_img_name in create:
+            if ceph_img_name in mappings:
+                failed[ceph_img_name] = \
+                    iscsi_exceptions.NodeAlreadyInUseException()
+                continue
+            try:
+                mapped[ceph_img_name] = self.fs.map(ceph_img_name)
+            except file_system_exceptions.MapFailedException as e:
+                failed[ceph_img_name] = e
+
+        if not mapped and not removed:
+            return failed
+
         try:
-            with open(constants.IET_ISCSI_CONFIG_LOC, 'r') as fi:
-                target = None
-                for line in fi:
-                    line = line.strip()
-                    if line.startswith(constants.IET_TARGET_STARTING):
-                        if target is None:
-                            target = line.split('.')[2]
-                        else:
-                            raise iscsi_exceptions.InvalidConfigException()
-                    elif line.startswith(constants.IET_LUN_STARTING):
-                        if target is not None:
-                            mappings[target] = line.split(',')[0].split('=')[1]
-                            target = None
-                        else:
-                            raise iscsi_exceptions.InvalidConfigException()
+            self.__update_mappings(mapped, removed.keys())
+            self.__reload(mapped, removed.keys())
+        except iscsi_exceptions.UpdateConfigFailedException as e:
+            for ceph_img_name, rbd_name in mapped.items():
+                self.fs.unmap(rbd_name)
+                failed[ceph_img_name] = e
+            for ceph_img_name in removed:
+                failed[ceph_img_name] = e
+            return failed
+        except (iscsi_exceptions.MountException,
+                iscsi_exceptions.DuplicatesException) as e:
+            # Only the new targets reported by iscsitarget are rolled back,
+            # the removed ones are already gone from the config
+            bad = dict((k, v) for k, v in mapped.items() if k in e.names)
+            self.__remove_mappings(bad)
+            for ceph_img_name, rbd_name in bad.items():
+                self.fs.unmap(rbd_name)
+                failed[ceph_img_name] = e
+            self.__restart()
+        except iscsi_exceptions.RestartFailedException as e:
+            self.__update_mappings(removed, mapped.keys())
+            for ceph_img_name, rbd_name in mapped.items():
+                self.fs.unmap(rbd_name)
+                failed[ceph_img_name] = e
+            for ceph_img_name in removed:
+                failed[ceph_img_name] = e
+            return failed
 
-            return mappings
-        except IOError as e:
-            logger.info("Raising Read Config Failed Exception")
-            raise iscsi_exceptions.ReadConfigFailedException(e.message)
+        if unmap:
+            for ceph_img_name, rbd_name in removed.items():
+                try:
+                    self.fs.unmap(rbd_name)
+                except file_system_exceptions.UnmapFailedException as e:
+                    failed[ceph_img_name] = e
+        return failed
+
+    @log
+    def show_mappings(self):
+        return self.config.mappings()
 
     @log
     def __add_mapping(self, ceph_img_name, rbd_name):
-        try:
-            with open(constants.IET_ISCSI_CONFIG_LOC, 'a') as fi:
-                fi.write(
-                    constants.IET_MAPPING_TEMP.replace(constants.CEPH_IMG_NAME,
-                                                       ceph_img_name).replace(
-                        constants.RBD_NAME, rbd_name))
-        except IOError as e:
-            logger.info("Raising Update Config Failed Exception")
-            raise iscsi_exceptions.UpdateConfigFailedException(e.message)
+        self.__add_mappings({ceph_img_name: rbd_name})
+
+    @log
+    def __add_mappings(self, mappings):
+        self.__update_mappings(mappings, [])
 
     @log
     def __remove_mapping(self, ceph_img_name, rbd_name):
-        try:
-            with open(constants.IET_ISCSI_CONFIG_LOC, 'r') as fi:
-                with open(constants.IET_ISCSI_CONFIG_TEMP_LOC, 'w') as temp:
-                    for line in fi:
-                        if line.find(ceph_img_name) == -1 and line.find(
-                                rbd_name) == -1:
-                            temp.write(line)
-            os.rename(constants.IET_ISCSI_CONFIG_TEMP_LOC,
-                      constants.IET_ISCSI_CONFIG_LOC)
-        except IOError as e:
-            logger.info("Raising Update Config Failed Exception")
-            raise iscsi_exceptions.UpdateConfigFailedException(e.message)
+        self.__remove_mappings({ceph_img_name: rbd_name})
+
+    @log
+    def __remove_mappings(self, mappings):
+        self.__update_mappings({}, mappings.keys())
+
+    # Adds the mappings in added and removes the targets of the images in
+    # removed from ietd.conf in a single rewrite
+    @log
+    @timed(constants.ISCSI_CONFIG_STAGE)
+    def __update_mappings(self, added, removed):
+        self.config.update(added, removed)
+
+    # Applies the targets added to and removed from ietd.conf to the running
+    # daemon, it is restarted when they cannot be applied online
+    @log
+    def __reload(self, added, removed):
+        if self.__apply_online(added, removed):
+            return
+        self.__restart()
+        self.__check_targets(added)
+
+    # Adds the targets of added, a dict of image to rbd device, and deletes
+    # the targets of the images in removed on the running daemon. Returns
+    # False if it is not online or ietadm failed, the targets applied so far
+    # are then left to the restart.
+    @log
+    @timed(constants.ISCSI_ONLINE_STAGE)
+    def __apply_online(self, added, removed):
+        if not self.online:
+            return False
+        with self.online_lock:
+            try:
+                targets = self.service.targets()
+            except IOError:
+                logger.exception('')
+                return False
+            for ceph_img_name in removed:
+                tid = targets.pop(constants.IET_TARGET_PREFIX + ceph_img_name,
+                                  None)
+                if tid is not None and not self.service.delete_target(tid):
+                    return False
+            tid = max(targets.values() + [0])
+            for ceph_img_name, rbd_name in sorted(added.items()):
+                tid += 1
+                if not self.service.add_target(
+                        tid, constants.IET_TARGET_PREFIX + ceph_img_name,
+                        rbd_name):
+                    return False
+            return True
 
     @log
+    @timed(constants.ISCSI_RESTART_STAGE)
     def __restart(self):
-        command = "echo {0} | sudo -S service iscsitarget restart".format(
-            self.password)
-        p = subprocess.Popen(command, shell=True, stderr=subprocess.STDOUT,
-                             stdout=subprocess.PIPE)
-        output, err = p.communicate()
-        # output = sh.service.iscsitarget.restart()
-        if p.returncode == 0:
-            return output.strip()
-        else:
+        if not self.service.restart():
             logger.info("Raising Restart Failed Exception")
             raise iscsi_exceptions.RestartFailedException()
 
     @log
+    @timed(constants.ISCSI_STOP_STAGE)
     def __stop(self):
-        command = "echo {0} | sudo -S service iscsitarget stop".format(
-            self.password)
-        p = subprocess.Popen(command, shell=True, stderr=subprocess.STDOUT,
-                             stdout=subprocess.PIPE)
-        output, err = p.communicate()
-        # output = sh.service.iscsitarget.stop()
-        if p.returncode == 0:
-            return output.strip()
-        else:
+        if not self.service.stop():
             logger.info("Raising Stop Failed Exception")
             raise iscsi_exceptions.StopFailedException()
 
-    def __check_status(self, on):
-        output = sh.service.iscsitarget.status(_ok_code=[0, 3])
-        ansi_escape = re.compile(r'\x1b[^m]*m')
-        output = ansi_escape.sub('', output.strip())
-        parts = output.split("\n")
-        active = not on
-        targets = []
+    # Checks the targets of mappings, a dict of image to rbd device, against
+    # the volumes of the running daemon instead of the whole service, so that
+    # only the targets that were changed are looked at. Raises MountException
+    # for the images whose target is missing or has no lun 0 on its device
+    # and RestartFailedException when the daemon is not running.
+    @timed(constants.ISCSI_STATUS_STAGE)
+    def __check_targets(self, mappings):
+        try:
+            volumes = self.service.volumes()
+        except IOError:
+            logger.info("Raising Restart Failed Exception")
+            raise iscsi_exceptions.RestartFailedException()
+
         failed_mount = []
-        duplicates = []
-        for part in parts:
-            if part.strip().startswith("Active"):
-                line_parts = part.strip().split()
-                if line_parts[1] + line_parts[2] == "active(running)":
-                    active = True
-                if line_parts[1] + line_parts[2] == "inactive(dead)":
-                    active = False
-            elif part.strip().find("created target") != -1:
-                line = part.strip()[
-                       part.strip().find("created target"):].split()
-                targets.append(line[2].split(".")[2])
-            elif part.strip().find("unable to create logical unit") != -1:
-                target = targets.pop()
-                failed_mount.append(target)
-            elif part.strip().find("duplicated target") != -1:
-                line = part.strip()[
-                       part.strip().find("duplicated target"):].split()
-                duplicates.append(line[2].split(".")[2])
+        for ceph_img_name, rbd_name in mappings.items():
+            tid, luns = volumes.get(constants.IET_TARGET_PREFIX + ceph_img_name,
+                                    (None, {}))
+            if luns.get(0) != rbd_name:
+                failed_mount.append(ceph_img_name)
 
         if failed_mount:
             logger.info("Raising Mount Exception for %s", failed_mount)
             raise iscsi_exceptions.MountException(failed_mount)
 
-        if duplicates:
-            logger.info("Raising Mount Exception for %s", duplicates)
-            raise iscsi_exceptions.DuplicatesException(duplicates)
-
-        if not active and on:
-            logger.info("Raising Restart Failed Exception")
-            raise iscsi_exceptions.RestartFailedException()
-        elif not on and active:
+    # The daemon is stopped once it has no targets left, its volumes are gone
+    # altogether when the module was unloaded with it
+    @timed(constants.ISCSI_STATUS_STAGE)
+    def __check_stopped(self):
+        try:
+            volumes = self.service.volumes()
+        except IOError:
+            return
+        if volumes:
             logger.info("Raising Stop Failed Exception")
             raise iscsi_exceptions.StopFailedException()
 
+    @log
     def remake_mappings(self):
 
         if not self.fs.showmapped():
@@ -0,0 +1,96 @@
+import Queue
+import threading
+
+import ims.common.constants as constants
+from ims.common.log import *
+from ims.database import *
+from ims.einstein.operations import BMI
+from ims.exception import *
+
+logger = create_logger(__name__)
+
+
+# Runs the long running BMI operations in a pool of worker threads so that
+# the rpc call can return as soon as the job is queued. The status and result
+# of every job is persisted in the job table so that it can be polled.
+class JobEngine:
+    # The BMI operations which are allowed to be run as jobs
+    COMMANDS = [constants.PROVISION_COMMAND,
+                constants.PROVISION_MANY_COMMAND,
+                constants.DEPROVISION_COMMAND,
+                constants.CREATE_SNAPSHOT_COMMAND,
+                constants.IMPORT_IMAGE_COMMAND,
+                constants.IMPORT_SNAPSHOT_COMMAND,
+                constants.RELEASE_PROJECT_COMMAND]
+
+    # backend is shared by the BMI of every job
+    @log
+    def __init__(self, workers, backend):
+        self.backend = backend
+        self.queue = Queue.Queue()
+        self.workers = []
+        self.__fail_interrupted_jobs()
+        for i in range(workers):
+            worker = threading.Thread(target=self.__work,
+                                      name="job-worker-" + str(i))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    # Jobs which were queued or running when einstein went down cannot be
+    # resumed as the credentials are not persisted
+    @trace
+    def __fail_interrupted_jobs(self):
+        with Database() as db:
+            for id in db.job.fetch_ids_with_status(
+                    [constants.JOB_QUEUED_STATUS,
+                     constants.JOB_RUNNING_STATUS]):
+                db.job.update_status(id, constants.JOB_FAILED_STATUS,
+                                     {constants.STATUS_CODE_KEY: 500,
+                                      constants.MESSAGE_KEY:
+                                          "Job was interrupted by a restart"})
+
+    # Persists the job and queues it, returns the id of the job
+    @log
+    def submit(self, credentials, command, args):
+        if command not in JobEngine.COMMANDS:
+            raise UnknownJobException(command)
+        base64_str, project = credentials
+        with Database() as db:
+            id = db.job.insert(command, project, args)
+        self.queue.put((id, credentials, command, args))
+        return id
+
+    @trace
+    def __work(self):
+        while True:
+            id, credentials, command, args = self.queue.get()
+            try:
+                self.__run(id, credentials, command, args)
+            except Exception:
+                logger.exception('')
+            finally:
+                self.queue.task_done()
+
+    @log
+    def __run(self, id, credentials, command, args):
+        with Database() as db:
+            db.job.update_status(id, constants.JOB_RUNNING_STATUS)
+            try:
+                with BMI(credentials, backend=self.backend) as bmi:
+                    ret = getattr(BMI, command)(bmi, *args)
+            except BMIException as ex:
+                logger.exception('')
+                ret = {constants.STATUS_CODE_KEY: ex.status_code,
+                       constants.MESSAGE_KEY: str(ex)}
+            # Any other error still fails the job instead of leaving it
+            # running forever
+            except Exception as ex:
+                logger.exception('')
+                ret = {constants.STATUS_CODE_KEY: 500,
+                       constants.MESSAGE_KEY: str(ex)}
+            if ret[constants.STATUS_CODE_KEY] == 200:
+                status = constants.JOB_DONE_STATUS
+            else:
+                status = constants.JOB_FAILED_STATUS
+            db.job.update_status(id, status, ret)
@@ -0,0 +1,312 @@
+import subprocess
+import threading
+
+import os
+import rados
+import sh
+
+import ims.common.constants as constants
+import ims.exception.file_system_exceptions as file_system_exceptions
+from ims.common.log import *
+
+logger = create_logger(__name__)
+
+__indexes = {}
+__lock = threading.Lock()
+
+
+# Returns the monitor addresses of the cluster in the form krbd expects,
+# a comma separated list of ip:port. Only the v1 addresses are kept as the
+# kernel does not take the v2 ones in the map spec.
+@log
+def read_monitors(rid, conf_file):
+    cluster = rados.Rados(rados_id=rid, conffile=conf_file)
+    try:
+        mon_host = cluster.conf_get('mon_host')
+    finally:
+        cluster.shutdown()
+    monitors = []
+    for addr in mon_host.replace('[', ' ').replace(']', ' ').replace(
+            ',', ' ').split():
+        if addr.startswith('v2:'):
+            continue
+        if addr.startswith('v1:'):
+            addr = addr[len('v1:'):]
+        monitors.append(addr.split('/')[0])
+    return ",".join(monitors)
+
+
+# Returns the key of client.<rid> from the keyring
+@log
+def read_secret(keyring, rid):
+    section = None
+    try:
+        with open(keyring, 'r') as fi:
+            for line in fi:
+                line = line.strip()
+                if line.startswith('[') and line.endswith(']'):
+                    section = line[1:-1].strip()
+                elif section == 'client.' + rid and line.startswith('key'):
+                    name, value = line.split('=', 1)
+                    if name.strip() == 'key':
+                        return value.strip()
+    except IOError:
+        logger.info("Raising Invalid Config Argument Exception for keyring")
+        raise file_system_exceptions.InvalidConfigArgumentException(
+            constants.CEPH_KEY_RING_KEY)
+    raise file_system_exceptions.InvalidConfigArgumentException(
+        constants.CEPH_KEY_RING_KEY)
+
+
+# Maps images with the rbd cli through sudo, it forks a shell per call
+class CliMapper:
+    @log
+    def __init__(self, password, keyring, rid):
+        self.password = password
+        self.keyring = keyring
+        self.rid = rid
+
+    @log
+    def map(self, pool, ceph_img_name):
+        command = "echo {0} | sudo -S rbd --keyring {1} --id {2} map {3}/{4}".format(
+            self.password, self.keyring, self.rid, pool, ceph_img_name)
+        p = subprocess.Popen(command, shell=True,
+                             stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
+        output, err = p.communicate()
+        # output = sh.rbd.map(ceph_img_name, keyring=self.keyring, id=self.rid,
+        #            pool=self.pool)
+        if p.returncode == 0:
+            if output.find("sudo") != -1:
+                return output.split(":")[1].strip()
+            else:
+                return output.strip()
+        else:
+            raise file_system_exceptions.MapFailedException(ceph_img_name)
+
+    @log
+    def unmap(self, rbd_name):
+        command = "echo {0} | sudo -S rbd --keyring {1} --id {2} unmap {3}".format(
+            self.password, self.keyring, self.rid, rbd_name)
+        p = subprocess.Popen(command, shell=True,
+                             stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
+        output, err = p.communicate()
+        # output = sh.rbd.unmap(rbd_name, keyring=self.keyring, id=self.rid)
+        if p.returncode == 0:
+            return output.strip()
+        else:
+            raise file_system_exceptions.UnmapFailedException(rbd_name)
+
+    @log
+    def showmapped(self):
+        output = sh.rbd.showmapped()
+        if output.exit_code == 0:
+            lines = output.split('\n')[1:-1]
+            maps = {}
+            for line in lines:
+                parts = line.split()
+                maps[parts[2]] = parts[4]
+            return maps
+        else:
+            pass
+
+
+# The rbd bus of the kernel under the sysfs mount point root. Images are
+# mapped and unmapped by writing to its control files and the mapped ones
+# are listed under devices.
+class SysfsBus:
+    @log
+    def __init__(self, root=constants.SYSFS_ROOT):
+        self.path = os.path.join(root, "bus", "rbd")
+
+    # Returns the control file for action, add or remove, the single major
+    # one is used when the kernel has it as it does not use up a major
+    # number per device
+    @trace
+    def control(self, action):
+        single_major = action + "_single_major"
+        if os.path.exists(os.path.join(self.path, single_major)):
+            return single_major
+        return action
+
+    @trace
+    def write(self, control, data):
+        with open(os.path.join(self.path, control), 'w') as fi:
+            fi.write(data)
+
+    # Returns the mapped devices as a dict of id to a dict of their pool,
+    # name and current_snap
+    @trace
+    def devices(self):
+        path = os.path.join(self.path, "devices")
+        try:
+            dev_ids = os.listdir(path)
+        except OSError:
+            return {}
+        devices = {}
+        for dev_id in dev_ids:
+            device = {}
+            try:
+                for attr in ("pool", "name", "current_snap"):
+                    with open(os.path.join(path, dev_id, attr), 'r') as fi:
+                        device[attr] = fi.read().strip()
+            except IOError:
+                # Unmapped while it was being read
+                continue
+            devices[dev_id] = device
+        return devices
+
+
+# Maps images by writing the map spec to the rbd bus in sysfs, which is a
+# single write instead of a fork of the rbd cli. Einstein needs to be able
+# to write to the control files of the bus.
+class SysfsMapper:
+    @log
+    def __init__(self, monitors, rid, secret, bus=None):
+        self.monitors = monitors
+        self.rid = rid
+        self.secret = secret
+        self.bus = bus if bus is not None else SysfsBus()
+        # The new device is found by comparing the devices before and after
+        # the write so the maps are done one at a time
+        self.lock = threading.Lock()
+
+    @log
+    def map(self, pool, ceph_img_name):
+        spec = "{0} name={1},secret={2} {3} {4}".format(
+            self.monitors, self.rid, self.secret, pool, ceph_img_name)
+        with self.lock:
+            before = self.bus.devices()
+            try:
+                self.bus.write(self.bus.control("add"), spec)
+            except (IOError, OSError):
+                logger.exception('')
+                raise file_system_exceptions.MapFailedException(ceph_img_name)
+            for dev_id, device in self.bus.devices().items():
+                if dev_id not in before and device["pool"] == pool and \
+                        device["name"] == ceph_img_name:
+                    return constants.RBD_DEVICE_PREFIX + dev_id
+        raise file_system_exceptions.MapFailedException(ceph_img_name)
+
+    @log
+    def unmap(self, rbd_name):
+        dev_id = rbd_name[len(constants.RBD_DEVICE_PREFIX):]
+        if not rbd_name.startswith(constants.RBD_DEVICE_PREFIX) or \
+                dev_id not in self.bus.devices():
+            raise file_system_exceptions.UnmapFailedException(rbd_name)
+        try:
+            self.bus.write(self.bus.control("remove"), dev_id)
+            return ""
+        except (IOError, OSError):
+            logger.exception('')
+            raise file_system_exceptions.UnmapFailedException(rbd_name)
+
+    # Returns the mapped images as a dict of image name to device
+    @log
+    def showmapped(self):
+        return dict((device["name"], constants.RBD_DEVICE_PREFIX + dev_id)
+                    for dev_id, device in self.bus.devices().items())
+
+
+# Keeps the images mapped on the host along with their devices in memory so
+# that looking them up neither forks the rbd cli nor reads sysfs. It is
+# updated by the maps and unmaps made through it and reconciled with the
+# mapper every interval seconds in the background to pick up the ones made
+# outside of einstein. sysfs does not raise inotify events for the devices
+# the kernel creates, hence the polling.
+class MappingIndex:
+    @log
+    def __init__(self, mapper, interval=constants.MAPPING_RECONCILE_INTERVAL):
+        self.mapper = mapper
+        self.interval = interval
+        # image name -> device, None until it is first loaded
+        self.mappings = None
+        # Bumped on every change so that a reconcile which raced with a map
+        # or an unmap does not overwrite it with what it read before
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        if interval > 0:
+            reconciler = threading.Thread(target=self.__reconcile_forever,
+                                          name="mapping-reconciler")
+            reconciler.daemon = True
+            reconciler.start()
+
+    @log
+    def map(self, pool, ceph_img_name):
+        rbd_name = self.mapper.map(pool, ceph_img_name)
+        with self.lock:
+            if self.mappings is not None:
+                self.mappings[ceph_img_name] = rbd_name
+            self.generation += 1
+        return rbd_name
+
+    @log
+    def unmap(self, rbd_name):
+        output = self.mapper.unmap(rbd_name)
+        with self.lock:
+            if self.mappings is not None:
+                for ceph_img_name, device in self.mappings.items():
+                    if device == rbd_name:
+                        del self.mappings[ceph_img_name]
+            self.generation += 1
+        return output
+
+    # Returns a copy of the mapped images as a dict of image name to device
+    @log
+    def showmapped(self):
+        with self.lock:
+            if self.mappings is not None:
+                return dict(self.mappings)
+        self.reconcile()
+        with self.lock:
+            return dict(self.mappings or {})
+
+    # Replaces the index with the mappings read from the mapper
+    @trace
+    def reconcile(self):
+        with self.lock:
+            generation = self.generation
+        mappings = self.mapper.showmapped()
+        if mappings is None:
+            return
+        with self.lock:
+            if generation == self.generation:
+                self.mappings = mappings
+
+    @trace
+    def __reconcile_forever(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.reconcile()
+            except Exception:
+                logger.exception('')
+
+    @log
+    def close(self):
+        self.stopped.set()
+
+
+# Returns the mapping index of the process for the backend, creating it and
+# its mapper on first use. The sysfs mapper needs the monitors and the key
+# of the client which the rbd cli would otherwise read from the ceph config
+# and the keyring.
+def get(backend, rid, conf_file, keyring, password, sysfs_root):
+    key = (backend, rid, conf_file, keyring, sysfs_root)
+    with __lock:
+        if key not in __indexes:
+            if backend == constants.SYSFS_MAP_BACKEND:
+                mapper = SysfsMapper(read_monitors(rid, conf_file), rid,
+                                     read_secret(keyring, rid),
+                                     SysfsBus(sysfs_root))
+            else:
+                mapper = CliMapper(password, keyring, rid)
+            __indexes[key] = MappingIndex(mapper)
+        return __indexes[key]
+
+
+# Stops the reconcilers of all the indexes of the process
+def shutdown():
+    with __lock:
+        for index in __indexes.values():
+            index.close()
+        __indexes.clear()
@@ -0,0 +1,205 @@
+import threading
+
+import os
+
+import ims.common.constants as constants
+from ims.common.log import *
+from ims.common.metrics import timed
+from ims.einstein.iscsi import TargetDriver
+from ims.exception import *
+
+logger = create_logger(__name__)
+
+
+# The target tree of configfs, the paths are relative to target under root.
+# LIO creates the objects when their directories are made and removes them
+# when they are removed, so the fakes replace it to run without the kernel.
+class ConfigFS:
+    @log
+    def __init__(self, root=constants.CONFIGFS_ROOT):
+        self.path = os.path.join(root, "target")
+
+    @trace
+    def exists(self, path):
+        return os.path.lexists(os.path.join(self.path, path))
+
+    @trace
+    def listdir(self, path):
+        return os.listdir(os.path.join(self.path, path))
+
+    @trace
+    def mkdir(self, path):
+        os.mkdir(os.path.join(self.path, path))
+
+    @trace
+    def rmdir(self, path):
+        os.rmdir(os.path.join(self.path, path))
+
+    @trace
+    def link(self, source, path):
+        os.symlink(os.path.join(self.path, source),
+                   os.path.join(self.path, path))
+
+    @trace
+    def unlink(self, path):
+        os.unlink(os.path.join(self.path, path))
+
+    @trace
+    def read(self, path):
+        with open(os.path.join(self.path, path), 'r') as fi:
+            return fi.read().strip()
+
+    @trace
+    def write(self, path, value):
+        with open(os.path.join(self.path, path), 'w') as fi:
+            fi.write(value)
+
+
+# The target driver of LIO, the target in the kernel. Every image gets an
+# iblock backstore on its rbd device and a target with one tpg exporting it
+# as lun 0 on portal, which are created and removed through configfs so
+# that a change touches only its own target and nothing is restarted.
+# Every initiator is let in like with iscsitarget. Einstein needs to be able
+# to write to the target tree of configfs.
+class LIO(TargetDriver):
+    # portal is the <ip>:<port> the targets listen on
+    @log
+    def __init__(self, fs, portal, configfs=None):
+        TargetDriver.__init__(self, fs)
+        self.portal = portal
+        self.configfs = configfs if configfs is not None else ConfigFS()
+        self.lock = threading.Lock()
+
+    @trace
+    def __backstore(self, ceph_img_name):
+        return "core/" + constants.LIO_HBA + "/" + ceph_img_name
+
+    @trace
+    def __tpg(self, ceph_img_name):
+        return "iscsi/" + constants.IET_TARGET_PREFIX + ceph_img_name + \
+               "/" + constants.LIO_TPG
+
+    @log
+    def show_mappings(self):
+        try:
+            if not self.configfs.exists("iscsi"):
+                return {}
+            mappings = {}
+            for target in self.configfs.listdir("iscsi"):
+                if not target.startswith(constants.IET_TARGET_PREFIX):
+                    continue
+                ceph_img_name = target[len(constants.IET_TARGET_PREFIX):]
+                mappings[ceph_img_name] = self.configfs.read(
+                    self.__backstore(ceph_img_name) + "/udev_path")
+            return mappings
+        except (IOError, OSError) as e:
+            logger.info("Raising Read Config Failed Exception")
+            raise iscsi_exceptions.ReadConfigFailedException(str(e))
+
+    # Creates the backstore and the target of the image, what was created is
+    # removed again if it fails
+    @log
+    @timed(constants.ISCSI_CONFIG_STAGE)
+    def __export(self, ceph_img_name, rbd_name):
+        backstore = self.__backstore(ceph_img_name)
+        tpg = self.__tpg(ceph_img_name)
+        lun = tpg + "/lun/" + constants.LIO_LUN
+        try:
+            for path in ("core/" + constants.LIO_HBA, "iscsi"):
+                if not self.configfs.exists(path):
+                    self.configfs.mkdir(path)
+            self.configfs.mkdir(backstore)
+            self.configfs.write(backstore + "/control",
+                                "udev_path=" + rbd_name)
+            self.configfs.write(backstore + "/udev_path", rbd_name)
+            self.configfs.write(backstore + "/enable", "1")
+            self.configfs.mkdir(tpg[:tpg.rindex("/")])
+            self.configfs.mkdir(tpg)
+            self.configfs.mkdir(lun)
+            self.configfs.link(backstore, lun + "/" + ceph_img_name)
+            self.configfs.mkdir(tpg + "/np/" + self.portal)
+            for attrib, value in (("authentication", "0"),
+                                  ("generate_node_acls", "1"),
+                                  ("cache_dynamic_acls", "1"),
+                                  ("demo_mode_write_protect", "0")):
+                self.configfs.write(tpg + "/attrib/" + attrib, value)
+            self.configfs.write(tpg + "/enable", "1")
+        except (IOError, OSError) as e:
+            logger.info("Raising Update Config Failed Exception")
+            self.__unexport(ceph_img_name)
+            raise iscsi_exceptions.UpdateConfigFailedException(str(e))
+
+    # Removes the target and the backstore of the image, what is already
+    # gone is skipped so that it cleans up after a failed export
+    @log
+    @timed(constants.ISCSI_CONFIG_STAGE)
+    def __unexport(self, ceph_img_name):
+        backstore = self.__backstore(ceph_img_name)
+        tpg = self.__tpg(ceph_img_name)
+        lun = tpg + "/lun/" + constants.LIO_LUN
+        try:
+            if self.configfs.exists(tpg):
+                self.configfs.write(tpg + "/enable", "0")
+                if self.configfs.exists(lun + "/" + ceph_img_name):
+                    self.configfs.unlink(lun + "/" + ceph_img_name)
+                for path in [lun] + [tpg + "/np/" + portal for portal in
+                                     self.configfs.listdir(tpg + "/np")]:
+                    if self.configfs.exists(path):
+                        self.configfs.rmdir(path)
+                self.configfs.rmdir(tpg)
+            for path in (tpg[:tpg.rindex("/")], backstore):
+                if self.configfs.exists(path):
+                    self.configfs.rmdir(path)
+        except (IOError, OSError) as e:
+            logger.info("Raising Update Config Failed Exception")
+            raise iscsi_exceptions.UpdateConfigFailedException(str(e))
+
+    # Every target is changed on its own, so an image fails without
+    # affecting the others
+    @log
+    def update_mappings(self, create, delete, unmap=False):
+        failed = {}
+        with self.lock:
+            mappings = self.show_mappings()
+            for ceph_img_name in delete:
+                if ceph_img_name not in mappings:
+                    failed[ceph_img_name] = \
+                        iscsi_exceptions.NodeAlreadyUnmappedException()
+                    continue
+                try:
+                    self.__unexport(ceph_img_name)
+                    if unmap:
+                        self.fs.unmap(mappings[ceph_img_name])
+                except (iscsi_exceptions.UpdateConfigFailedException,
+                        file_system_exceptions.UnmapFailedException) as e:
+                    failed[ceph_img_name] = e
+            for ceph_img_name in create:
+                if ceph_img_name in mappings:
+                    failed[ceph_img_name] = \
+                        iscsi_exceptions.NodeAlreadyInUseException()
+                    continue
+                try:
+                    rbd_name = self.fs.map(ceph_img_name)
+                except file_system_exceptions.MapFailedException as e:
+                    failed[ceph_img_name] = e
+                    continue
+                try:
+                    self.__export(ceph_img_name, rbd_name)
+                except iscsi_exceptions.UpdateConfigFailedException as e:
+                    self.fs.unmap(rbd_name)
+                    failed[ceph_img_name] = e
+        return failed
+
+    # The targets whose image is no longer mapped to their device, like
+    # after a reboot, are exported again on a new mapping
+    @log
+    def remake_mappings(self):
+        mapped = self.fs.showmapped()
+        with self.lock:
+            for ceph_img_name, rbd_name in self.show_mappings().items():
+                if mapped.get(ceph_img_name) == rbd_name:
+                    continue
+                self.__unexport(ceph_img_name)
+                if ceph_img_name in mapped:
+                    self.fs.unmap(mapped[ceph_img_name])
+                self.__export(ceph_img_name, self.fs.map(ceph_img_name))
@@ -1,49 +1,55 @@
 #!/usr/bin/python
 import base64
 import io
-import time
+import uuid
+from multiprocessing.pool import ThreadPool
 
+from ims.common.metrics import timed
 from ims.database import *
 from ims.einstein.ceph import *
 from ims.einstein.dnsmasq import *
 from ims.einstein.hil import *
+import ims.einstein.flatten as flatten
+import ims.einstein.warm_pool as warm_pool
+from ims.einstein.backend import Backend
 from ims.einstein.iscsi import *
+from ims.einstein.saga import Saga, get_executor
 from ims.exception import *
 
 logger = create_logger(__name__)
 
 
 class BMI:
+    # BMI can be created with either the credentials tuple passed by the rpc
+    # server or with username, password and project. The shared resources are
+    # taken from the backend keyword argument if given, otherwise a backend
+    # is created for this instance and is shutdown along with it.
     @log
-    def __init__(self, *args):
+    def __init__(self, *args, **kwargs):
+        self.config = config.get()
+        self.db = Database()
         if args.__len__() == 1:
             credentials = args[0]
-            self.config = config.get()
-            self.db = Database()
             self.__process_credentials(credentials)
-            self.hil = HIL(base_url=self.config.haas_url, usr=self.username,
-                           passwd=self.password)
-            self.fs = RBD(self.config.fs[constants.CEPH_CONFIG_SECTION_NAME],
-                          self.config.iscsi_update_password)
-            self.dhcp = DNSMasq()
-            self.iscsi = IET(self.fs, self.config.iscsi_update_password)
         elif args.__len__() == 3:
             username, password, project = args
-            self.config = config.get()
             self.username = username
             self.password = password
             self.project = project
-            self.db = Database()
             self.pid = self.__does_project_exist(self.project)
             self.is_admin = self.__check_admin()
-            self.hil = HIL(base_url=self.config.haas_url, usr=self.username,
-                           passwd=self.password)
-            self.fs = RBD(self.config.fs[constants.CEPH_CONFIG_SECTION_NAME],
-                          self.config.iscsi_update_password)
             logger.debug("Username is %s and Password is %s", self.username,
                          self.password)
-            self.dhcp = DNSMasq()
-            self.iscsi = IET(self.fs, self.config.iscsi_update_password)
+
+        self.backend = kwargs.get('backend')
+        self.owns_backend = self.backend is None
+        if self.owns_backend:
+            self.backend = Backend(self.config)
+        self.hil = HIL(base_url=self.config.haas_url, usr=self.username,
+                       passwd=self.password, session=self.backend.http.get())
+        self.fs = self.backend.fs
+        self.dhcp = self.backend.dhcp
+        self.iscsi = self.backend.iscsi
 
     def __enter__(self):
         return self
@@ -93,6 +99,56 @@ class BMI:
         img_id = ceph_img_name[start_index:]
         return img_id
 
+    # Raises if the image is still being flattened as it has no snapshot to
+    # clone from until the flatten is done
+    @trace
+    def __check_not_flattening(self, img_name):
+        img_id = self.db.image.fetch_id_with_name_from_project(img_name,
+                                                               self.project)
+        if img_id is not None and self.db.flatten.fetch_with_image_id(
+                img_id) is not None:
+            logger.info("Raising Image Flattening Exception for %s", img_name)
+            raise db_exceptions.ImageFlatteningException(img_name)
+
+    # Raises if the image is still being flattened or uploaded
+    @trace
+    def __check_usable(self, img_name):
+        self.__check_not_flattening(img_name)
+        img_id = self.db.image.fetch_id_with_name_from_project(img_name,
+                                                               self.project)
+        if img_id is not None and self.db.upload.fetch_with_image_id(
+                img_id) is not None:
+            logger.info("Raising Image Uploading Exception for %s", img_name)
+            raise db_exceptions.ImageUploadingException(img_name)
+
+    # Flattens the new clone img_name and makes it usable as an image. This
+    # is queued to the flatten scheduler when einstein has one, the image is
+    # marked as flattening until then. Otherwise it is done right away.
+    @log
+    def __complete_clone(self, img_name, parent_ceph_name, parent_snap_name,
+                         remove_parent_snap):
+        ceph_name = self.__get_ceph_image_name(img_name)
+        scheduler = flatten.get()
+        if scheduler is None:
+            flatten.complete_clone(self.fs, ceph_name, parent_ceph_name,
+                                   parent_snap_name, remove_parent_snap)
+            return
+        img_id = self.__extract_id(ceph_name)
+        self.db.flatten.insert(img_id, ceph_name, parent_ceph_name,
+                               parent_snap_name, remove_parent_snap)
+        scheduler.submit(img_id)
+
+    # Runs the batch which creates the clone img_name, the row of the image
+    # is removed if the batch fails as the batch undoes its operations
+    @log
+    def __run_batch(self, img_name, batch):
+        try:
+            batch.run()
+        except FileSystemException:
+            self.db.image.delete_with_name_from_project(img_name,
+                                                        self.project)
+            raise
+
     @trace
     def __process_credentials(self, credentials):
         base64_str, self.project = credentials
@@ -112,6 +168,7 @@ class BMI:
         self.__generate_mac_addr_file(img_name, node_name, mac_addr)
 
     @log
+    @timed(constants.IPXE_FILE_STAGE)
     def __generate_ipxe_file(self, node_name, target_name):
         template_loc = os.path.abspath(
             os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
@@ -134,6 +191,7 @@ class BMI:
             raise RegistrationFailedException(node_name, e.message)
 
     @log
+    @timed(constants.PXELINUX_FILE_STAGE)
     def __generate_mac_addr_file(self, img_name, node_name, mac_addr):
         template_loc = os.path.abspath(
             os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
@@ -181,6 +239,34 @@ class BMI:
         return {constants.STATUS_CODE_KEY: ex.status_code,
                 constants.MESSAGE_KEY: str(ex)}
 
+    # Runs func on every item using a pool of threads and returns a dict
+    # of item to either the return value or the BMIException that was raised
+    @trace
+    def __run_parallel(self, func, items):
+        def run(item):
+            try:
+                return item, func(item)
+            except BMIException as e:
+                logger.exception('')
+                return item, e
+
+        pool = ThreadPool(min(self.config.workers, max(len(items), 1)))
+        try:
+            return dict(pool.map(run, items))
+        finally:
+            pool.close()
+            pool.join()
+
+    # Adds the error of every node whose result is an exception to the report
+    # and returns the nodes that succeeded
+    @trace
+    def __record_failures(self, report, node_names, results):
+        for node_name in node_names:
+            if isinstance(results[node_name], BMIException):
+                report[node_name] = self.__return_error(results[node_name])
+        return [node_name for node_name in node_names if
+                node_name not in report]
+
     # A custom function which is wrapper around only success code that
     # we are creating.
     @log
@@ -190,135 +276,566 @@ class BMI:
 
     @log
     def shutdown(self):
-        self.fs.tear_down()
+        if self.owns_backend:
+            self.backend.shutdown()
         self.db.close()
 
+    # Returns a new BMI with the same credentials, used by the sagas as this
+    # BMI will have been shutdown by the time the rollback runs
+    @trace
+    def __new_session(self):
+        return BMI(self.username, self.password, self.project,
+                   backend=None if self.owns_backend else self.backend)
+
+    # Compensating actions for the steps of provision and deprovision
+    # They are run by the rollback executor on a new BMI
+    @log
+    def __undo_attach(self, node_name, network, nic):
+        self.hil.wait_for_network(node_name, nic, network, True)
+        self.hil.detach_node_from_project_network(node_name, network, nic)
+
+    @log
+    def __undo_detach(self, node_name, network, nic):
+        self.hil.wait_for_network(node_name, nic, network, False)
+        self.hil.attach_node_to_project_network(node_name, network, nic)
+
+    @log
+    def __undo_insert(self, node_name):
+        self.db.image.delete_with_name_from_project(node_name, self.project)
+
+    # Removes the row of the claimed clone under whichever name it has, the
+    # rename to the node may not have happened and the node may have another
+    # image already
+    @log
+    def __undo_claim(self, pooled_name, node_name, ceph_img_name):
+        for name in (pooled_name, node_name):
+            img_id = self.db.image.fetch_id_with_name_from_project(
+                name, self.project)
+            if img_id is not None and \
+                    str(img_id) == self.__extract_id(ceph_img_name):
+                self.db.image.delete_with_name_from_project(name,
+                                                            self.project)
+
+    @log
+    def __undo_delete(self, node_name, parent_id, img_id):
+        self.db.image.insert(node_name, self.pid, parent_id, id=img_id)
+
+    @log
+    def __undo_clone(self, ceph_img_name):
+        self.fs.remove(ceph_img_name)
+
+    @log
+    def __undo_create_mapping(self, ceph_img_name):
+        self.iscsi.delete_mapping(ceph_img_name)
+
+    @log
+    def __undo_delete_mapping(self, ceph_img_name):
+        self.iscsi.create_mapping(ceph_img_name)
+
+    # Records the last step completed on the node, see recover_node
+    @trace
+    def __set_state(self, node_name, state, ceph_name=None):
+        self.db.node_state.update_state(self.project, node_name, state,
+                                        ceph_name)
+
+    # Same as __set_state for many nodes, a failure is only logged as the
+    # nodes can still be recovered from their previous state
+    @trace
+    def __set_states(self, node_names, state):
+        for node_name in node_names:
+            try:
+                self.__set_state(node_name, state)
+            except DBException:
+                logger.exception('')
+
+    # Forgets the node once its operation has finished or been rolled back
+    @log
+    def __clear_state(self, node_name):
+        self.db.node_state.delete_with_node_from_project(self.project,
+                                                         node_name)
+
+    # Same as __clear_state for nodes whose operation is over, a failure is
+    # only logged as recovering such a node does not undo anything
+    @trace
+    def __clear_states(self, node_names):
+        for node_name in node_names:
+            try:
+                self.__clear_state(node_name)
+            except DBException:
+                logger.exception('')
+
+    # Removes the files created by register if they exist
+    @log
+    def __unregister(self, node_name):
+        mac_addr = "01-" + self.hil.get_node_mac_addr(node_name).replace(":",
+                                                                         "-")
+        for path in [self.config.ipxe_loc + node_name + ".ipxe",
+                     self.config.pxelinux_loc + mac_addr]:
+            if os.path.exists(path):
+                os.remove(path)
+
     # Provisions from HaaS and Boots the given node with given image
+    # Every step records its compensating action in a saga which is rolled
+    # back in the background if a later step fails
     @log
+    @timed(constants.PROVISION_COMMAND)
     def provision(self, node_name, img_name, network, nic):
+        saga = Saga(constants.PROVISION_COMMAND, self.__new_session,
+                    BMI.__clear_state, node_name)
+        try:
+            self.__check_usable(img_name)
+            self.db.node_state.insert(self.project, node_name,
+                                      constants.PROVISION_COMMAND, network,
+                                      nic, img_name)
+        except BMIException as e:
+            logger.exception('')
+            return self.__return_error(e)
         try:
             self.hil.attach_node_to_project_network(node_name, network, nic)
+            saga.add(constants.HIL_STEP, BMI.__undo_attach, node_name,
+                     network, nic)
+            self.__set_state(node_name, constants.NODE_ATTACHED_STATE)
 
-            parent_id = self.db.image.fetch_id_with_name_from_project(img_name,
-                                                                      self.project)
-            self.db.image.insert(node_name, self.pid, parent_id)
-            clone_ceph_name = self.__get_ceph_image_name(node_name)
-            ceph_img_name = self.__get_ceph_image_name(img_name)
-            self.fs.clone(ceph_img_name, constants.DEFAULT_SNAPSHOT_NAME,
-                          clone_ceph_name)
-            ceph_config = self.config.fs[constants.CEPH_CONFIG_SECTION_NAME]
-            logger.debug("Contents of ceph_config = %s", str(ceph_config))
-            self.iscsi.create_mapping(clone_ceph_name)
-            logger.info("The create command was executed successfully")
+            pool = warm_pool.get()
+            pooled_name = None
+            if pool is not None:
+                pooled_name = pool.claim(self.db, self.project, img_name)
+
+            if pooled_name is not None:
+                # The pooled clone is already cloned, mapped and exported so
+                # it only needs to be renamed to the node. It is out of the
+                # pool once claimed, so it is rolled back from here on even
+                # if the rename fails.
+                clone_ceph_name = self.__get_ceph_image_name(pooled_name)
+                saga.add(constants.DB_STEP, BMI.__undo_claim, pooled_name,
+                         node_name, clone_ceph_name)
+                saga.add(constants.RBD_STEP, BMI.__undo_clone,
+                         clone_ceph_name)
+                saga.add(constants.ISCSI_STEP, BMI.__undo_create_mapping,
+                         clone_ceph_name)
+                self.db.image.move_image(self.project, pooled_name, self.pid,
+                                         node_name)
+                self.__set_state(node_name, constants.NODE_EXPORTED_STATE,
+                                 clone_ceph_name)
+                logger.info("Claimed %s from the warm pool", pooled_name)
+            else:
+                parent_id = self.db.image.fetch_id_with_name_from_project(
+                    img_name, self.project)
+                self.db.image.insert(node_name, self.pid, parent_id)
+                saga.add(constants.DB_STEP, BMI.__undo_insert, node_name)
+
+                clone_ceph_name = self.__get_ceph_image_name(node_name)
+                self.__set_state(node_name, constants.NODE_ATTACHED_STATE,
+                                 clone_ceph_name)
+                ceph_img_name = self.__get_ceph_image_name(img_name)
+                self.fs.clone(ceph_img_name, constants.DEFAULT_SNAPSHOT_NAME,
+                              clone_ceph_name)
+                saga.add(constants.RBD_STEP, BMI.__undo_clone,
+                         clone_ceph_name)
+                self.__set_state(node_name, constants.NODE_CLONED_STATE)
+
+                ceph_config = self.config.fs[
+                    constants.CEPH_CONFIG_SECTION_NAME]
+                logger.debug("Contents of ceph_config = %s", str(ceph_config))
+                self.iscsi.create_mapping(clone_ceph_name)
+                saga.add(constants.ISCSI_STEP, BMI.__undo_create_mapping,
+                         clone_ceph_name)
+                self.__set_state(node_name, constants.NODE_EXPORTED_STATE)
+                logger.info("The create command was executed successfully")
+
+            # Added before registering as register can fail after writing
+            # one of the files
+            saga.add(constants.REGISTER_STEP, BMI.__unregister, node_name)
             self.__register(node_name, img_name, clone_ceph_name)
-            return self.__return_success(True)
 
-        except ISCSIException as e:
+        except BMIException as e:
             # Message is being handled by custom formatter
             logger.exception('')
-            clone_ceph_name = self.__get_ceph_image_name(node_name)
-            self.fs.remove(clone_ceph_name)
-            self.db.image.delete_with_name_from_project(node_name, self.project)
-            time.sleep(constants.HAAS_CALL_TIMEOUT)
-            self.hil.detach_node_from_project_network(node_name, network,
-                                                      nic)
+            get_executor().submit(saga)
             return self.__return_error(e)
 
-        except FileSystemException as e:
-            # Message is being handled by custom formatter
-            logger.exception('')
-            self.db.image.delete_with_name_from_project(node_name, self.project)
-            time.sleep(constants.HAAS_CALL_TIMEOUT)
-            self.hil.detach_node_from_project_network(node_name, network,
-                                                      nic)
-            return self.__return_error(e)
+        self.__clear_states([node_name])
+        return self.__return_success(True)
+
+    # Provisions all the given nodes with the same image. The clones are
+    # created concurrently and all of them are exported with one iscsi target
+    # restart. Returns a dict with the result of each node.
+    @log
+    def provision_many(self, nodes, img_name, network, nic):
+        if isinstance(nodes, basestring):
+            nodes = [node.strip() for node in
+                     nodes.split(constants.NODES_SEPARATOR) if node.strip()]
+        report = {}
+        sagas = dict((node_name, Saga(constants.PROVISION_COMMAND,
+                                      self.__new_session, BMI.__clear_state,
+                                      node_name))
+                     for node_name in nodes)
+
+        def attach(node_name):
+            self.hil.attach_node_to_project_network(node_name, network, nic)
+            sagas[node_name].add(constants.HIL_STEP, BMI.__undo_attach,
+                                 node_name, network, nic)
+
+        def clone(node_name):
+            self.fs.clone(ceph_img_name, constants.DEFAULT_SNAPSHOT_NAME,
+                          clone_ceph_names[node_name])
+            sagas[node_name].add(constants.RBD_STEP, BMI.__undo_clone,
+                                 clone_ceph_names[node_name])
+
+        def register(node_name):
+            sagas[node_name].add(constants.REGISTER_STEP, BMI.__unregister,
+                                 node_name)
+            self.__register(node_name, img_name, clone_ceph_names[node_name])
+
+        try:
+            self.__check_usable(img_name)
+            ceph_img_name = self.__get_ceph_image_name(img_name)
+            parent_id = self.db.image.fetch_id_with_name_from_project(img_name,
+                                                                      self.project)
         except DBException as e:
-            # Message is being handled by custom formatter
             logger.exception('')
-            time.sleep(constants.HAAS_CALL_TIMEOUT)
-            self.hil.detach_node_from_project_network(node_name, network,
-                                                      nic)
             return self.__return_error(e)
-        except HaaSException as e:
-            # Message is being handled by custom formatter
+
+        started = []
+        for node_name in nodes:
+            try:
+                self.db.node_state.insert(self.project, node_name,
+                                          constants.PROVISION_COMMAND, network,
+                                          nic, img_name)
+                started.append(node_name)
+            except DBException as e:
+                logger.exception('')
+                report[node_name] = self.__return_error(e)
+
+        attached = self.__record_failures(report, started,
+                                          self.__run_parallel(attach, started))
+
+        inserted = []
+        clone_ceph_names = {}
+        for node_name in attached:
+            try:
+                self.__set_state(node_name, constants.NODE_ATTACHED_STATE)
+                self.db.image.insert(node_name, self.pid, parent_id)
+                sagas[node_name].add(constants.DB_STEP,
+                                     BMI.__undo_insert, node_name)
+                clone_ceph_names[node_name] = self.__get_ceph_image_name(
+                    node_name)
+                self.__set_state(node_name, constants.NODE_ATTACHED_STATE,
+                                 clone_ceph_names[node_name])
+                inserted.append(node_name)
+            except DBException as e:
+                logger.exception('')
+                report[node_name] = self.__return_error(e)
+
+        cloned = self.__record_failures(report, inserted,
+                                        self.__run_parallel(clone, inserted))
+        self.__set_states(cloned, constants.NODE_CLONED_STATE)
+
+        try:
+            failed_mappings = self.iscsi.create_mappings(
+                [clone_ceph_names[node_name] for node_name in cloned])
+        except ISCSIException as e:
+            # None of the targets can be trusted, so every cloned node is
+            # failed and rolled back
+            logger.exception('')
+            failed_mappings = dict((clone_ceph_names[node_name], e) for
+                                   node_name in cloned)
+        exported = []
+        for node_name in cloned:
+            e = failed_mappings.get(clone_ceph_names[node_name])
+            if e is not None:
+                report[node_name] = self.__return_error(e)
+            else:
+                sagas[node_name].add(constants.ISCSI_STEP,
+                                     BMI.__undo_create_mapping,
+                                     clone_ceph_names[node_name])
+                exported.append(node_name)
+        self.__set_states(exported, constants.NODE_EXPORTED_STATE)
+        logger.info("The create command was executed successfully")
+
+        registered = self.__record_failures(
+            report, exported, self.__run_parallel(register, exported))
+        self.__set_states(registered, constants.NODE_REGISTERED_STATE)
+
+        # Rolling back everything that was done for the nodes that failed
+        for node_name in started:
+            if node_name not in registered:
+                get_executor().submit(sagas[node_name])
+
+        self.__clear_states(registered)
+        for node_name in registered:
+            report[node_name] = self.__return_success(True)
+        return self.__return_success(report)
+
+    # Tops up the warm pool of img_name to size clones which are cloned,
+    # mapped and exported. The clones are inserted under generated names and
+    # are renamed to the node when provision claims them.
+    @log
+    def fill_pool(self, img_name, size):
+        try:
+            golden_id = self.db.image.fetch_id_with_name_from_project(
+                img_name, self.project)
+            if golden_id is None:
+                raise db_exceptions.ImageNotFoundException(img_name)
+            self.__check_usable(img_name)
+            ceph_img_name = self.__get_ceph_image_name(img_name)
+            count = size - self.db.pool.count_with_golden_id(golden_id)
+
+            clone_ceph_names = {}
+            for i in range(count):
+                name = constants.POOL_IMAGE_PREFIX + uuid.uuid4().hex
+                self.db.image.insert(name, self.pid, golden_id)
+                clone_ceph_names[name] = self.__get_ceph_image_name(name)
+
+            def clone(name):
+                self.fs.clone(ceph_img_name, constants.DEFAULT_SNAPSHOT_NAME,
+                              clone_ceph_names[name])
+
+            results = self.__run_parallel(clone, clone_ceph_names.keys())
+            cloned = [name for name in clone_ceph_names if
+                      not isinstance(results[name], BMIException)]
+            failed_mappings = self.iscsi.create_mappings(
+                [clone_ceph_names[name] for name in cloned])
+
+            ready = 0
+            for name, clone_ceph_name in clone_ceph_names.items():
+                if name in cloned and clone_ceph_name not in failed_mappings:
+                    self.db.pool.insert(self.__extract_id(clone_ceph_name),
+                                        golden_id)
+                    ready += 1
+                    continue
+                try:
+                    if name in cloned:
+                        self.fs.remove(clone_ceph_name)
+                    self.db.image.delete_with_name_from_project(name,
+                                                                self.project)
+                except BMIException:
+                    logger.exception('')
+            return self.__return_success(ready)
+        except (DBException, FileSystemException, ISCSIException) as e:
             logger.exception('')
             return self.__return_error(e)
 
     # This is for detach a node and removing it from iscsi
     # and destroying its image
     @log
+    @timed(constants.DEPROVISION_COMMAND)
     def deprovision(self, node_name, network, nic):
-        ceph_img_name = None
+        saga = Saga(constants.DEPROVISION_COMMAND, self.__new_session,
+                    BMI.__clear_state, node_name)
+        try:
+            ceph_img_name = self.__get_ceph_image_name(node_name)
+            self.db.node_state.insert(self.project, node_name,
+                                      constants.DEPROVISION_COMMAND, network,
+                                      nic, ceph_name=ceph_img_name)
+        except BMIException as e:
+            logger.exception('')
+            return self.__return_error(e)
         try:
             self.hil.detach_node_from_project_network(node_name,
                                                       network, nic)
-            ceph_img_name = self.__get_ceph_image_name(node_name)
+            saga.add(constants.HIL_STEP, BMI.__undo_detach, node_name,
+                     network, nic)
+            self.__set_state(node_name, constants.NODE_DETACHED_STATE)
+
+            parent_id = self.db.image.fetch_parent_id(self.project, node_name)
             self.db.image.delete_with_name_from_project(node_name, self.project)
+            saga.add(constants.DB_STEP, BMI.__undo_delete, node_name,
+                     parent_id, self.__extract_id(ceph_img_name))
+
             ceph_config = self.config.fs[constants.CEPH_CONFIG_SECTION_NAME]
             logger.debug("Contents of ceph+config = %s", str(ceph_config))
             self.iscsi.delete_mapping(ceph_img_name)
+            saga.add(constants.ISCSI_STEP, BMI.__undo_delete_mapping,
+                     ceph_img_name)
+            self.__set_state(node_name, constants.NODE_UNEXPORTED_STATE)
             logger.info("The delete command was executed successfully")
+
             ret = self.fs.remove(str(ceph_img_name).encode("utf-8"))
-            return self.__return_success(ret)
 
-        except FileSystemException as e:
+        except BMIException as e:
             logger.exception('')
-            self.iscsi.create_mapping(ceph_img_name)
-            parent_name = self.fs.get_parent_info(ceph_img_name)[1]
-
-            parent_id = self.db.image.fetch_id_with_name_from_project(
-                parent_name,
-                self.project)
-            self.db.image.insert(node_name, self.pid, parent_id,
-                                 id=self.__extract_id(ceph_img_name))
-            time.sleep(constants.HAAS_CALL_TIMEOUT)
-            self.hil.attach_node_to_project_network(node_name, network, nic)
+            get_executor().submit(saga)
             return self.__return_error(e)
-        except ISCSIException as e:
+
+        self.__clear_states([node_name])
+        return self.__return_success(ret)
+
+    # Deprovisions every node of the project. The nodes are detached
+    # concurrently, their targets are removed with one iscsi target restart
+    # and the clones are unmapped and removed concurrently. Every node is
+    # recorded as being deprovisioned, so the nodes with an operation still
+    # in progress are skipped and recovery finishes the others if einstein
+    # goes down. The image rows of the nodes that failed are kept and the
+    # nodes already detached are not detached again, so that the release can
+    # be retried. Returns a dict with the result of each node.
+    @log
+    @timed(constants.RELEASE_PROJECT_COMMAND)
+    def release_project(self, network, nic):
+        report = {}
+
+        def detach(node_name):
+            self.__detach_if_attached(node_name, network, nic)
+
+        def destroy(node_name):
+            ceph_img_name = ceph_img_names[node_name]
+            if ceph_img_name in rbd_names:
+                self.fs.unmap(rbd_names[ceph_img_name])
+            self.fs.remove(ceph_img_name)
+
+        try:
+            nodes = [node_name for node_name, parent_name in
+                     self.db.image.fetch_clones_from_project(self.project)]
+            ceph_img_names = dict(
+                (node_name, self.__get_ceph_image_name(node_name)) for
+                node_name in nodes)
+        except DBException as e:
             logger.exception('')
-            parent_name = self.fs.get_parent_info(ceph_img_name)[1]
-            parent_id = self.db.image.fetch_id_with_name_from_project(
-                parent_name,
-                self.project)
-            self.db.image.insert(node_name, self.pid, parent_id,
-                                 id=self.__extract_id(ceph_img_name))
-            time.sleep(constants.HAAS_CALL_TIMEOUT)
-            self.hil.attach_node_to_project_network(node_name, network, nic)
             return self.__return_error(e)
-        except DBException as e:
+
+        started = []
+        for node_name in nodes:
+            try:
+                self.db.node_state.insert(self.project, node_name,
+                                          constants.DEPROVISION_COMMAND,
+                                          network, nic,
+                                          ceph_name=ceph_img_names[node_name])
+                started.append(node_name)
+            except DBException as e:
+                logger.exception('')
+                report[node_name] = self.__return_error(e)
+
+        detached = self.__record_failures(report, started,
+                                          self.__run_parallel(detach, started))
+        self.__set_states(detached, constants.NODE_DETACHED_STATE)
+
+        try:
+            failed_mappings = self.iscsi.delete_mappings(
+                [ceph_img_names[node_name] for node_name in detached])
+            rbd_names = self.fs.showmapped()
+        except (ISCSIException, FileSystemException) as e:
             logger.exception('')
-            time.sleep(constants.HAAS_CALL_TIMEOUT)
-            self.hil.attach_node_to_project_network(node_name, network, nic)
+            self.__clear_states(started)
             return self.__return_error(e)
-        except HaaSException as e:
+        unexported = []
+        for node_name in detached:
+            e = failed_mappings.get(ceph_img_names[node_name])
+            # A node that was never exported only needs its clone removed
+            if e is not None and not isinstance(
+                    e, iscsi_exceptions.NodeAlreadyUnmappedException):
+                report[node_name] = self.__return_error(e)
+            else:
+                unexported.append(node_name)
+        self.__set_states(unexported, constants.NODE_UNEXPORTED_STATE)
+
+        destroyed = self.__record_failures(
+            report, unexported, self.__run_parallel(destroy, unexported))
+
+        for node_name in destroyed:
+            try:
+                self.db.image.delete_with_name_from_project(node_name,
+                                                            self.project)
+                report[node_name] = self.__return_success(True)
+            except DBException as e:
+                logger.exception('')
+                report[node_name] = self.__return_error(e)
+        # The nodes that failed are left where the release can be retried
+        # from, so their states are cleared as well
+        self.__clear_states(started)
+        return self.__return_success(report)
+
+    # Resumes or rolls back the operation that was in progress on the node
+    # when einstein went down. A provision that had exported the node is
+    # resumed by registering it and any other provision is rolled back, a
+    # deprovision is always finished. Every step checks what is actually
+    # there so that recovery can be run again if it is interrupted too. The
+    # clone is removed before HIL is called so that it is cleaned up even if
+    # HIL cannot be reached.
+    @log
+    def recover_node(self, node_name):
+        try:
+            state = self.db.node_state.fetch_with_node_from_project(
+                self.project, node_name)
+            if state is None:
+                return self.__return_success(False)
+            if state["operation"] == constants.DEPROVISION_COMMAND:
+                self.__remove_clone(node_name, state["ceph_name"])
+                self.__detach_if_attached(node_name, state["network"],
+                                          state["nic"])
+            elif state["state"] == constants.NODE_EXPORTED_STATE and \
+                    self.__resume_provision(state):
+                logger.info("Resumed provision of %s", node_name)
+            elif state["state"] != constants.NODE_REGISTERED_STATE:
+                if state["ceph_name"] is not None:
+                    self.__remove_clone(node_name, state["ceph_name"])
+                if state["state"] == constants.NODE_EXPORTED_STATE:
+                    self.__unregister(node_name)
+                # The node may have been attached even if the state was not
+                # recorded yet, so HIL is checked in every state
+                self.__detach_if_attached(node_name, state["network"],
+                                          state["nic"])
+            self.__clear_state(node_name)
+            return self.__return_success(True)
+        except BMIException as e:
             logger.exception('')
             return self.__return_error(e)
 
+    # Registers the exported node, returns whether it succeeded
+    @trace
+    def __resume_provision(self, state):
+        try:
+            self.__register(state["node"], state["img"], state["ceph_name"])
+            return True
+        except BMIException:
+            logger.exception('')
+            return False
+
+    @trace
+    def __detach_if_attached(self, node_name, network, nic):
+        if network in self.hil.get_node_networks(node_name, nic).values():
+            self.hil.detach_node_from_project_network(node_name, network, nic)
+
+    # Removes whatever exists of the clone of the node, its target, its
+    # mapping, the ceph image and the image row
+    @trace
+    def __remove_clone(self, node_name, ceph_name):
+        ceph_name = str(ceph_name)
+        if ceph_name in self.iscsi.show_mappings():
+            self.iscsi.delete_mapping(ceph_name)
+        else:
+            rbd_names = self.fs.showmapped()
+            if ceph_name in rbd_names:
+                self.fs.unmap(rbd_names[ceph_name])
+        if ceph_name in self.fs.list_images():
+            self.fs.remove(ceph_name)
+        # The row is only removed if it is the one the state was recorded for
+        img_id = self.db.image.fetch_id_with_name_from_project(node_name,
+                                                               self.project)
+        if img_id is not None and str(img_id) == self.__extract_id(ceph_name):
+            self.db.image.delete_with_name_from_project(node_name,
+                                                        self.project)
+
     # Creates snapshot for the given image with snap_name as given name
     # fs_obj will be populated by decorator
     @log
+    @timed(constants.CREATE_SNAPSHOT_COMMAND)
     def create_snapshot(self, node_name, snap_name):
         try:
             self.hil.validate_project(self.project)
 
             ceph_img_name = self.__get_ceph_image_name(node_name)
 
-            self.fs.snap_image(ceph_img_name, constants.DEFAULT_SNAPSHOT_NAME)
-            self.fs.snap_protect(ceph_img_name, constants.DEFAULT_SNAPSHOT_NAME)
             parent_id = self.db.image.fetch_parent_id(self.project, node_name)
             self.db.image.insert(snap_name, self.pid, parent_id,
                                  is_snapshot=True)
             snap_ceph_name = self.__get_ceph_image_name(snap_name)
-            self.fs.clone(ceph_img_name, constants.DEFAULT_SNAPSHOT_NAME,
-                          snap_ceph_name)
-            self.fs.flatten(snap_ceph_name)
-            self.fs.snap_image(snap_ceph_name, constants.DEFAULT_SNAPSHOT_NAME)
-            self.fs.snap_protect(snap_ceph_name,
-                                 constants.DEFAULT_SNAPSHOT_NAME)
-            self.fs.snap_unprotect(ceph_img_name,
-                                   constants.DEFAULT_SNAPSHOT_NAME)
-            self.fs.remove_snapshot(ceph_img_name,
-                                    constants.DEFAULT_SNAPSHOT_NAME)
+            self.__run_batch(snap_name, self.fs.batch().snap_image(
+                ceph_img_name, constants.DEFAULT_SNAPSHOT_NAME).snap_protect(
+                ceph_img_name, constants.DEFAULT_SNAPSHOT_NAME).clone(
+                ceph_img_name, constants.DEFAULT_SNAPSHOT_NAME,
+                snap_ceph_name))
+            self.__complete_clone(snap_name, ceph_img_name,
+                                  constants.DEFAULT_SNAPSHOT_NAME, True)
             return self.__return_success(True)
 
         except (HaaSException, DBException, FileSystemException) as e:
@@ -339,32 +856,134 @@ class BMI:
             logger.exception('')
             return self.__return_error(e)
 
+    # Returns the status and result of the job if it belongs to the project,
+    # the results can hold the nodes and images of the project so the
+    # credentials are checked with HIL first
+    @log
+    def get_job(self, job_id):
+        try:
+            self.hil.validate_project(self.project)
+            return self.__return_success(
+                self.db.job.fetch_with_id_from_project(job_id, self.project))
+        except (HaaSException, DBException) as e:
+            logger.exception('')
+            return self.__return_error(e)
+
+    # Lists the images of the project which are being flattened along with
+    # the status of the flatten and the percent of the image flattened
+    @log
+    def list_flattens(self):
+        try:
+            self.hil.validate_project(self.project)
+            scheduler = flatten.get()
+            rows = []
+            for img_id, img_name, status in self.db.flatten.fetch_from_project(
+                    self.project):
+                progress = None
+                if scheduler is not None:
+                    progress = scheduler.get_progress(img_id)
+                rows.append([img_name, status, round(progress or 0, 1)])
+            return self.__return_success(rows)
+
+        except (HaaSException, DBException) as e:
+            logger.exception('')
+            return self.__return_error(e)
+
+    # Cancels the flatten of the image, the image is removed once the
+    # flatten has stopped
+    @log
+    def cancel_flatten(self, img_name):
+        try:
+            self.hil.validate_project(self.project)
+            img_id = self.db.image.fetch_id_with_name_from_project(
+                img_name, self.project)
+            scheduler = flatten.get()
+            if img_id is None or scheduler is None or \
+                    self.db.flatten.fetch_with_image_id(img_id) is None:
+                logger.info("Raising Image Not Flattening Exception for %s",
+                            img_name)
+                raise db_exceptions.ImageNotFlatteningException(img_name)
+            scheduler.cancel(self.db, img_id)
+            return self.__return_success(True)
+
+        except (HaaSException, DBException) as e:
+            logger.exception('')
+            return self.__return_error(e)
+
     # Removes snapshot snap_name for the given image img_name
     # fs_obj will be populated by decorator
     @log
     def remove_image(self, img_name):
         try:
             self.hil.validate_project(self.project)
+            self.__check_not_flattening(img_name)
+            # The pooled clones would keep the image from being removed
+            self.__drain_pool(img_name)
             ceph_img_name = self.__get_ceph_image_name(img_name)
+            img_id = self.db.image.fetch_id_with_name_from_project(
+                img_name, self.project)
 
-            self.fs.snap_unprotect(ceph_img_name,
-                                   constants.DEFAULT_SNAPSHOT_NAME)
-            self.fs.remove_snapshot(ceph_img_name,
-                                    constants.DEFAULT_SNAPSHOT_NAME)
+            # An image which is being uploaded has no snapshot yet and its
+            # upload is dropped along with it
+            if self.db.upload.fetch_with_image_id(img_id) is None:
+                self.fs.snap_unprotect(ceph_img_name,
+                                       constants.DEFAULT_SNAPSHOT_NAME)
+                self.fs.remove_snapshot(ceph_img_name,
+                                        constants.DEFAULT_SNAPSHOT_NAME)
             self.fs.remove(ceph_img_name)
+            self.db.upload.delete_with_image_id(img_id)
             self.db.image.delete_with_name_from_project(img_name, self.project)
             return self.__return_success(True)
-        except (HaaSException, DBException, FileSystemException) as e:
+        except (HaaSException, DBException, FileSystemException,
+                ISCSIException) as e:
             logger.exception('')
             return self.__return_error(e)
 
-    # Lists the images for the project which includes the snapshot
+    # Removes the ready clones of the image from the warm pool along with
+    # their targets and ceph images, returns how many were removed. The pool
+    # of an image in the pool config is filled again by the refiller.
+    @log
+    def drain_pool(self, img_name):
+        try:
+            self.hil.validate_project(self.project)
+            return self.__return_success(self.__drain_pool(img_name))
+        except (HaaSException, DBException, FileSystemException,
+                ISCSIException) as e:
+            logger.exception('')
+            return self.__return_error(e)
+
+    # A clone that cannot be removed is put back in the pool
+    @trace
+    def __drain_pool(self, img_name):
+        golden_id = self.db.image.fetch_id_with_name_from_project(
+            img_name, self.project)
+        drained = 0
+        if golden_id is None:
+            return drained
+        while True:
+            image_id = self.db.pool.claim(golden_id)
+            if image_id is None:
+                return drained
+            name = self.db.image.fetch_name_with_id(image_id)
+            try:
+                self.__remove_clone(name, self.__get_ceph_image_name(name))
+            except BMIException:
+                self.db.pool.insert(image_id, golden_id)
+                raise
+            drained += 1
+
+    # Lists the images for the project which includes the snapshot, it
+    # returns the name, provisioned bytes and used bytes of every image of
+    # the project, the bytes are as last measured by the usage refresher and
+    # are None until an image is measured
     @log
     def list_images(self):
         try:
             self.hil.validate_project(self.project)
             names = self.db.image.fetch_images_from_project(self.project)
-            return self.__return_success(names)
+            usages = self.db.usage.fetch_from_project(self.project)
+            return self.__return_success(
+                [[name] + usages.get(name, [None, None]) for name in names])
 
         except (HaaSException, DBException) as e:
             logger.exception('')
@@ -398,20 +1017,15 @@ class BMI:
         try:
             ceph_img_name = str(img)
 
-            self.fs.snap_image(ceph_img_name, constants.DEFAULT_SNAPSHOT_NAME)
-            self.fs.snap_protect(ceph_img_name, constants.DEFAULT_SNAPSHOT_NAME)
             self.db.image.insert(ceph_img_name, self.pid)
             snap_ceph_name = self.__get_ceph_image_name(ceph_img_name)
-            self.fs.clone(ceph_img_name, constants.DEFAULT_SNAPSHOT_NAME,
-                          snap_ceph_name)
-            self.fs.flatten(snap_ceph_name)
-            self.fs.snap_image(snap_ceph_name, constants.DEFAULT_SNAPSHOT_NAME)
-            self.fs.snap_protect(snap_ceph_name,
-                                 constants.DEFAULT_SNAPSHOT_NAME)
-            self.fs.snap_unprotect(ceph_img_name,
-                                   constants.DEFAULT_SNAPSHOT_NAME)
-            self.fs.remove_snapshot(ceph_img_name,
-                                    constants.DEFAULT_SNAPSHOT_NAME)
+            self.__run_batch(ceph_img_name, self.fs.batch().snap_image(
+                ceph_img_name, constants.DEFAULT_SNAPSHOT_NAME).snap_protect(
+                ceph_img_name, constants.DEFAULT_SNAPSHOT_NAME).clone(
+                ceph_img_name, constants.DEFAULT_SNAPSHOT_NAME,
+                snap_ceph_name))
+            self.__complete_clone(ceph_img_name, ceph_img_name,
+                                  constants.DEFAULT_SNAPSHOT_NAME, True)
             return self.__return_success(True)
         except (DBException, FileSystemException) as e:
             logger.exception('')
@@ -422,21 +1036,121 @@ class BMI:
         try:
             ceph_img_name = str(img)
 
-            if protect:
-                self.fs.snap_protect(ceph_img_name, snap_name)
             self.db.image.insert(ceph_img_name, self.pid)
             snap_ceph_name = self.__get_ceph_image_name(ceph_img_name)
-            self.fs.clone(ceph_img_name, snap_name,
-                          snap_ceph_name)
-            self.fs.flatten(snap_ceph_name)
-            self.fs.snap_image(snap_ceph_name, constants.DEFAULT_SNAPSHOT_NAME)
-            self.fs.snap_protect(snap_ceph_name,
-                                 constants.DEFAULT_SNAPSHOT_NAME)
+            batch = self.fs.batch()
+            # protect is passed as a string when called through rest
+            if str(protect) == 'True':
+                batch.snap_protect(ceph_img_name, snap_name)
+            self.__run_batch(ceph_img_name,
+                             batch.clone(ceph_img_name, snap_name,
+                                         snap_ceph_name))
+            self.__complete_clone(ceph_img_name, ceph_img_name, snap_name,
+                                  False)
             return self.__return_success(True)
         except (DBException, FileSystemException) as e:
             logger.exception('')
             return self.__return_error(e)
 
+    # Starts the upload of an image of size bytes to the project or resumes
+    # the interrupted upload of it. Returns the offset from which the data
+    # has to be sent.
+    @log
+    def start_upload(self, img_name, size):
+        try:
+            self.hil.validate_project(self.project)
+            if int(size) <= 0:
+                raise file_system_exceptions.ArgumentsOutOfRangeException()
+            img_id = self.db.image.fetch_id_with_name_from_project(
+                img_name, self.project)
+            if img_id is None:
+                self.db.image.insert(img_name, self.pid)
+                img_id = self.db.image.fetch_id_with_name_from_project(
+                    img_name, self.project)
+                self.db.upload.insert(img_id, int(size))
+                upload = self.db.upload.fetch_with_image_id(img_id)
+            else:
+                upload = self.db.upload.fetch_with_image_id(img_id)
+                if upload is None:
+                    raise file_system_exceptions.ImageExistsException(
+                        img_name)
+
+            # Also done when resuming from 0 as einstein could have gone
+            # down before the image was created
+            if upload["offset"] == 0:
+                try:
+                    self.fs.create_image(self.__get_ceph_image_name(img_name),
+                                         upload["size"])
+                except file_system_exceptions.ImageExistsException:
+                    pass
+            return self.__return_success(upload["offset"])
+        except (HaaSException, DBException, FileSystemException) as e:
+            logger.exception('')
+            return self.__return_error(e)
+
+    # Writes the base64 encoded data of the upload at offset, which has to be
+    # where the upload stopped. The offset is checkpointed once the data is
+    # written and the image is snapshotted and becomes usable once its last
+    # byte is. Returns the offset of the next chunk.
+    @log
+    def upload_chunk(self, img_name, offset, data):
+        try:
+            img_id = self.db.image.fetch_id_with_name_from_project(
+                img_name, self.project)
+            upload = None
+            if img_id is not None:
+                upload = self.db.upload.fetch_with_image_id(img_id)
+            if upload is None:
+                raise db_exceptions.ImageNotUploadingException(img_name)
+            if int(offset) != upload["offset"]:
+                raise db_exceptions.UploadOffsetException(img_name,
+                                                          upload["offset"])
+            data = base64.b64decode(data)
+            if upload["offset"] + len(data) > upload["size"]:
+                raise file_system_exceptions.ArgumentsOutOfRangeException()
+
+            ceph_img_name = self.__get_ceph_image_name(img_name)
+            self.fs.write_blocks(ceph_img_name, data, upload["offset"])
+            offset = upload["offset"] + len(data)
+            if offset == upload["size"]:
+                self.fs.batch().snap_image(
+                    ceph_img_name, constants.DEFAULT_SNAPSHOT_NAME).snap_protect(
+                    ceph_img_name, constants.DEFAULT_SNAPSHOT_NAME).run()
+                self.db.upload.delete_with_image_id(img_id)
+            else:
+                self.db.upload.update_offset(img_id, offset)
+            return self.__return_success(offset)
+        except (DBException, FileSystemException) as e:
+            logger.exception('')
+            return self.__return_error(e)
+
+    # Returns the size of the image and its allocated extents as [offset,
+    # length] lists, the rest of the image reads as zeros so only the extents
+    # have to be downloaded
+    @log
+    def start_download(self, img_name):
+        try:
+            self.hil.validate_project(self.project)
+            self.__check_usable(img_name)
+            ceph_img_name = self.__get_ceph_image_name(img_name)
+            return self.__return_success(
+                [self.fs.get_size(ceph_img_name),
+                 self.fs.list_extents(ceph_img_name)])
+        except (HaaSException, DBException, FileSystemException) as e:
+            logger.exception('')
+            return self.__return_error(e)
+
+    # Returns length bytes of the image from offset, base64 encoded
+    @log
+    def download_chunk(self, img_name, offset, length):
+        try:
+            ceph_img_name = self.__get_ceph_image_name(img_name)
+            data = self.fs.read_blocks(ceph_img_name, int(offset), int(length))
+            return self.__return_success(base64.b64encode(data))
+        except (DBException, FileSystemException) as e:
+            logger.exception('')
+            return self.__return_error(e)
+
     @log
     def export_ceph_image(self, img, name):
         try:
@@ -0,0 +1,284 @@
+import threading
+import time
+
+import ims.common.constants as constants
+import ims.exception.file_system_exceptions as file_system_exceptions
+from ims.common.log import *
+from ims.database import *
+
+logger = create_logger(__name__)
+
+
+# Spreads the images over several ceph backends, which are pools of one
+# cluster or pools of different clusters, and routes every operation on an
+# image to the backend holding it. It has the methods of RBD so that BMI and
+# the batches run on top of it unchanged.
+#
+# The backend of every image is recorded in the image location table when it
+# is created or cloned and cached in memory. The images which are not in the
+# table, like the ones imported from ceph, are in the default backend.
+#
+# The policy decides where a new image goes:
+# parent - in the backend of its parent, new images in the default one
+# least_loaded - in the backend storing the fewest bytes
+# project - in the backend of its project in projects, or as with parent
+# A clone is only placed in a backend of the cluster of its parent as rbd
+# cannot clone across clusters.
+class RBDRouter:
+    # backends is a dict of name -> RBD and clusters a dict of name -> the
+    # cluster of the backend, default is the name of the default backend,
+    # projects is a dict of project -> name of its backend and uid is the uid
+    # of bmi which prefixes the ceph names of the images
+    @log
+    def __init__(self, backends, clusters, default, policy, projects, uid,
+                 load_ttl=constants.PLACEMENT_LOAD_TTL):
+        if policy not in (constants.PARENT_PLACEMENT_POLICY,
+                          constants.LEAST_LOADED_PLACEMENT_POLICY,
+                          constants.PROJECT_PLACEMENT_POLICY):
+            raise file_system_exceptions.InvalidConfigArgumentException(
+                constants.PLACEMENT_POLICY_KEY)
+        for backend in projects.values():
+            if backend not in backends:
+                raise file_system_exceptions.InvalidConfigArgumentException(
+                    constants.PLACEMENT_PROJECTS_KEY)
+        self.backends = backends
+        self.clusters = clusters
+        self.default = default
+        self.policy = policy
+        self.projects = projects
+        self.uid = str(uid)
+        self.load_ttl = load_ttl
+        self.pool = backends[default].pool
+        # ceph name -> name of its backend
+        self.locations = {}
+        # name of the backend -> bytes stored, measured at loads_time
+        self.loads = {}
+        self.loads_time = None
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.tear_down()
+
+    @log
+    def tear_down(self):
+        for backend in self.backends.values():
+            backend.tear_down()
+
+    # Returns the name of the backend holding the image
+    @trace
+    def __locate(self, img_id):
+        with self.lock:
+            if img_id in self.locations:
+                return self.locations[img_id]
+        with Database() as db:
+            name = db.location.fetch_backend_with_ceph_name(img_id)
+        if name not in self.backends:
+            name = self.default
+        with self.lock:
+            return self.locations.setdefault(img_id, name)
+
+    @trace
+    def __record(self, img_id, name):
+        with Database() as db:
+            db.location.upsert(img_id, name)
+        with self.lock:
+            self.locations[img_id] = name
+
+    # Drops the location of the removed image, the batches call it for the
+    # images they remove as they remove them on the backend directly
+    @log
+    def forget(self, img_id):
+        with Database() as db:
+            db.location.delete_with_ceph_name(img_id)
+        with self.lock:
+            self.locations.pop(img_id, None)
+
+    # Returns the project of the image, None if it is not an image of bmi
+    @trace
+    def __project(self, img_id):
+        prefix = self.uid + "img"
+        if not img_id.startswith(prefix) or not img_id[len(prefix):].isdigit():
+            return None
+        with Database() as db:
+            return db.image.fetch_project_with_id(int(img_id[len(prefix):]))
+
+    # The loads are measured again once they are older than load_ttl
+    @trace
+    def __load(self, name):
+        with self.lock:
+            if self.loads_time is not None and \
+                    time.time() - self.loads_time < self.load_ttl:
+                return self.loads[name]
+        loads = dict((backend_name, backend.get_load()) for
+                     backend_name, backend in self.backends.items())
+        with self.lock:
+            self.loads = loads
+            self.loads_time = time.time()
+            return loads[name]
+
+    # Returns the name of the backend among candidates the image should be
+    # created in, preferred is used when the policy does not decide
+    @trace
+    def __choose(self, img_id, candidates, preferred):
+        if self.policy == constants.LEAST_LOADED_PLACEMENT_POLICY:
+            return min(sorted(candidates), key=self.__load)
+        if self.policy == constants.PROJECT_PLACEMENT_POLICY:
+            name = self.projects.get(self.__project(img_id))
+            if name in candidates:
+                return name
+        return preferred
+
+    @trace
+    def route(self, img_id):
+        return self.backends[self.__locate(img_id)]
+
+    # Chooses the backend of the clone among the ones in the cluster of the
+    # parent, the clone is recorded there with record once it is created
+    @log
+    def place(self, parent_img_name, clone_img_name):
+        parent = self.__locate(parent_img_name)
+        candidates = [name for name in self.backends if
+                      self.clusters[name] == self.clusters[parent]]
+        name = self.__choose(clone_img_name, candidates, parent)
+        return self.backends[name]
+
+    # Records that the image was created on the backend, the location is only
+    # written once the image exists so that a failed clone leaves no row
+    @log
+    def record(self, img_id, backend):
+        for name, candidate in self.backends.items():
+            if candidate is backend:
+                self.__record(img_id, name)
+                return
+
+    # The batch resolves the backend of every image through the router
+    @log
+    def batch(self):
+        return self.backends[self.default].batch(self)
+
+    @log
+    def get_load(self):
+        return sum(backend.get_load() for backend in self.backends.values())
+
+    @log
+    def list_images(self):
+        images = []
+        for backend in self.backends.values():
+            images.extend(backend.list_images())
+        return images
+
+    @log
+    def create_image(self, img_id, img_size):
+        name = self.__choose(img_id, self.backends.keys(), self.default)
+        ret = self.backends[name].create_image(img_id, img_size)
+        self.__record(img_id, name)
+        return ret
+
+    @log
+    def clone(self, parent_img_name, parent_snap_name, clone_img_name):
+        parent = self.route(parent_img_name)
+        child = self.place(parent_img_name, clone_img_name)
+        ret = parent.clone(parent_img_name, parent_snap_name, clone_img_name,
+                           child)
+        self.record(clone_img_name, child)
+        return ret
+
+    @log
+    def remove(self, img_id):
+        ret = self.route(img_id).remove(img_id)
+        self.forget(img_id)
+        return ret
+
+    @log
+    def write(self, img_id, data, offset):
+        return self.route(img_id).write(img_id, data, offset)
+
+    @log
+    def write_blocks(self, img_id, data, offset):
+        return self.route(img_id).write_blocks(img_id, data, offset)
+
+    @log
+    def snap_image(self, img_id, name):
+        return self.route(img_id).snap_image(img_id, name)
+
+    @log
+    def snap_protect(self, img_id, snap_name):
+        return self.route(img_id).snap_protect(img_id, snap_name)
+
+    @log
+    def snap_unprotect(self, img_id, snap_name):
+        return self.route(img_id).snap_unprotect(img_id, snap_name)
+
+    @log
+    def is_snap_protected(self, img_id, snap_name):
+        return self.route(img_id).is_snap_protected(img_id, snap_name)
+
+    @log
+    def flatten(self, img_id, on_progress=None):
+        return self.route(img_id).flatten(img_id, on_progress)
+
+    # The slots are taken in the default backend so that they are shared by
+    # all the images
+    @log
+    def acquire_slot(self, name, slots, cookie, duration):
+        return self.backends[self.default].acquire_slot(name, slots, cookie,
+                                                        duration)
+
+    @log
+    def renew_slot(self, name, slot, cookie, duration):
+        return self.backends[self.default].renew_slot(name, slot, cookie,
+                                                      duration)
+
+    @log
+    def release_slot(self, name, slot, cookie):
+        return self.backends[self.default].release_slot(name, slot, cookie)
+
+    @log
+    def get_size(self, img_id):
+        return self.route(img_id).get_size(img_id)
+
+    @log
+    def usage(self, img_id):
+        return self.route(img_id).usage(img_id)
+
+    @log
+    def list_extents(self, img_id):
+        return self.route(img_id).list_extents(img_id)
+
+    @log
+    def read_blocks(self, img_id, offset, length):
+        return self.route(img_id).read_blocks(img_id, offset, length)
+
+    @log
+    def list_snapshots(self, img_id):
+        return self.route(img_id).list_snapshots(img_id)
+
+    @log
+    def remove_snapshot(self, img_id, name):
+        return self.route(img_id).remove_snapshot(img_id, name)
+
+    @log
+    def get_parent_info(self, img_id):
+        return self.route(img_id).get_parent_info(img_id)
+
+    @log
+    def map(self, ceph_img_name):
+        return self.route(ceph_img_name).map(ceph_img_name)
+
+    # The device is unmapped by the backend which mapped it
+    @log
+    def unmap(self, rbd_name):
+        for backend in self.backends.values():
+            if rbd_name in backend.showmapped().values():
+                return backend.unmap(rbd_name)
+        return self.backends[self.default].unmap(rbd_name)
+
+    @log
+    def showmapped(self):
+        mappings = {}
+        for backend in self.backends.values():
+            mappings.update(backend.showmapped())
+        return mappings
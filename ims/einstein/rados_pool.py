@@ -0,0 +1,247 @@
+import Queue
+import threading
+import time
+from contextlib import contextmanager
+
+import rados
+import rbd
+
+import ims.common.constants as constants
+from ims.common.log import *
+from ims.einstein.image_cache import CachedImage, ImageCache
+
+logger = create_logger(__name__)
+
+__pools = {}
+__lock = threading.Lock()
+
+# Raised when the connection to the cluster is no longer usable, as opposed
+# to the errors about the images themselves
+CONNECTION_ERRORS = (rados.IOError, rados.TimedOut, rados.RadosStateError,
+                     rados.IoctxStateError, rbd.IOError,
+                     rbd.ConnectionShutdown, rbd.Timeout)
+
+
+# A connected cluster along with an io context on the pool
+class RadosConnection:
+    @log
+    def __init__(self, rid, conf_file, pool):
+        self.cluster = rados.Rados(rados_id=rid, conffile=conf_file)
+        self.cluster.connect()
+        try:
+            self.context = self.cluster.open_ioctx(pool.encode('utf-8'))
+        except rados.Error:
+            self.cluster.shutdown()
+            raise
+        self.failed = False
+        self.closed = False
+        self.checked = time.time()
+
+    # Returns whether the cluster still answers, it is a round trip to the
+    # monitors so it is only done for idle or failed connections
+    @trace
+    def is_healthy(self):
+        try:
+            if self.cluster.state != "connected":
+                return False
+            self.cluster.get_cluster_stats()
+            return True
+        except rados.Error:
+            logger.exception('')
+            return False
+
+    @log
+    def close(self):
+        self.closed = True
+        try:
+            self.context.close()
+            self.cluster.shutdown()
+        except rados.Error:
+            logger.exception('')
+
+
+# Keeps up to size connections to a pool of a cluster so that RBD borrows a
+# connected io context per operation instead of connecting for every BMI.
+# Connections are created when they are first needed, checked when they have
+# been idle for a while or failed while borrowed and are replaced if the
+# cluster does not answer on them. Borrowing blocks while all of them are in
+# use. The open images of the pool are kept in images.
+class RadosPool:
+    @log
+    def __init__(self, rid, conf_file, pool, size,
+                 cache_size=constants.DEFAULT_IMAGE_CACHE_SIZE,
+                 cache_ttl=constants.DEFAULT_IMAGE_CACHE_TTL,
+                 check_interval=constants.CEPH_HEALTH_CHECK_INTERVAL):
+        self.rid = rid
+        self.conf_file = conf_file
+        self.pool = pool
+        self.size = size
+        self.check_interval = check_interval
+        self.images = ImageCache(cache_size, cache_ttl)
+        self.locker = None
+        self.idle = Queue.LifoQueue()
+        self.created = 0
+        self.closed = False
+        self.lock = threading.Lock()
+
+    @trace
+    def __connect(self):
+        try:
+            return RadosConnection(self.rid, self.conf_file, self.pool)
+        except rados.Error:
+            with self.lock:
+                self.created -= 1
+            raise
+
+    @trace
+    def __acquire(self):
+        try:
+            connection = self.idle.get_nowait()
+        except Queue.Empty:
+            with self.lock:
+                create = self.created < self.size
+                if create:
+                    self.created += 1
+            if create:
+                return self.__connect()
+            connection = self.idle.get()
+
+        if connection.failed or \
+                time.time() - connection.checked > self.check_interval:
+            if not connection.is_healthy():
+                logger.info("Reconnecting to pool %s", self.pool)
+                self.images.evict_connection(connection)
+                connection.close()
+                connection = self.__connect()
+            connection.failed = False
+            connection.checked = time.time()
+        return connection
+
+    @trace
+    def __release(self, connection):
+        connection.checked = time.time()
+        if self.closed:
+            self.images.evict_connection(connection)
+            connection.close()
+        else:
+            self.idle.put(connection)
+
+    # Lends a connected io context for the duration of the with block, the
+    # connection is checked before its next use if the block fails with a
+    # connection error
+    @contextmanager
+    def borrow(self):
+        connection = self.__acquire()
+        try:
+            yield connection.context
+        except CONNECTION_ERRORS:
+            connection.failed = True
+            raise
+        finally:
+            self.__release(connection)
+
+    # Lends the io context of the connection which takes the rados locks of
+    # the process. A lock can only be renewed and released by the client
+    # which took it so all of them are taken on the same connection, which
+    # is shared as io contexts can be used by several threads at a time.
+    @contextmanager
+    def locking(self):
+        with self.lock:
+            if self.locker is not None and self.locker.failed:
+                if not self.locker.is_healthy():
+                    # The locks expire as they cannot be renewed anymore
+                    self.locker.close()
+                    self.locker = None
+                else:
+                    self.locker.failed = False
+            if self.locker is None:
+                self.locker = RadosConnection(self.rid, self.conf_file,
+                                              self.pool)
+            locker = self.locker
+        try:
+            yield locker.context
+        except CONNECTION_ERRORS:
+            locker.failed = True
+            raise
+
+    # Returns the open image taken from the cache or opened on a pooled
+    # connection, it has to be given back with release_image. Only the read
+    # only images are cached, a writable one holds a watch on the header
+    # which keeps other clients from removing the image.
+    @trace
+    def acquire_image(self, name, read_only=False):
+        if read_only:
+            cached = self.images.take(name)
+            if cached is not None:
+                return cached
+        connection = self.__acquire()
+        try:
+            return CachedImage(rbd.Image(connection.context, name,
+                                         read_only=read_only),
+                               connection, read_only)
+        except CONNECTION_ERRORS:
+            connection.failed = True
+            raise
+        finally:
+            self.__release(connection)
+
+    # Puts the image back in the cache, it is closed instead if it failed
+    # with a connection error
+    @trace
+    def release_image(self, name, cached, failed=False):
+        if failed:
+            cached.connection.failed = True
+            cached.close()
+        elif cached.read_only:
+            self.images.put(name, cached)
+        else:
+            cached.close()
+
+    # Lends the open image for the duration of the with block
+    @contextmanager
+    def open_image(self, name, read_only=False):
+        cached = self.acquire_image(name, read_only)
+        failed = False
+        try:
+            yield cached.image
+        except CONNECTION_ERRORS:
+            failed = True
+            raise
+        finally:
+            self.release_image(name, cached, failed)
+
+    # Closes the idle connections, the borrowed ones are closed when they
+    # are returned
+    @log
+    def close(self):
+        self.closed = True
+        self.images.clear()
+        with self.lock:
+            if self.locker is not None:
+                self.locker.close()
+                self.locker = None
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except Queue.Empty:
+                break
+
+
+# Returns the pool of connections of the process to the pool of the cluster,
+# it is created on first use with size connections and a cache of cache_size
+# images
+def get(rid, conf_file, pool, size, cache_size, cache_ttl):
+    key = (rid, conf_file, pool)
+    with __lock:
+        if key not in __pools:
+            __pools[key] = RadosPool(rid, conf_file, pool, size, cache_size,
+                                     cache_ttl)
+        return __pools[key]
+
+
+# Closes all the pools of the process
+def shutdown():
+    with __lock:
+        for pool in __pools.values():
+            pool.close()
+        __pools.clear()
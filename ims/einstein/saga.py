@@ -0,0 +1,95 @@
+import Queue
+import threading
+import time
+
+import ims.common.config as config
+import ims.common.constants as constants
+from ims.common.log import *
+from ims.exception import *
+
+logger = create_logger(__name__)
+
+__executor = None
+__executor_lock = threading.Lock()
+
+
+# Records the compensating action of every step of an operation which has
+# completed, so that the operation can be undone if a later step fails.
+# The compensations are run on a new session created by session_factory as
+# the session of the caller will be closed by the time they run.
+# cleanup is called with the session once every compensation has succeeded.
+class Saga:
+    @trace
+    def __init__(self, name, session_factory, cleanup=None, *cleanup_args):
+        self.name = name
+        self.session_factory = session_factory
+        self.compensations = []
+        self.cleanup = cleanup
+        self.cleanup_args = cleanup_args
+
+    # compensation is called with the session followed by args
+    @trace
+    def add(self, step, compensation, *args):
+        self.compensations.append((step, compensation, args))
+
+    # Runs the compensations in the reverse order of the steps, a failed
+    # compensation is retried with backoff and then skipped
+    @log
+    def rollback(self):
+        with self.session_factory() as session:
+            succeeded = True
+            for step, compensation, args in reversed(self.compensations):
+                for attempt in range(constants.ROLLBACK_RETRIES):
+                    try:
+                        compensation(session, *args)
+                        break
+                    except BMIException:
+                        logger.exception('')
+                        if attempt + 1 < constants.ROLLBACK_RETRIES:
+                            time.sleep(2 ** attempt)
+                else:
+                    logger.error("Failed to compensate %s of %s", step,
+                                 self.name)
+                    succeeded = False
+            if succeeded and self.cleanup is not None:
+                self.cleanup(session, *self.cleanup_args)
+
+
+# Runs the rollbacks of failed sagas in background threads so that the
+# caller can return the error without waiting for them
+class RollbackExecutor:
+    @log
+    def __init__(self, workers):
+        self.queue = Queue.Queue()
+        self.workers = []
+        for i in range(workers):
+            worker = threading.Thread(target=self.__work,
+                                      name="rollback-worker-" + str(i))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    @log
+    def submit(self, saga):
+        if saga.compensations or saga.cleanup is not None:
+            self.queue.put(saga)
+
+    @trace
+    def __work(self):
+        while True:
+            saga = self.queue.get()
+            try:
+                saga.rollback()
+            except Exception:
+                logger.exception('')
+            finally:
+                self.queue.task_done()
+
+
+# Returns the executor of the process, it is created on first use
+def get_executor():
+    global __executor
+    with __executor_lock:
+        if __executor is None:
+            __executor = RollbackExecutor(config.get().workers)
+    return __executor
@@ -0,0 +1,63 @@
+import threading
+import time
+
+from ims.common.log import *
+from ims.database import *
+from ims.exception import *
+
+logger = create_logger(__name__)
+
+__refresher = None
+
+
+# Measures the provisioned and used bytes of every image in the background
+# and stores them in the image usage table, so that listing the images does
+# not have to go to ceph. An image is measured once every interval, with an
+# interval of 0 they are only measured when refresh is called.
+class UsageRefresher:
+    # uid is the uid of bmi which prefixes the ceph names of the images
+    @log
+    def __init__(self, fs, uid, interval):
+        self.fs = fs
+        self.uid = uid
+        self.interval = interval
+        if interval > 0:
+            refresher = threading.Thread(target=self.__refresh_loop,
+                                         name="usage-refresher")
+            refresher.daemon = True
+            refresher.start()
+
+    # Measures every image once, the images missing in ceph are skipped
+    @log
+    def refresh(self):
+        with Database() as db:
+            db.usage.delete_stale()
+            for image in db.image.fetch_all_images():
+                ceph_name = str(self.uid) + "img" + str(image[0])
+                try:
+                    provisioned, used = self.fs.usage(ceph_name)
+                except file_system_exceptions.ImageNotFoundException:
+                    continue
+                db.usage.upsert(image[0], provisioned, used)
+
+    @trace
+    def __refresh_loop(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception('')
+            time.sleep(self.interval)
+
+
+# Starts the usage refresher of the process
+def start(fs, uid, interval):
+    global __refresher
+    __refresher = UsageRefresher(fs, uid, interval)
+    return __refresher
+
+
+# Returns the usage refresher of the process, None if it was not started
+def get():
+    global __refresher
+    return __refresher
@@ -0,0 +1,96 @@
+import threading
+
+import ims.common.constants as constants
+from ims.common.log import *
+from ims.database import *
+
+logger = create_logger(__name__)
+
+__pool = None
+
+
+# Keeps a number of clones of the popular images cloned, mapped and exported
+# so that provision only has to claim one instead of doing the slow ceph and
+# iscsi operations. The pool is refilled by a background thread whenever a
+# clone is claimed and every refill interval.
+class WarmPool:
+    # targets is a dict of (project, image) to the number of clones to keep
+    # session_factory is called with the project to get a BMI for refilling
+    @log
+    def __init__(self, targets, interval, session_factory):
+        self.targets = targets
+        self.interval = interval
+        self.session_factory = session_factory
+        self.hits = dict((target, 0) for target in targets)
+        self.misses = dict((target, 0) for target in targets)
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.refiller = threading.Thread(target=self.__refill_loop,
+                                         name="warm-pool-refiller")
+        self.refiller.daemon = True
+        self.refiller.start()
+
+    # Removes a ready clone of the image from the pool and returns its name
+    # None is returned if the image is not pooled or the pool is empty
+    @log
+    def claim(self, db, project, img_name):
+        target = (project, img_name)
+        if target not in self.targets:
+            return None
+        golden_id = db.image.fetch_id_with_name_from_project(img_name, project)
+        if golden_id is None:
+            return None
+        with self.lock:
+            image_id = db.pool.claim(golden_id)
+            if image_id is None:
+                self.misses[target] += 1
+            else:
+                self.hits[target] += 1
+        self.wakeup.set()
+        if image_id is None:
+            return None
+        return db.image.fetch_name_with_id(image_id)
+
+    # Returns the hits, misses and number of ready clones of every image
+    @log
+    def stats(self):
+        stats = {}
+        with Database() as db:
+            for target in self.targets:
+                project, img_name = target
+                golden_id = db.image.fetch_id_with_name_from_project(img_name,
+                                                                     project)
+                ready = 0
+                if golden_id is not None:
+                    ready = db.pool.count_with_golden_id(golden_id)
+                stats[project + "/" + img_name] = {
+                    constants.POOL_HITS_KEY: self.hits[target],
+                    constants.POOL_MISSES_KEY: self.misses[target],
+                    constants.POOL_READY_KEY: ready}
+        return stats
+
+    @trace
+    def __refill_loop(self):
+        while True:
+            for target, size in self.targets.items():
+                project, img_name = target
+                try:
+                    with self.session_factory(project) as bmi:
+                        bmi.fill_pool(img_name, size)
+                except Exception:
+                    logger.exception('')
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+
+
+# Starts the warm pool of the process
+def start(targets, interval, session_factory):
+    global __pool
+    __pool = WarmPool(targets, interval, session_factory)
+    return __pool
+
+
+# Returns the warm pool of the process, None if it was not started
+def get():
+    global __pool
+    return __pool
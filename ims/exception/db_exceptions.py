@@ -27,6 +27,19 @@ class ImageNotFoundException(DBException):
         return self.name + " not found"
 
 
+# this exception should be raised when a job is not found in the db
+class JobNotFoundException(DBException):
+    @property
+    def status_code(self):
+        return 404
+
+    def __init__(self, id):
+        self.id = id
+
+    def __str__(self):
+        return "Job " + str(self.id) + " not found"
+
+
 class ImageHasClonesException(DBException):
     @property
     def status_code(self):
@@ -39,6 +52,92 @@ class ImageHasClonesException(DBException):
         return self.name + " has clones, please deprovision before deleting"
 
 
+# this exception should be raised when a node is provisioned or deprovisioned
+# while another operation on it has not finished
+class NodeInProgressException(DBException):
+    @property
+    def status_code(self):
+        return 409
+
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return "An operation on " + self.name + " is already in progress"
+
+
+# this exception should be raised when an image is used before its flatten
+# has finished
+class ImageFlatteningException(DBException):
+    @property
+    def status_code(self):
+        return 409
+
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return self.name + " is still being flattened, please try again later"
+
+
+# this exception should be raised when a flatten is cancelled for an image
+# which is not being flattened
+class ImageNotFlatteningException(DBException):
+    @property
+    def status_code(self):
+        return 404
+
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return self.name + " is not being flattened"
+
+
+# this exception should be raised when an image is used before its upload
+# has finished
+class ImageUploadingException(DBException):
+    @property
+    def status_code(self):
+        return 409
+
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return self.name + " is still being uploaded"
+
+
+# this exception should be raised when a chunk is sent for an image which is
+# not being uploaded
+class ImageNotUploadingException(DBException):
+    @property
+    def status_code(self):
+        return 404
+
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return self.name + " is not being uploaded"
+
+
+# this exception should be raised when a chunk of an upload does not start
+# where the upload stopped
+class UploadOffsetException(DBException):
+    @property
+    def status_code(self):
+        return 409
+
+    def __init__(self, name, offset):
+        self.name = name
+        self.offset = offset
+
+    def __str__(self):
+        return self.name + " has to be uploaded from offset " + str(
+            self.offset)
+
+
 # this class is a wrapper for any orm specific exception like sqlalchemy
 class ORMException(DBException):
     @property
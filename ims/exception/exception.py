@@ -63,3 +63,17 @@ class RegistrationFailedException(BMIException):
 
     def __str__(self):
         return "Failed to register "+self.node+" due to "+self.error
+
+
+# this exception should be raised when an operation that cannot be run as a
+# job is submitted to the job engine
+class UnknownJobException(BMIException):
+    @property
+    def status_code(self):
+        return 400
+
+    def __init__(self, command):
+        self.command = command
+
+    def __str__(self):
+        return self.command + " cannot be run as a job"
@@ -148,6 +148,44 @@ class UnmapFailedException(FileSystemException):
         return "Unmap Failed for " + self.name
 
 
+class WriteFailedException(FileSystemException):
+    @property
+    def status_code(self):
+        return 500
+
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return "Write Failed for " + self.name
+
+
+class ReadFailedException(FileSystemException):
+    @property
+    def status_code(self):
+        return 500
+
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return "Read Failed for " + self.name
+
+
+# this exception should be raised when a flatten is stopped because it was
+# cancelled
+class FlattenCancelledException(FileSystemException):
+    @property
+    def status_code(self):
+        return 409
+
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return "Flatten of " + self.name + " was Cancelled"
+
+
 # this exception class is the abstract class for any ceph specific exceptions
 class CephFileSystemException(FileSystemException):
     __metaclass__ = ABCMeta
@@ -1,6 +1,9 @@
+import base64
+import hashlib
 import json
 
 from flask import Flask
+from flask import Response
 from flask import request
 
 from ims.rpc.client.rpc_client import *
@@ -29,6 +32,19 @@ def rest_call(path, method, command, parameters):
     return decorator
 
 
+# Same as rest_call except the command is queued as a job in einstein and
+# the job id is returned with 202 instead of waiting for the result
+@log
+def job_call(path, method, command, parameters):
+    def decorator(func):
+        app.add_url_rule(path, func.__name__,
+                         _job_wrapper(method, command, parameters),
+                         methods=[method])
+        return func
+
+    return decorator
+
+
 @trace
 def _extract_credentials(request):
     base64_str = request.headers.get('Authorization')
@@ -67,27 +83,149 @@ def _rest_wrapper(method, command, parameters):
     return wrapper
 
 
+@trace
+def _job_wrapper(method, command, parameters):
+    def wrapper():
+        extracted_parameters = []
+        if request.method == method:
+            credentials = _extract_credentials(request)
+            if credentials is None:
+                return "No Authentication Details Given", 400
+            for parameter in parameters:
+                extracted_parameters.append(request.form[parameter])
+            ret = rpc_client.submit_job(command, credentials,
+                                        extracted_parameters)
+            if ret[constants.STATUS_CODE_KEY] == 202:
+                return json.dumps({constants.JOB_ID_PARAMETER: ret[
+                    constants.RETURN_VALUE_KEY]}), 202
+            else:
+                return ret[constants.MESSAGE_KEY], ret[
+                    constants.STATUS_CODE_KEY]
+        else:
+            return "Please use " + method, 444
+
+    return wrapper
+
+
+# Returns the job from einstein or the error response if it failed
+@trace
+def _fetch_job():
+    credentials = _extract_credentials(request)
+    if credentials is None:
+        return None, ("No Authentication Details Given", 400)
+    try:
+        job_id = int(request.form[constants.JOB_ID_PARAMETER])
+    except ValueError:
+        return None, ("Invalid Job Id", 400)
+    ret = rpc_client.get_job(credentials, job_id)
+    if ret[constants.STATUS_CODE_KEY] != 200:
+        return None, (ret[constants.MESSAGE_KEY],
+                      ret[constants.STATUS_CODE_KEY])
+    return ret[constants.RETURN_VALUE_KEY], None
+
+
+@app.route("/job_status/", methods=['POST'])
+def job_status():
+    job, error = _fetch_job()
+    if error is not None:
+        return error
+    del job["result"]
+    return json.dumps(job), 200
+
+
+# Returns the result of a finished job the same way as the synchronous calls,
+# 202 is returned while the job is still queued or running
+@app.route("/job_result/", methods=['POST'])
+def job_result():
+    job, error = _fetch_job()
+    if error is not None:
+        return error
+    if job["status"] not in [constants.JOB_DONE_STATUS,
+                             constants.JOB_FAILED_STATUS]:
+        return "Job is " + job["status"], 202
+    ret = job["result"]
+    if ret[constants.STATUS_CODE_KEY] == 200:
+        ret = json.dumps(ret[constants.RETURN_VALUE_KEY])
+        if ret == 'true':
+            return "Success", 200
+        else:
+            return ret, 200
+    else:
+        return ret[constants.MESSAGE_KEY], ret[constants.STATUS_CODE_KEY]
+
+
+@app.route("/pool_stats/", methods=['GET'])
+def pool_stats():
+    ret = rpc_client.get_pool_stats()
+    if ret[constants.STATUS_CODE_KEY] == 200:
+        return json.dumps(ret[constants.RETURN_VALUE_KEY]), 200
+    else:
+        return ret[constants.MESSAGE_KEY], ret[constants.STATUS_CODE_KEY]
+
+
+# Renders the stage histograms in the prometheus text format
+@log
+def _format_metrics(histograms):
+    lines = ["# TYPE " + constants.METRICS_NAME + " histogram"]
+    for stage in sorted(histograms):
+        histogram = histograms[stage]
+        for bound, count in histogram[constants.METRICS_BUCKETS_KEY]:
+            le = "+Inf" if bound is None else repr(float(bound))
+            lines.append('%s_bucket{stage="%s",le="%s"} %d' % (
+                constants.METRICS_NAME, stage, le, count))
+        lines.append('%s_sum{stage="%s"} %r' % (
+            constants.METRICS_NAME, stage,
+            float(histogram[constants.METRICS_SUM_KEY])))
+        lines.append('%s_count{stage="%s"} %d' % (
+            constants.METRICS_NAME, stage,
+            histogram[constants.METRICS_COUNT_KEY]))
+    return "\n".join(lines) + "\n"
+
+
+@app.route("/metrics", methods=['GET'])
+def metrics():
+    ret = rpc_client.get_metrics()
+    if ret[constants.STATUS_CODE_KEY] == 200:
+        return _format_metrics(ret[constants.RETURN_VALUE_KEY]), 200, {
+            'Content-Type': 'text/plain; version=0.0.4'}
+    else:
+        return ret[constants.MESSAGE_KEY], ret[constants.STATUS_CODE_KEY]
+
+
 @rest_call("/list_images/", 'POST', constants.LIST_IMAGES_COMMAND, [])
 def list_images():
     pass
 
 
-@rest_call("/provision/", 'PUT', constants.PROVISION_COMMAND,
-           [constants.NODE_NAME_PARAMETER, constants.IMAGE_NAME_PARAMETER,
-            constants.NETWORK_PARAMETER, constants.NIC_PARAMETER])
+@job_call("/provision/", 'PUT', constants.PROVISION_COMMAND,
+          [constants.NODE_NAME_PARAMETER, constants.IMAGE_NAME_PARAMETER,
+           constants.NETWORK_PARAMETER, constants.NIC_PARAMETER])
 def provision():
     pass
 
 
-@rest_call("/deprovision/", "DELETE", constants.DEPROVISION_COMMAND,
-           [constants.NODE_NAME_PARAMETER, constants.NETWORK_PARAMETER,
-            constants.NIC_PARAMETER])
+@job_call("/provision_many/", 'PUT', constants.PROVISION_MANY_COMMAND,
+          [constants.NODES_PARAMETER, constants.IMAGE_NAME_PARAMETER,
+           constants.NETWORK_PARAMETER, constants.NIC_PARAMETER])
+def provision_many():
+    pass
+
+
+@job_call("/deprovision/", "DELETE", constants.DEPROVISION_COMMAND,
+          [constants.NODE_NAME_PARAMETER, constants.NETWORK_PARAMETER,
+           constants.NIC_PARAMETER])
 def deprovision():
     pass
 
 
-@rest_call("/create_snapshot/", "PUT", constants.CREATE_SNAPSHOT_COMMAND,
-           [constants.NODE_NAME_PARAMETER, constants.SNAP_NAME_PARAMETER])
+@job_call("/release_project/", "DELETE", constants.RELEASE_PROJECT_COMMAND,
+          [constants.NETWORK_PARAMETER, constants.NIC_PARAMETER])
+def release_project():
+    pass
+
+
+@job_call("/create_snapshot/", "PUT", constants.CREATE_SNAPSHOT_COMMAND,
+          [constants.NODE_NAME_PARAMETER, constants.SNAP_NAME_PARAMETER])
 def create_snapshot():
     pass
 
@@ -101,3 +239,123 @@ def list_snapshots():
            [constants.IMAGE_NAME_PARAMETER])
 def remove_image():
     pass
+
+
+@rest_call("/drain_pool/", "DELETE", constants.DRAIN_POOL_COMMAND,
+           [constants.IMAGE_NAME_PARAMETER])
+def drain_pool():
+    pass
+
+
+@rest_call("/list_flattens/", "POST", constants.LIST_FLATTENS_COMMAND, [])
+def list_flattens():
+    pass
+
+
+@rest_call("/cancel_flatten/", "DELETE", constants.CANCEL_FLATTEN_COMMAND,
+           [constants.IMAGE_NAME_PARAMETER])
+def cancel_flatten():
+    pass
+
+
+@rest_call("/start_upload/", "POST", constants.START_UPLOAD_COMMAND,
+           [constants.IMAGE_NAME_PARAMETER, constants.SIZE_PARAMETER])
+def start_upload():
+    pass
+
+
+# Same as _extract_credentials for the calls whose parameters are in the
+# query string
+@trace
+def _extract_query_credentials(request):
+    base64_str = request.headers.get('Authorization')
+    if base64_str is not None:
+        base64_str = base64_str.split(' ')[1]
+        project = request.args[constants.PROJECT_PARAMETER]
+        return base64_str, project
+    else:
+        return None
+
+
+# Streams the body of the request to einstein in chunks so that the image is
+# never held in memory as a whole. The project, image and the offset the body
+# starts at are passed as query parameters as the body is the data, the
+# offset has to be the one returned by start_upload. Returns the offset up to
+# which the image has been uploaded.
+@app.route("/upload_image/", methods=['PUT'])
+def upload_image():
+    credentials = _extract_query_credentials(request)
+    if credentials is None:
+        return "No Authentication Details Given", 400
+    img_name = request.args[constants.IMAGE_NAME_PARAMETER]
+    try:
+        offset = int(request.args[constants.OFFSET_PARAMETER])
+    except ValueError:
+        return "Invalid Offset", 400
+    while True:
+        data = request.stream.read(constants.UPLOAD_CHUNK_SIZE)
+        if not data:
+            return json.dumps(offset), 200
+        ret = rpc_client.execute_command(constants.UPLOAD_CHUNK_COMMAND,
+                                         credentials,
+                                         [img_name, str(offset),
+                                          base64.b64encode(data)])
+        if ret[constants.STATUS_CODE_KEY] != 200:
+            return ret[constants.MESSAGE_KEY], ret[constants.STATUS_CODE_KEY]
+        offset = ret[constants.RETURN_VALUE_KEY]
+
+
+# Streams the allocated extents of the image as frames, see the download
+# constants for the format. The extents are read from einstein a chunk at a
+# time so that the image is never held in memory as a whole. The project and
+# image are passed as query parameters.
+@app.route("/download_image/", methods=['GET'])
+def download_image():
+    credentials = _extract_query_credentials(request)
+    if credentials is None:
+        return "No Authentication Details Given", 400
+    img_name = request.args[constants.IMAGE_NAME_PARAMETER]
+    ret = rpc_client.execute_command(constants.START_DOWNLOAD_COMMAND,
+                                     credentials, [img_name])
+    if ret[constants.STATUS_CODE_KEY] != 200:
+        return ret[constants.MESSAGE_KEY], ret[constants.STATUS_CODE_KEY]
+    size, extents = ret[constants.RETURN_VALUE_KEY]
+
+    def frames():
+        checksum = hashlib.sha256()
+        yield "%s %d\n" % (constants.DOWNLOAD_SIZE_FRAME, size)
+        for offset, length in extents:
+            for start in range(offset, offset + length,
+                               constants.DOWNLOAD_CHUNK_SIZE):
+                ret = rpc_client.execute_command(
+                    constants.DOWNLOAD_CHUNK_COMMAND, credentials,
+                    [img_name, str(start), str(min(
+                        constants.DOWNLOAD_CHUNK_SIZE,
+                        offset + length - start))])
+                if ret[constants.STATUS_CODE_KEY] != 200:
+                    yield "%s %s\n" % (constants.DOWNLOAD_ERROR_FRAME,
+                                       ret[constants.MESSAGE_KEY].replace(
+                                           "\n", " "))
+                    return
+                data = base64.b64decode(ret[constants.RETURN_VALUE_KEY])
+                checksum.update(data)
+                yield "%s %d %d\n" % (constants.DOWNLOAD_DATA_FRAME, start,
+                                      len(data))
+                yield data
+        yield "%s %s\n" % (constants.DOWNLOAD_END_FRAME,
+                           checksum.hexdigest())
+
+    return Response(frames(), mimetype="application/octet-stream")
+
+
+@job_call("/import_image/", "PUT", constants.IMPORT_IMAGE_COMMAND,
+          [constants.IMAGE_NAME_PARAMETER])
+def import_image():
+    pass
+
+
+@job_call("/import_snapshot/", "PUT", constants.IMPORT_SNAPSHOT_COMMAND,
+          [constants.IMAGE_NAME_PARAMETER, constants.SNAP_NAME_PARAMETER,
+           constants.PROTECT_PARAMETER])
+def import_snapshot():
+    pass
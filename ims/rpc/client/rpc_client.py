@@ -14,11 +14,22 @@ class RPCClient:
         self.dict = {
             "function-list": {
                 "provision": "4",
+                "provision_many": "4",
                 "deprovision": "3",
                 "create_snapshot": "2",
                 "list_images": "0",
                 "list_snapshots": "0",
-                "remove_image": "1"
+                "remove_image": "1",
+                "import_ceph_image": "1",
+                "import_ceph_snapshot": "3",
+                "release_project": "2",
+                "list_flattens": "0",
+                "cancel_flatten": "1",
+                "drain_pool": "1",
+                "start_upload": "2",
+                "upload_chunk": "3",
+                "start_download": "1",
+                "download_chunk": "3"
             }
         }
         # The script name and no. of arguments.
@@ -53,27 +64,58 @@ class RPCClient:
         else:
             return False
 
+    # Checks that the command is known, has the right number of arguments
+    # and does not contain escape characters
+    @trace
+    def __is_valid_command(self, command, args):
+        if command in self.func_list:
+            concatenated_command = command + (" ".join(args))
+            return ((not self.__escape_characters_present(
+                concatenated_command)) and self.__correct_argument_list_length(
+                command, args))
+        return False
+
+    # Calls the given method on the main object, returns an error dict if the
+    # rpc server could not be reached
+    @trace
+    def __call_main_obj(self, method, *args):
+        if self.main_obj is None:
+            output = self.__get_main_obj()
+            if output is not None:
+                return output
+
+        try:
+            return getattr(self.main_obj, method)(*args)
+        except Pyro4.errors.CommunicationError as e:
+            self.main_obj = None
+            return {constants.STATUS_CODE_KEY: 500,
+                    constants.MESSAGE_KEY: str(e)}
+
     # client_function(): This function does all the check required, calls the
     # server program with the method name and arguments passed in as a list
     # and prints the output received from the server.
     @log
     def execute_command(self, command, credentials, args):
-        if command in self.func_list:
-            concatenated_command = command + (" ".join(args))
-            if ((not self.__escape_characters_present(
-                    concatenated_command)) and self.__correct_argument_list_length(
-                command, args)):
-                if self.main_obj is None:
-                    output = self.__get_main_obj()
-                    if output is not None:
-                        return output
+        if self.__is_valid_command(command, args):
+            return self.__call_main_obj('execute_command', credentials,
+                                        command, args)
 
-                try:
-                    execute_command = self.main_obj.execute_command(credentials,
-                                                                        command,
-                                                                        args)
-                    return execute_command
-                except Pyro4.errors.CommunicationError as e:
-                    self.main_obj = None
-                    return {constants.STATUS_CODE_KEY: 500,
-                            constants.MESSAGE_KEY: str(e)}
+    # Same checks as execute_command but the command is queued as a job on
+    # the server and the job id is returned
+    @log
+    def submit_job(self, command, credentials, args):
+        if self.__is_valid_command(command, args):
+            return self.__call_main_obj('submit_job', credentials, command,
+                                        args)
+
+    @log
+    def get_job(self, credentials, job_id):
+        return self.__call_main_obj('get_job', credentials, job_id)
+
+    @log
+    def get_pool_stats(self):
+        return self.__call_main_obj('get_pool_stats')
+
+    @log
+    def get_metrics(self):
+        return self.__call_main_obj('get_metrics')
@@ -2,6 +2,13 @@ import Pyro4
 
 import ims.common.constants as constants
 from ims.common.log import *
+import ims.common.metrics as metrics
+from ims.database import *
+import ims.einstein.flatten as flatten
+import ims.einstein.usage as usage
+import ims.einstein.warm_pool as warm_pool
+from ims.einstein.backend import Backend
+from ims.einstein.jobs import JobEngine
 from ims.einstein.operations import BMI
 from ims.exception import *
 
@@ -9,13 +16,21 @@ logger = create_logger(__name__)
 
 
 class MainServer:
+    # The backend holds the ceph connection and the other resources which are
+    # shared by all the calls, only the credentials are processed per call
+    @log
+    def __init__(self):
+        cfg = config.get()
+        self.backend = Backend(cfg)
+        self.jobs = JobEngine(cfg.job_workers, self.backend)
+
     # This method takes in the commandline arguments from the client program.
     # First argument is always the name of the method that is to be run.
     # The commandline arguments following that are the arguments to the method.
     @log
     def execute_command(self, credentials, command, args):
         try:
-            with BMI(credentials) as bmi:
+            with BMI(credentials, backend=self.backend) as bmi:
                 method_to_call = getattr(BMI, command)
                 args.insert(0, bmi)
                 args = tuple(args)
@@ -26,10 +41,72 @@ class MainServer:
             return {constants.STATUS_CODE_KEY: ex.status_code,
                     constants.MESSAGE_KEY: str(ex)}
 
+    # Queues the command to be run in the background and returns the job id
+    @log
+    def submit_job(self, credentials, command, args):
+        try:
+            job_id = self.jobs.submit(credentials, command, args)
+            return {constants.STATUS_CODE_KEY: 202,
+                    constants.RETURN_VALUE_KEY: job_id}
+        except BMIException as ex:
+            logger.exception('')
+            return {constants.STATUS_CODE_KEY: ex.status_code,
+                    constants.MESSAGE_KEY: str(ex)}
+
+    # Returns the status and result of the job if it belongs to the project
+    # of the credentials
+    @log
+    def get_job(self, credentials, job_id):
+        try:
+            with BMI(credentials, backend=self.backend) as bmi:
+                return bmi.get_job(job_id)
+        except BMIException as ex:
+            logger.exception('')
+            return {constants.STATUS_CODE_KEY: ex.status_code,
+                    constants.MESSAGE_KEY: str(ex)}
+
+    # Returns the hit, miss and ready counts of the warm pool
+    @log
+    def get_pool_stats(self):
+        pool = warm_pool.get()
+        if pool is None:
+            return {constants.STATUS_CODE_KEY: 200,
+                    constants.RETURN_VALUE_KEY: {}}
+        try:
+            return {constants.STATUS_CODE_KEY: 200,
+                    constants.RETURN_VALUE_KEY: pool.stats()}
+        except BMIException as ex:
+            logger.exception('')
+            return {constants.STATUS_CODE_KEY: ex.status_code,
+                    constants.MESSAGE_KEY: str(ex)}
+
+    # Returns the latency histogram of every stage timed in einstein
+    @log
+    def get_metrics(self):
+        return {constants.STATUS_CODE_KEY: 200,
+                constants.RETURN_VALUE_KEY: metrics.snapshot()}
+
+    # Resumes or rolls back the nodes which were being provisioned or
+    # deprovisioned when einstein went down, HIL is called with the admin
+    # credentials from the config as the ones of the callers are not kept
+    @log
+    def recover_nodes(self):
+        cfg = config.get()
+        with Database() as db:
+            nodes = db.node_state.fetch_nodes()
+        for project, node_name in nodes:
+            try:
+                with BMI(cfg.haas_username, cfg.haas_password, project,
+                         backend=self.backend) as bmi:
+                    bmi.recover_node(node_name)
+            except BMIException:
+                logger.exception('')
+
     @log
     def remake_mappings(self):
         try:
-            with BMI("", "", constants.BMI_ADMIN_PROJECT) as bmi:
+            with BMI("", "", constants.BMI_ADMIN_PROJECT,
+                     backend=self.backend) as bmi:
                 bmi.remake_mappings()
         except:
             logger.exception('')
@@ -38,16 +115,26 @@ class MainServer:
 @log
 def start_rpc_server():
     cfg = config.get()
+    server = MainServer()
     if cfg.is_service:
-        server = MainServer()
         server.remake_mappings()
+    server.recover_nodes()
+    flatten.start(server.backend.fs, cfg.flatten_workers,
+                  cfg.flatten_bandwidth, cfg.flatten_cluster_slots)
+    if cfg.usage_refresh_interval > 0:
+        usage.start(server.backend.fs, cfg.uid, cfg.usage_refresh_interval)
+    if cfg.pool_images:
+        warm_pool.start(cfg.pool_images, cfg.pool_refill_interval,
+                        lambda project: BMI("", "", project,
+                                            backend=server.backend))
     Pyro4.config.HOST = cfg.rpcserver_ip
     # Starting the Pyro daemon, locating and registering object with name server.
     daemon = Pyro4.Daemon(port=cfg.rpcserver_port)
     # find the name server
     ns = Pyro4.locateNS(host=cfg.nameserver_ip, port=cfg.nameserver_port)
-    # register the greeting maker as a Pyro object
-    uri = daemon.register(MainServer)
+    # register the server object, a single instance is shared by all the calls
+    # so that the job engine is not recreated per call
+    uri = daemon.register(server)
     # register the object with a name in the name server
     ns.register(constants.RPC_SERVER_NAME, uri)
     daemon.requestLoop()  # start the event loop of the server to wait for calls
@@ -0,0 +1 @@
+import test_metrics
\ No newline at end of file
@@ -0,0 +1,36 @@
+import unittest
+from unittest import TestCase
+
+import ims.common.constants as constants
+import ims.common.metrics as metrics
+from ims.common.log import *
+from ims.exception import *
+
+STAGE = "test_stage"
+
+
+@metrics.timed(STAGE)
+def failing_stage():
+    raise file_system_exceptions.MapFailedException(STAGE)
+
+
+class TestTimed(TestCase):
+    @trace
+    def setUp(self):
+        self.before = metrics.snapshot().get(STAGE, {
+            constants.METRICS_COUNT_KEY: 0})[constants.METRICS_COUNT_KEY]
+
+    def test_run(self):
+        with metrics.timer(STAGE):
+            pass
+        with self.assertRaises(file_system_exceptions.MapFailedException):
+            failing_stage()
+        histogram = metrics.snapshot()[STAGE]
+        self.assertEqual(histogram[constants.METRICS_COUNT_KEY],
+                         self.before + 2)
+        # The last bucket is +Inf so it holds every observation
+        self.assertEqual(histogram[constants.METRICS_BUCKETS_KEY][-1],
+                         [None, self.before + 2])
+
+    def tearDown(self):
+        pass
@@ -1,2 +1,9 @@
+import test_flatten
 import test_image
-import test_project
\ No newline at end of file
+import test_image_location
+import test_image_usage
+import test_job
+import test_node_state
+import test_pool_image
+import test_project
+import test_upload
\ No newline at end of file
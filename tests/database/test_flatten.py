@@ -0,0 +1,39 @@
+import unittest
+from unittest import TestCase
+
+from ims.database import *
+
+
+class TestFlatten(TestCase):
+    @trace
+    def setUp(self):
+        self.db = Database()
+        self.db.project.insert('project 1', 'network 1')
+        self.db.image.insert('image 1', 1)
+        self.image_id = self.db.image.fetch_id_with_name_from_project(
+            'image 1', 'project 1')
+        self.db.flatten.insert(self.image_id, 'img1', 'img0', 'snapshot',
+                               True)
+
+    def test_run(self):
+        flatten = self.db.flatten.fetch_with_image_id(self.image_id)
+        self.assertEqual(flatten['ceph_name'], 'img1')
+        self.assertTrue(flatten['remove_parent_snap'])
+        self.assertEqual(self.db.flatten.fetch_image_ids_with_status(
+            [constants.FLATTEN_QUEUED_STATUS]), [self.image_id])
+        self.assertEqual(self.db.flatten.fetch_from_project('project 1'),
+                         [[self.image_id, 'image 1',
+                           constants.FLATTEN_QUEUED_STATUS]])
+
+        self.db.flatten.update_status(self.image_id,
+                                      constants.FLATTEN_FAILED_STATUS)
+        self.assertEqual(self.db.flatten.fetch_image_ids_with_status(
+            [constants.FLATTEN_QUEUED_STATUS]), [])
+
+        self.db.flatten.delete_with_image_id(self.image_id)
+        self.assertIsNone(self.db.flatten.fetch_with_image_id(self.image_id))
+
+    def tearDown(self):
+        self.db.flatten.delete_with_image_id(self.image_id)
+        self.db.project.delete_with_name('project 1')
+        self.db.close()
@@ -0,0 +1,27 @@
+import unittest
+from unittest import TestCase
+
+from ims.database import *
+
+
+class TestImageLocation(TestCase):
+    @trace
+    def setUp(self):
+        self.db = Database()
+        self.db.location.upsert('1img1', 'ceph')
+
+    def test_run(self):
+        self.assertEqual(self.db.location.fetch_backend_with_ceph_name(
+            '1img1'), 'ceph')
+
+        self.db.location.upsert('1img1', 'ceph.ssd')
+        self.assertEqual(self.db.location.fetch_backend_with_ceph_name(
+            '1img1'), 'ceph.ssd')
+
+        self.db.location.delete_with_ceph_name('1img1')
+        self.assertIsNone(
+            self.db.location.fetch_backend_with_ceph_name('1img1'))
+
+    def tearDown(self):
+        self.db.location.delete_with_ceph_name('1img1')
+        self.db.close()
@@ -0,0 +1,31 @@
+import unittest
+from unittest import TestCase
+
+from ims.database import *
+
+
+class TestImageUsage(TestCase):
+    @trace
+    def setUp(self):
+        self.db = Database()
+        self.db.project.insert('project 1', 'network 1')
+        project_id = self.db.project.fetch_id_with_name('project 1')
+        self.db.image.insert('image 1', project_id)
+        self.db.image.insert('image 2', project_id)
+        self.image_id = self.db.image.fetch_id_with_name_from_project(
+            'image 1', 'project 1')
+
+    def test_run(self):
+        self.db.usage.upsert(self.image_id, 1024, 512)
+        self.db.usage.upsert(self.image_id, 1024, 768)
+        self.assertEqual(self.db.usage.fetch_from_project('project 1'),
+                         {'image 1': [1024, 768]})
+
+        self.db.image.delete_with_name_from_project('image 1', 'project 1')
+        self.db.usage.delete_stale()
+        self.assertIsNone(self.db.usage.fetch_with_image_id(self.image_id))
+
+    def tearDown(self):
+        self.db.usage.delete_stale()
+        self.db.project.delete_with_name('project 1')
+        self.db.close()
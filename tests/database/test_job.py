@@ -0,0 +1,64 @@
+import unittest
+from unittest import TestCase
+
+from ims.database import *
+
+
+class TestInsert(TestCase):
+    @trace
+    def setUp(self):
+        self.db = Database()
+        self.id = None
+
+    def test_run(self):
+        self.id = self.db.job.insert('provision', 'project 1',
+                                     ['node 1', 'image 1'])
+        job = self.db.job.fetch_with_id_from_project(self.id, 'project 1')
+        self.assertEqual(job['command'], 'provision')
+        self.assertEqual(job['args'], ['node 1', 'image 1'])
+        self.assertEqual(job['status'], constants.JOB_QUEUED_STATUS)
+        self.assertIsNone(job['result'])
+
+    def tearDown(self):
+        self.db.job.delete_with_id(self.id)
+        self.db.close()
+
+
+class TestUpdateStatus(TestCase):
+    @trace
+    def setUp(self):
+        self.db = Database()
+        self.id = self.db.job.insert('provision', 'project 1', [])
+
+    def test_run(self):
+        self.db.job.update_status(self.id, constants.JOB_RUNNING_STATUS)
+        self.assertIn(self.id, self.db.job.fetch_ids_with_status(
+            [constants.JOB_RUNNING_STATUS]))
+
+        self.db.job.update_status(self.id, constants.JOB_DONE_STATUS,
+                                  {constants.STATUS_CODE_KEY: 200,
+                                   constants.RETURN_VALUE_KEY: True})
+        job = self.db.job.fetch_with_id_from_project(self.id, 'project 1')
+        self.assertEqual(job['status'], constants.JOB_DONE_STATUS)
+        self.assertEqual(job['result'][constants.STATUS_CODE_KEY], 200)
+        self.assertNotIn(self.id, self.db.job.fetch_ids_with_status(
+            [constants.JOB_RUNNING_STATUS]))
+
+    def tearDown(self):
+        self.db.job.delete_with_id(self.id)
+        self.db.close()
+
+
+class TestFetchFromOtherProject(TestCase):
+    @trace
+    def setUp(self):
+        self.db = Database()
+        self.id = self.db.job.insert('provision', 'project 1', [])
+
+    def test_run(self):
+        with self.assertRaises(db_exceptions.JobNotFoundException):
+            self.db.job.fetch_with_id_from_project(self.id, 'project 2')
+
+    def tearDown(self):
+        self.db.job.delete_with_id(self.id)
+        self.db.close()
@@ -0,0 +1,39 @@
+import unittest
+from unittest import TestCase
+
+from ims.database import *
+
+
+class TestNodeState(TestCase):
+    @trace
+    def setUp(self):
+        self.db = Database()
+        self.db.node_state.insert('project 1', 'node 1',
+                                  constants.PROVISION_COMMAND, 'network 1',
+                                  'nic 1', 'image 1')
+
+    def test_run(self):
+        with self.assertRaises(db_exceptions.NodeInProgressException):
+            self.db.node_state.insert('project 1', 'node 1',
+                                      constants.DEPROVISION_COMMAND,
+                                      'network 1', 'nic 1')
+
+        self.db.node_state.update_state('project 1', 'node 1',
+                                        constants.NODE_ATTACHED_STATE, 'img1')
+        self.db.node_state.update_state('project 1', 'node 1',
+                                        constants.NODE_CLONED_STATE)
+        state = self.db.node_state.fetch_with_node_from_project('project 1',
+                                                                'node 1')
+        self.assertEqual(state['state'], constants.NODE_CLONED_STATE)
+        self.assertEqual(state['ceph_name'], 'img1')
+        self.assertEqual(state['img'], 'image 1')
+        self.assertEqual(self.db.node_state.fetch_nodes(),
+                         [['project 1', 'node 1']])
+
+        self.db.node_state.delete_with_node_from_project('project 1', 'node 1')
+        self.assertIsNone(self.db.node_state.fetch_with_node_from_project(
+            'project 1', 'node 1'))
+
+    def tearDown(self):
+        self.db.node_state.delete_with_node_from_project('project 1', 'node 1')
+        self.db.close()
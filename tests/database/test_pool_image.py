@@ -0,0 +1,34 @@
+import unittest
+from unittest import TestCase
+
+from ims.database import *
+
+
+class TestClaim(TestCase):
+    @trace
+    def setUp(self):
+        self.db = Database()
+        self.db.project.insert('project 1', 'network 1')
+        self.db.image.insert('image 1', 1)
+        golden_id = self.db.image.fetch_id_with_name_from_project('image 1',
+                                                                  'project 1')
+        self.db.image.insert('pooled 1', 1, parent_id=golden_id)
+        self.db.image.insert('node 1', 1, parent_id=golden_id)
+        self.pooled_id = self.db.image.fetch_id_with_name_from_project(
+            'pooled 1', 'project 1')
+        self.db.pool.insert(self.pooled_id, golden_id)
+        self.golden_id = golden_id
+
+    def test_run(self):
+        self.assertEqual(self.db.pool.count_with_golden_id(self.golden_id), 1)
+
+        clones = self.db.image.fetch_clones_from_project('project 1')
+        self.assertEqual(clones, [['node 1', 'image 1']])
+
+        self.assertEqual(self.db.pool.claim(self.golden_id), self.pooled_id)
+        self.assertEqual(self.db.pool.count_with_golden_id(self.golden_id), 0)
+        self.assertIsNone(self.db.pool.claim(self.golden_id))
+
+    def tearDown(self):
+        self.db.project.delete_with_name('project 1')
+        self.db.close()
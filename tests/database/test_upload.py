@@ -0,0 +1,33 @@
+import unittest
+from unittest import TestCase
+
+from ims.database import *
+
+
+class TestUpload(TestCase):
+    @trace
+    def setUp(self):
+        self.db = Database()
+        self.db.project.insert('project 1', 'network 1')
+        self.db.image.insert('image 1',
+                             self.db.project.fetch_id_with_name('project 1'))
+        self.image_id = self.db.image.fetch_id_with_name_from_project(
+            'image 1', 'project 1')
+        self.db.upload.insert(self.image_id, 4096)
+
+    def test_run(self):
+        upload = self.db.upload.fetch_with_image_id(self.image_id)
+        self.assertEqual(upload['size'], 4096)
+        self.assertEqual(upload['offset'], 0)
+
+        self.db.upload.update_offset(self.image_id, 1024)
+        self.assertEqual(
+            self.db.upload.fetch_with_image_id(self.image_id)['offset'], 1024)
+
+        self.db.upload.delete_with_image_id(self.image_id)
+        self.assertIsNone(self.db.upload.fetch_with_image_id(self.image_id))
+
+    def tearDown(self):
+        self.db.upload.delete_with_image_id(self.image_id)
+        self.db.project.delete_with_name('project 1')
+        self.db.close()
@@ -1 +1,15 @@
-import test_operations
\ No newline at end of file
+import test_committer
+import test_download
+import test_fake
+import test_flatten
+import test_iet_config
+import test_jobs
+import test_image_cache
+import test_krbd
+import test_lio
+import test_operations
+import test_placement
+import test_rados_pool
+import test_saga
+import test_upload
+import test_usage
\ No newline at end of file
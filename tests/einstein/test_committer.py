@@ -0,0 +1,104 @@
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import TestCase
+
+from ims.common.log import *
+from ims.einstein.committer import TargetCommitter
+from ims.einstein.fake.ceph import FakeRBD
+from ims.einstein.fake.iscsi import FakeIET
+from ims.exception import *
+
+
+class TestTargetCommitter(TestCase):
+    @trace
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.fs = FakeRBD()
+        self.iscsi = FakeIET(self.fs, self.root)
+        self.committer = TargetCommitter(self.iscsi, 0.2, 64)
+        for name in ("img1", "img2", "img3"):
+            self.fs.create_image(name, 1024)
+
+    # Runs operation on every image at the same time, returns the exception
+    # raised for each of them
+    def run_concurrently(self, operation, names):
+        errors = {}
+
+        def run(name):
+            try:
+                operation(name)
+            except BMIException as e:
+                errors[name] = e
+
+        threads = [threading.Thread(target=run, args=(name,)) for name in
+                   names]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+    def test_run(self):
+        errors = self.run_concurrently(self.committer.create_mapping,
+                                       ["img1", "img2", "img3"])
+        self.assertEqual(errors, {})
+        self.assertEqual(sorted(self.committer.show_mappings().keys()),
+                         ["img1", "img2", "img3"])
+        self.assertEqual(self.iscsi.service.restarts, 1)
+
+        # Every caller gets its own result
+        self.committer.delete_mapping("img1")
+        errors = self.run_concurrently(self.committer.delete_mapping,
+                                       ["img1", "img2"])
+        self.assertEqual(errors.keys(), ["img1"])
+        self.assertIsInstance(errors["img1"],
+                              iscsi_exceptions.NodeAlreadyUnmappedException)
+        self.assertEqual(self.committer.show_mappings().keys(), ["img3"])
+        self.assertEqual(self.fs.showmapped().keys(), ["img3"])
+        self.assertEqual(self.iscsi.service.restarts, 3)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+
+class TestCommitterSerializesUpdates(TestCase):
+    @trace
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.fs = FakeRBD()
+        self.iscsi = FakeIET(self.fs, self.root)
+        self.committer = TargetCommitter(self.iscsi, 0, 64)
+        for name in ("img1", "img2", "img3"):
+            self.fs.create_image(name, 1024)
+        # Records the most updates of the targets running at the same time
+        self.running = []
+        self.overlaps = []
+        update_mappings = self.iscsi.update_mappings
+
+        def tracked(*args, **kwargs):
+            self.running.append(True)
+            self.overlaps.append(len(self.running))
+            try:
+                time.sleep(0.1)
+                return update_mappings(*args, **kwargs)
+            finally:
+                self.running.pop()
+
+        self.iscsi.update_mappings = tracked
+
+    def test_run(self):
+        thread = threading.Thread(target=self.committer.create_mapping,
+                                  args=("img1",))
+        thread.start()
+        self.assertEqual(self.committer.create_mappings(["img2", "img3"]),
+                         {})
+        thread.join()
+        self.assertEqual(sorted(self.committer.show_mappings().keys()),
+                         ["img1", "img2", "img3"])
+        self.assertEqual(max(self.overlaps), 1)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
@@ -0,0 +1,53 @@
+import base64
+import shutil
+import tempfile
+import unittest
+from unittest import TestCase
+
+import ims.common.config as config
+import ims.common.constants as constants
+from ims.common.log import *
+from ims.database import *
+from ims.einstein.fake.backend import FakeBackend
+from ims.einstein.fake.hil import FakeHILServer
+from ims.einstein.operations import BMI
+
+BLOCK = constants.UPLOAD_BLOCK_SIZE
+
+
+class TestDownload(TestCase):
+    @trace
+    def setUp(self):
+        self.db = Database()
+        self.db.project.insert('project 1', 'network 1')
+        self.root = tempfile.mkdtemp()
+        self.hil = FakeHILServer(["eno1"])
+        self.haas_url = config.get().haas_url
+        config.get().haas_url = self.hil.url
+        self.backend = FakeBackend(self.root)
+        self.bmi = BMI("user", "password", 'project 1', backend=self.backend)
+        self.bmi.start_upload('image 1', str(4 * BLOCK))
+        self.bmi.upload_chunk('image 1', '0', base64.b64encode(
+            'x' * BLOCK + '\0' * BLOCK + 'y' * 2 * BLOCK))
+
+    def test_run(self):
+        ret = self.bmi.start_download('image 1')
+        self.assertEqual(ret[constants.RETURN_VALUE_KEY],
+                         [4 * BLOCK, [[0, BLOCK], [2 * BLOCK, 2 * BLOCK]]])
+
+        ret = self.bmi.download_chunk('image 1', str(BLOCK), str(2 * BLOCK))
+        self.assertEqual(base64.b64decode(ret[constants.RETURN_VALUE_KEY]),
+                         '\0' * BLOCK + 'y' * BLOCK)
+
+        ret = self.bmi.start_download('image 2')
+        self.assertEqual(ret[constants.STATUS_CODE_KEY], 404)
+
+    def tearDown(self):
+        self.bmi.remove_image('image 1')
+        self.bmi.shutdown()
+        self.backend.shutdown()
+        self.hil.shutdown()
+        config.get().haas_url = self.haas_url
+        shutil.rmtree(self.root)
+        self.db.project.delete_with_name('project 1')
+        self.db.close()
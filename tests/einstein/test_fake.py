@@ -0,0 +1,121 @@
+import shutil
+import tempfile
+import unittest
+from unittest import TestCase
+
+import ims.exception.file_system_exceptions as file_system_exceptions
+import ims.exception.iscsi_exceptions as iscsi_exceptions
+from ims.common.log import *
+from ims.einstein.fake.ceph import FakeRBD
+from ims.einstein.fake.iscsi import FakeIET
+
+
+class TestFakeIET(TestCase):
+    @trace
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.fs = FakeRBD()
+        self.iscsi = FakeIET(self.fs, self.root)
+        for name in ("img1", "img2", "img3"):
+            self.fs.create_image(name, 1024)
+
+    def test_run(self):
+        self.iscsi.create_mapping("img1")
+        self.assertEqual(self.iscsi.create_mappings(["img2", "img3"]), {})
+        self.assertEqual(sorted(self.iscsi.show_mappings().keys()),
+                         ["img1", "img2", "img3"])
+        self.assertEqual(self.iscsi.service.restarts, 2)
+
+        failed = self.iscsi.delete_mappings(["img1", "img4"])
+        self.assertEqual(failed.keys(), ["img4"])
+        self.assertEqual(sorted(self.iscsi.show_mappings().keys()),
+                         ["img2", "img3"])
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+
+class TestOnlineFakeIET(TestCase):
+    @trace
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.fs = FakeRBD()
+        self.iscsi = FakeIET(self.fs, self.root, online=True)
+        for name in ("img1", "img2", "img3"):
+            self.fs.create_image(name, 1024)
+
+    def test_run(self):
+        self.iscsi.create_mapping("img1")
+        self.assertEqual(self.iscsi.create_mappings(["img2", "img3"]), {})
+        self.assertEqual(sorted(self.iscsi.service.targets().items()),
+                         [("iqn.2015.img1", 1), ("iqn.2015.img2", 2),
+                          ("iqn.2015.img3", 3)])
+        self.assertEqual(sorted(self.iscsi.show_mappings().keys()),
+                         ["img1", "img2", "img3"])
+
+        self.iscsi.delete_mapping("img2")
+        self.assertEqual(self.iscsi.delete_mappings(["img1"]), {})
+        self.assertEqual(self.iscsi.service.targets(), {"iqn.2015.img3": 3})
+        self.assertEqual(self.iscsi.show_mappings().keys(), ["img3"])
+        self.assertEqual(self.iscsi.service.restarts, 0)
+        # delete_mappings leaves the devices to be unmapped by the caller
+        self.fs.unmap(self.fs.showmapped()["img1"])
+
+        # The daemon is restarted when ietadm fails
+        self.iscsi.service.exported["iqn.2015.img1"] = (4, {0: "/dev/rbd9"})
+        self.iscsi.create_mapping("img1")
+        self.assertEqual(self.iscsi.service.restarts, 1)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+
+class TestFailedTargetFakeIET(TestCase):
+    @trace
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.fs = FakeRBD()
+        self.iscsi = FakeIET(self.fs, self.root)
+        for name in ("img1", "img2", "img3"):
+            self.fs.create_image(name, 1024)
+
+    def test_run(self):
+        self.iscsi.create_mapping("img1")
+        # The lun of img2 cannot be created on the devices it gets next
+        self.iscsi.service.failing.update(["/dev/rbd1", "/dev/rbd2"])
+        self.assertRaises(iscsi_exceptions.MountException,
+                          self.iscsi.create_mapping, "img2")
+        self.assertEqual(self.iscsi.show_mappings().keys(), ["img1"])
+        self.assertNotIn("img2", self.fs.showmapped())
+
+        # Only the target which came up without its lun is rolled back
+        failed = self.iscsi.create_mappings(["img2", "img3"])
+        self.assertEqual(failed.keys(), ["img2"])
+        self.assertIsInstance(failed["img2"], iscsi_exceptions.MountException)
+        self.assertEqual(sorted(self.iscsi.show_mappings().keys()),
+                         ["img1", "img3"])
+        self.assertEqual(sorted(self.iscsi.service.targets().keys()),
+                         ["iqn.2015.img1", "iqn.2015.img3"])
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+
+class TestFakeBatch(TestCase):
+    @trace
+    def setUp(self):
+        self.fs = FakeRBD()
+        self.fs.create_image("img1", 1024)
+
+    def test_run(self):
+        # The clone fails as the snapshot is not protected, so the snapshot
+        # created before it is removed again
+        batch = self.fs.batch().snap_image("img1", "snap").clone(
+            "img1", "snap", "img2")
+        self.assertRaises(file_system_exceptions.ImageNotFoundException,
+                          batch.run)
+        self.assertEqual(self.fs.list_snapshots("img1"), [])
+        self.assertNotIn("img2", self.fs.list_images())
+
+    def tearDown(self):
+        pass
@@ -0,0 +1,171 @@
+import time
+import unittest
+from unittest import TestCase
+
+import ims.common.constants as constants
+from ims.common.log import *
+from ims.database import *
+from ims.einstein.fake.ceph import FakeRBD
+from ims.einstein.flatten import FlattenScheduler, TokenBucket
+
+
+class TestTokenBucket(TestCase):
+    @trace
+    def setUp(self):
+        self.bucket = TokenBucket(100)
+
+    def test_run(self):
+        # The first reservation goes into debt without waiting and the next
+        # one waits for the debt to be paid back
+        self.assertEqual(self.bucket.reserve(300), 0)
+        self.assertAlmostEqual(self.bucket.reserve(100), 2, places=1)
+        self.assertEqual(TokenBucket(0).reserve(300), 0)
+
+    def tearDown(self):
+        pass
+
+
+class TestThrottleFlatten(TestCase):
+    @trace
+    def setUp(self):
+        self.db = Database()
+        self.db.project.insert('project 1', 'network 1')
+        self.db.image.insert('image 1',
+                             self.db.project.fetch_id_with_name('project 1'))
+        self.image_id = self.db.image.fetch_id_with_name_from_project(
+            'image 1', 'project 1')
+        self.fs = FakeRBD()
+        self.fs.create_image('img0', 2 * 1024 * 1024)
+        self.fs.snap_image('img0', 'snapshot')
+        self.fs.snap_protect('img0', 'snapshot')
+        self.fs.clone('img0', 'snapshot', 'img1')
+        self.db.flatten.insert(self.image_id, 'img1', 'img0', 'snapshot',
+                               True)
+
+    def test_run(self):
+        # FakeRBD reports the 2 MB in 4 steps and the bucket holds 1 MB, the
+        # last step waits for the debt of the third one at 1 MB/s
+        start = time.time()
+        scheduler = FlattenScheduler(self.fs, 1, 1, 0)
+        scheduler.queue.join()
+
+        self.assertGreater(time.time() - start, 0.45)
+        self.assertIsNone(self.db.flatten.fetch_with_image_id(self.image_id))
+
+    def tearDown(self):
+        self.db.flatten.delete_with_image_id(self.image_id)
+        self.db.project.delete_with_name('project 1')
+        self.db.close()
+
+
+class TestFailFlatten(TestCase):
+    @trace
+    def setUp(self):
+        self.db = Database()
+        self.db.project.insert('project 1', 'network 1')
+        self.db.image.insert('image 1',
+                             self.db.project.fetch_id_with_name('project 1'))
+        self.image_id = self.db.image.fetch_id_with_name_from_project(
+            'image 1', 'project 1')
+        self.fs = FakeRBD()
+        self.fs.create_image('img0', 1024)
+        self.fs.snap_image('img0', 'snapshot')
+        self.fs.snap_protect('img0', 'snapshot')
+        self.fs.clone('img0', 'snapshot', 'img1')
+        self.db.flatten.insert(self.image_id, 'img1', 'img0', 'snapshot',
+                               True)
+
+    def test_run(self):
+        # An error that is not a BMIException like the ones of librbd
+        def flatten(img_id, on_progress=None):
+            raise IOError(img_id)
+
+        self.fs.flatten = flatten
+        scheduler = FlattenScheduler(self.fs, 1, 0, 0)
+        scheduler.queue.join()
+
+        self.assertEqual(
+            self.db.flatten.fetch_with_image_id(self.image_id)["status"],
+            constants.FLATTEN_FAILED_STATUS)
+
+    def tearDown(self):
+        self.db.flatten.delete_with_image_id(self.image_id)
+        self.db.project.delete_with_name('project 1')
+        self.db.close()
+
+
+class TestCancelFlatten(TestCase):
+    @trace
+    def setUp(self):
+        self.db = Database()
+        self.db.project.insert('project 1', 'network 1')
+        self.db.image.insert('image 1',
+                             self.db.project.fetch_id_with_name('project 1'))
+        self.image_id = self.db.image.fetch_id_with_name_from_project(
+            'image 1', 'project 1')
+        self.fs = FakeRBD({'flatten': 1})
+        self.fs.create_image('img0', 1024)
+        self.fs.snap_image('img0', 'snapshot')
+        self.fs.snap_protect('img0', 'snapshot')
+        self.fs.clone('img0', 'snapshot', 'img1')
+        self.db.flatten.insert(self.image_id, 'img1', 'img0', 'snapshot',
+                               True)
+
+    def test_run(self):
+        # The queued flatten is picked up when the scheduler starts
+        scheduler = FlattenScheduler(self.fs, 1, 0, 1)
+        while scheduler.get_progress(self.image_id) is None:
+            time.sleep(0.05)
+        scheduler.cancel(self.db, self.image_id)
+        scheduler.queue.join()
+
+        self.assertEqual(self.fs.list_images(), ['img0'])
+        self.assertEqual(self.fs.list_snapshots('img0'), [])
+        self.assertIsNone(self.db.flatten.fetch_with_image_id(self.image_id))
+        self.assertIsNone(self.db.image.fetch_id_with_name_from_project(
+            'image 1', 'project 1'))
+        self.assertEqual(self.fs.slots, {})
+
+    def tearDown(self):
+        self.db.flatten.delete_with_image_id(self.image_id)
+        self.db.project.delete_with_name('project 1')
+        self.db.close()
+
+
+class TestRetryFlatten(TestCase):
+    @trace
+    def setUp(self):
+        self.db = Database()
+        self.db.project.insert('project 1', 'network 1')
+        self.db.image.insert('image 1',
+                             self.db.project.fetch_id_with_name('project 1'))
+        self.image_id = self.db.image.fetch_id_with_name_from_project(
+            'image 1', 'project 1')
+        self.fs = FakeRBD()
+        self.fs.create_image('img0', 1024)
+        self.fs.snap_image('img0', 'snapshot')
+        self.fs.snap_protect('img0', 'snapshot')
+        self.fs.clone('img0', 'snapshot', 'img1')
+        self.db.flatten.insert(self.image_id, 'img1', 'img0', 'snapshot',
+                               True)
+
+    def test_run(self):
+        # The flatten failed after the clone was flattened and snapshotted
+        self.fs.flatten('img1')
+        self.fs.snap_image('img1', constants.DEFAULT_SNAPSHOT_NAME)
+        self.db.flatten.update_status(self.image_id,
+                                      constants.FLATTEN_FAILED_STATUS)
+
+        # It is retried when the scheduler starts
+        scheduler = FlattenScheduler(self.fs, 1, 0, 0)
+        scheduler.queue.join()
+
+        self.assertIsNone(self.db.flatten.fetch_with_image_id(self.image_id))
+        self.assertTrue(self.fs.is_snap_protected(
+            'img1', constants.DEFAULT_SNAPSHOT_NAME))
+        self.assertEqual(self.fs.list_snapshots('img0'), [])
+
+    def tearDown(self):
+        self.db.flatten.delete_with_image_id(self.image_id)
+        self.db.project.delete_with_name('project 1')
+        self.db.close()
@@ -0,0 +1,101 @@
+import shutil
+import tempfile
+import unittest
+from unittest import TestCase
+
+import os
+
+from ims.common.log import *
+from ims.einstein.iscsi import IETConfig, IETService, TargetDriver
+from ims.exception import *
+
+HEADER = "IncomingUser bmi secret\n"
+
+VOLUMES = "tid:2 name:iqn.2015.1img2\n" \
+          "\tlun:0 state:0 iotype:blockio iomode:wt blocks:2048 " \
+          "blocksize:512 path:/dev/rbd2\n" \
+          "tid:1 name:iqn.2015.1img1\n"
+
+
+class TestIETConfig(TestCase):
+    @trace
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.config_loc = os.path.join(self.root, "ietd.conf")
+        with open(self.config_loc, 'w') as fi:
+            fi.write(HEADER)
+        self.config = IETConfig(self.config_loc,
+                                os.path.join(self.root, "ietd.temp"))
+
+    def test_run(self):
+        self.config.update({"1img1": "/dev/rbd1", "1img10": "/dev/rbd10"}, [])
+        self.assertEqual(self.config.mappings(),
+                         {"1img1": "/dev/rbd1", "1img10": "/dev/rbd10"})
+
+        # Only the target of the image is removed, not the ones containing
+        # its name
+        self.config.update({}, ["1img1"])
+        self.assertEqual(self.config.mappings(), {"1img10": "/dev/rbd10"})
+        with open(self.config_loc) as fi:
+            content = fi.read()
+        self.assertTrue(content.startswith(HEADER))
+        self.assertEqual(content.count("Target"), 1)
+
+        # Changes made by someone else are picked up
+        with open(self.config_loc, 'a') as fi:
+            fi.write("Target iqn.2015.1img2\n"
+                     "        Lun 0 Path=/dev/rbd2,Type=blockio\n")
+        self.assertEqual(self.config.mappings(),
+                         {"1img10": "/dev/rbd10", "1img2": "/dev/rbd2"})
+
+        with open(self.config_loc, 'a') as fi:
+            fi.write("        Lun 1 Path=/dev/rbd3,Type=blockio\n")
+        self.assertRaises(iscsi_exceptions.InvalidConfigException,
+                          self.config.mappings)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+
+class TestIETVolumes(TestCase):
+    @trace
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.volume_loc = os.path.join(self.root, "volume")
+        with open(self.volume_loc, 'w') as fi:
+            fi.write(VOLUMES)
+        self.service = IETService("", volume_loc=self.volume_loc)
+
+    def test_run(self):
+        # The target of 1img1 came up without its lun
+        self.assertEqual(self.service.volumes(),
+                         {"iqn.2015.1img2": (2, {0: "/dev/rbd2"}),
+                          "iqn.2015.1img1": (1, {})})
+        self.assertEqual(self.service.targets(),
+                         {"iqn.2015.1img2": 2, "iqn.2015.1img1": 1})
+
+        os.remove(self.volume_loc)
+        self.assertRaises(IOError, self.service.volumes)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+
+class TestTargetDriver(TestCase):
+    @trace
+    def setUp(self):
+        pass
+
+    def test_run(self):
+        # A driver which does not implement remake_mappings
+        class Driver(TargetDriver):
+            def update_mappings(self, create, delete, unmap=False):
+                return {}
+
+            def show_mappings(self):
+                return {}
+
+        self.assertRaises(TypeError, Driver, None)
+
+    def tearDown(self):
+        pass
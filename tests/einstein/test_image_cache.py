@@ -0,0 +1,54 @@
+import unittest
+from unittest import TestCase
+
+from ims.common.log import *
+from ims.einstein.image_cache import CachedImage, ImageCache
+
+
+class Connection:
+    closed = False
+
+
+class Image:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class TestImageCache(TestCase):
+    @trace
+    def setUp(self):
+        self.cache = ImageCache(2, 60)
+        self.connection = Connection()
+
+    def test_run(self):
+        images = [CachedImage(Image(), self.connection) for i in range(3)]
+        for i, image in enumerate(images):
+            self.cache.put("img" + str(i), image)
+        # The least recently used image is closed once the cache is full
+        self.assertTrue(images[0].image.closed)
+        self.assertIsNone(self.cache.take("img0"))
+        self.assertIs(self.cache.take("img1"), images[1])
+
+        self.cache.evict("img2")
+        self.assertTrue(images[2].image.closed)
+
+        loads = []
+        load = lambda: loads.append(1) or ("snapshot",)
+        self.cache.get_metadata("img1", "snaps", load)
+        self.cache.get_metadata("img1", "snaps", load)
+        self.assertEqual(len(loads), 1)
+        # The handle is closed along with the metadata as it does not see
+        # the changes to the image
+        self.cache.put("img1", images[1])
+        self.cache.invalidate("img1")
+        self.assertTrue(images[1].image.closed)
+        self.assertIsNone(self.cache.take("img1"))
+        self.assertEqual(self.cache.get_metadata("img1", "snaps", load),
+                         ("snapshot",))
+        self.assertEqual(len(loads), 2)
+
+    def tearDown(self):
+        self.cache.clear()
@@ -0,0 +1,38 @@
+import base64
+import shutil
+import tempfile
+import unittest
+from unittest import TestCase
+
+import ims.common.constants as constants
+from ims.common.log import *
+from ims.database import *
+from ims.einstein.fake.backend import FakeBackend
+from ims.einstein.jobs import JobEngine
+
+
+class TestFailingJob(TestCase):
+    @trace
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.db = Database()
+        self.db.project.insert('project 1', 'network 1')
+        self.backend = FakeBackend(self.root)
+        self.jobs = JobEngine(1, self.backend)
+        self.credentials = (base64.b64encode('user:password'), 'project 1')
+
+    def test_run(self):
+        # provision is given too few arguments, which raises a TypeError
+        # rather than a BMIException
+        job_id = self.jobs.submit(self.credentials,
+                                  constants.PROVISION_COMMAND, ['node 1'])
+        self.jobs.queue.join()
+        job = self.db.job.fetch_with_id_from_project(job_id, 'project 1')
+        self.assertEqual(job["status"], constants.JOB_FAILED_STATUS)
+        self.assertEqual(job["result"][constants.STATUS_CODE_KEY], 500)
+
+    def tearDown(self):
+        self.db.project.delete_with_name('project 1')
+        self.db.close()
+        self.backend.shutdown()
+        shutil.rmtree(self.root)
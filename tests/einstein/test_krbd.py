@@ -0,0 +1,89 @@
+import shutil
+import tempfile
+import unittest
+from unittest import TestCase
+
+import ims.exception.file_system_exceptions as file_system_exceptions
+from ims.common.log import *
+from ims.einstein.fake.krbd import FakeSysfsBus
+from ims.einstein.krbd import MappingIndex, SysfsMapper, read_secret
+
+
+class TestSysfsMapper(TestCase):
+    @trace
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.bus = FakeSysfsBus(self.root)
+        self.mapper = SysfsMapper("10.0.0.1:6789", "bmi", "c2VjcmV0",
+                                  self.bus)
+
+    def test_run(self):
+        self.assertEqual(self.mapper.map("rbd", "img1"), "/dev/rbd0")
+        self.assertEqual(self.mapper.map("rbd", "img2"), "/dev/rbd1")
+        self.assertEqual(self.bus.specs[0],
+                         "10.0.0.1:6789 name=bmi,secret=c2VjcmV0 rbd img1")
+        self.assertEqual(self.mapper.showmapped(),
+                         {"img1": "/dev/rbd0", "img2": "/dev/rbd1"})
+
+        self.mapper.unmap("/dev/rbd0")
+        self.assertEqual(self.mapper.showmapped(), {"img2": "/dev/rbd1"})
+        self.assertRaises(file_system_exceptions.UnmapFailedException,
+                          self.mapper.unmap, "/dev/rbd0")
+
+        self.bus.missing.add("img3")
+        self.assertRaises(file_system_exceptions.MapFailedException,
+                          self.mapper.map, "rbd", "img3")
+        # The id of the removed device is reused
+        self.assertEqual(self.mapper.map("rbd", "img1"), "/dev/rbd0")
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+
+class TestMappingIndex(TestCase):
+    @trace
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.bus = FakeSysfsBus(self.root)
+        self.mapper = SysfsMapper("10.0.0.1:6789", "bmi", "c2VjcmV0",
+                                  self.bus)
+        self.index = MappingIndex(self.mapper, 0)
+
+    def test_run(self):
+        self.mapper.map("rbd", "img1")
+        # Loaded from the mapper on first use
+        self.assertEqual(self.index.showmapped(), {"img1": "/dev/rbd0"})
+
+        self.assertEqual(self.index.map("rbd", "img2"), "/dev/rbd1")
+        self.index.unmap("/dev/rbd0")
+        self.assertEqual(self.index.showmapped(), {"img2": "/dev/rbd1"})
+
+        # Made outside of the index, only seen once reconciled
+        self.mapper.map("rbd", "img3")
+        self.assertEqual(self.index.showmapped(), {"img2": "/dev/rbd1"})
+        self.index.reconcile()
+        self.assertEqual(self.index.showmapped(),
+                         {"img2": "/dev/rbd1", "img3": "/dev/rbd0"})
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.root)
+
+
+class TestReadSecret(TestCase):
+    @trace
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.keyring = os.path.join(self.root, "keyring")
+        with open(self.keyring, 'w') as fi:
+            fi.write("[client.admin]\n\tkey = YWRtaW4=\n"
+                     "[client.bmi]\n\tkey = Ym1p==\n\tcaps mon = \"allow r\"\n")
+
+    def test_run(self):
+        self.assertEqual(read_secret(self.keyring, "bmi"), "Ym1p==")
+        self.assertRaises(
+            file_system_exceptions.InvalidConfigArgumentException,
+            read_secret, self.keyring, "other")
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
@@ -0,0 +1,55 @@
+import shutil
+import tempfile
+import unittest
+from unittest import TestCase
+
+import os
+
+from ims.common.log import *
+from ims.einstein.fake.ceph import FakeRBD
+from ims.einstein.fake.lio import FakeLIO
+from ims.exception import *
+
+
+class TestLIO(TestCase):
+    @trace
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.fs = FakeRBD()
+        self.iscsi = FakeLIO(self.fs, self.root)
+        for name in ("img1", "img2", "img3"):
+            self.fs.create_image(name, 1024)
+
+    def test_run(self):
+        self.iscsi.create_mapping("img1")
+        failed = self.iscsi.create_mappings(["img1", "img2", "img3"])
+        self.assertEqual(failed.keys(), ["img1"])
+        self.assertIsInstance(failed["img1"],
+                              iscsi_exceptions.NodeAlreadyInUseException)
+        mappings = self.iscsi.show_mappings()
+        self.assertEqual(mappings, self.fs.showmapped())
+        tpg = os.path.join(self.root, "target", "iscsi", "iqn.2015.img2",
+                           "tpgt_1")
+        with open(os.path.join(tpg, "enable")) as fi:
+            self.assertEqual(fi.read(), "1")
+        self.assertEqual(os.readlink(
+            os.path.join(tpg, "lun", "lun_0", "img2")),
+            os.path.join(self.root, "target", "core", "iblock_0", "img2"))
+
+        self.iscsi.delete_mapping("img2")
+        self.assertRaises(iscsi_exceptions.NodeAlreadyUnmappedException,
+                          self.iscsi.delete_mapping, "img2")
+        self.assertEqual(sorted(self.iscsi.show_mappings().keys()),
+                         ["img1", "img3"])
+        self.assertEqual(sorted(self.fs.showmapped().keys()),
+                         ["img1", "img3"])
+        self.assertFalse(os.path.exists(os.path.join(
+            self.root, "target", "core", "iblock_0", "img2")))
+
+        # A target whose image was unmapped is exported on a new mapping
+        self.fs.unmap(mappings["img3"])
+        self.iscsi.remake_mappings()
+        self.assertEqual(self.iscsi.show_mappings(), self.fs.showmapped())
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
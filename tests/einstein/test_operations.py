@@ -14,6 +14,7 @@ CORRECT_HAAS_PASSWORD = "admin1234"
 INCORRECT_HAAS_PASSWORD = "admin123##"
 
 NODE_NAME = "cisco-24"
+NOT_EXIST_NODE = "cisco-00"
 NIC = "enp130s0f0"
 
 PROJECT = "bmi_infra"
@@ -50,6 +51,35 @@ class TestProvision(TestCase):
         time.sleep(constants.HAAS_CALL_TIMEOUT)
 
 
+class TestProvisionMany(TestCase):
+    @trace
+    def setUp(self):
+        self.db = Database()
+        self.db.project.insert(PROJECT, NETWORK)
+
+        self.good_bmi = BMI(CORRECT_HAAS_USERNAME, CORRECT_HAAS_PASSWORD,
+                            PROJECT)
+        self.good_bmi.import_ceph_image(EXIST_IMG_NAME)
+
+    def test_run(self):
+        response = self.good_bmi.provision_many([NODE_NAME, NOT_EXIST_NODE],
+                                                EXIST_IMG_NAME, NETWORK, NIC)
+        self.assertEqual(response[constants.STATUS_CODE_KEY], 200)
+        report = response[constants.RETURN_VALUE_KEY]
+        self.assertEqual(report[NODE_NAME][constants.STATUS_CODE_KEY], 200)
+        self.assertNotEqual(
+            report[NOT_EXIST_NODE][constants.STATUS_CODE_KEY], 200)
+        time.sleep(constants.HAAS_CALL_TIMEOUT)
+
+    def tearDown(self):
+        self.good_bmi.deprovision(NODE_NAME, NETWORK, NIC)
+        self.good_bmi.remove_image(EXIST_IMG_NAME)
+        self.db.project.delete_with_name(PROJECT)
+        self.db.close()
+        self.good_bmi.shutdown()
+        time.sleep(constants.HAAS_CALL_TIMEOUT)
+
+
 class TestDeprovision(TestCase):
     @trace
     def setUp(self):
@@ -74,6 +104,35 @@ class TestDeprovision(TestCase):
         self.good_bmi.shutdown()
 
 
+class TestReleaseProject(TestCase):
+    @trace
+    def setUp(self):
+        self.db = Database()
+        self.db.project.insert(PROJECT, NETWORK)
+
+        self.good_bmi = BMI(CORRECT_HAAS_USERNAME, CORRECT_HAAS_PASSWORD,
+                            PROJECT)
+        self.good_bmi.import_ceph_image(EXIST_IMG_NAME)
+        self.good_bmi.provision(NODE_NAME, EXIST_IMG_NAME, NETWORK, NIC)
+        time.sleep(constants.HAAS_CALL_TIMEOUT)
+
+    def test_run(self):
+        response = self.good_bmi.release_project(NETWORK, NIC)
+        self.assertEqual(response[constants.STATUS_CODE_KEY], 200)
+        report = response[constants.RETURN_VALUE_KEY]
+        self.assertEqual(report[NODE_NAME][constants.STATUS_CODE_KEY], 200)
+        self.assertEqual(self.db.image.fetch_clones_from_project(PROJECT), [])
+        self.assertIsNone(self.db.node_state.fetch_with_node_from_project(
+            PROJECT, NODE_NAME))
+        time.sleep(constants.HAAS_CALL_TIMEOUT)
+
+    def tearDown(self):
+        self.good_bmi.remove_image(EXIST_IMG_NAME)
+        self.db.project.delete_with_name(PROJECT)
+        self.db.close()
+        self.good_bmi.shutdown()
+
+
 class TestCreateSnapshot(TestCase):
     @trace
     def setUp(self):
@@ -168,7 +227,8 @@ class TestListImages(TestCase):
     def test_run(self):
         response = self.good_bmi.list_images()
         self.assertEqual(response[constants.STATUS_CODE_KEY], 200)
-        self.assertEqual(response[constants.RETURN_VALUE_KEY], [EXIST_IMG_NAME])
+        self.assertEqual(response[constants.RETURN_VALUE_KEY],
+                         [[EXIST_IMG_NAME, None, None]])
 
     def tearDown(self):
         self.good_bmi.remove_image(EXIST_IMG_NAME)
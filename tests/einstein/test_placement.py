@@ -0,0 +1,115 @@
+import unittest
+from unittest import TestCase
+
+import ims.common.constants as constants
+from ims.common.log import *
+from ims.database import *
+from ims.einstein.fake.ceph import FakeRBD
+from ims.einstein.placement import RBDRouter
+from ims.exception import *
+
+
+class TestProjectPlacement(TestCase):
+    @trace
+    def setUp(self):
+        self.db = Database()
+        self.db.project.insert('project 1', 'network 1')
+        project_id = self.db.project.fetch_id_with_name('project 1')
+        self.db.image.insert('image 1', project_id)
+        self.db.image.insert('node 1', project_id)
+        self.golden = '1img' + str(
+            self.db.image.fetch_id_with_name_from_project('image 1',
+                                                          'project 1'))
+        self.clone = '1img' + str(
+            self.db.image.fetch_id_with_name_from_project('node 1',
+                                                          'project 1'))
+        self.hdd = FakeRBD(pool='hdd')
+        self.ssd = FakeRBD(pool='ssd')
+        self.fs = RBDRouter({'ceph': self.hdd, 'ceph.ssd': self.ssd},
+                            {'ceph': 'cluster', 'ceph.ssd': 'cluster'},
+                            'ceph', constants.PROJECT_PLACEMENT_POLICY,
+                            {'project 1': 'ceph.ssd'}, 1)
+
+    def test_run(self):
+        self.fs.create_image(self.golden, 4096)
+        self.fs.batch().snap_image(
+            self.golden, constants.DEFAULT_SNAPSHOT_NAME).snap_protect(
+            self.golden, constants.DEFAULT_SNAPSHOT_NAME).run()
+        self.fs.clone(self.golden, constants.DEFAULT_SNAPSHOT_NAME,
+                      self.clone)
+        self.assertEqual(sorted(self.ssd.list_images()),
+                         sorted([self.golden, self.clone]))
+        self.assertEqual(self.hdd.list_images(), [])
+        self.assertEqual(self.fs.get_parent_info(self.clone),
+                         ('ssd', self.golden, constants.DEFAULT_SNAPSHOT_NAME))
+        self.assertEqual(
+            self.db.location.fetch_backend_with_ceph_name(self.clone),
+            'ceph.ssd')
+        self.fs.remove(self.clone)
+
+        # A failed clone leaves no location behind
+        with self.assertRaises(file_system_exceptions.ImageNotFoundException):
+            self.fs.clone(self.golden, 'missing', self.clone)
+        self.assertIsNone(
+            self.db.location.fetch_backend_with_ceph_name(self.clone))
+        self.fs.clone(self.golden, constants.DEFAULT_SNAPSHOT_NAME,
+                      self.clone)
+
+        # Images which were not placed are in the default backend
+        self.hdd.create_image('imported', 4096)
+        self.assertEqual(self.fs.get_size('imported'), 4096)
+
+        rbd_name = self.fs.map(self.clone)
+        self.assertEqual(self.fs.showmapped(), {self.clone: rbd_name})
+        self.fs.unmap(rbd_name)
+        self.fs.remove(self.clone)
+        self.assertIsNone(
+            self.db.location.fetch_backend_with_ceph_name(self.clone))
+
+    def tearDown(self):
+        self.db.location.delete_with_ceph_name(self.golden)
+        self.db.location.delete_with_ceph_name(self.clone)
+        self.db.project.delete_with_name('project 1')
+        self.db.close()
+
+
+class TestLeastLoadedPlacement(TestCase):
+    @trace
+    def setUp(self):
+        self.db = Database()
+        self.first = FakeRBD(pool='first')
+        self.second = FakeRBD(pool='second')
+        self.other = FakeRBD(pool='other')
+        self.fs = RBDRouter({'ceph': self.first, 'ceph.second': self.second,
+                             'ceph.other': self.other},
+                            {'ceph': 'cluster', 'ceph.second': 'cluster',
+                             'ceph.other': 'other cluster'},
+                            'ceph', constants.LEAST_LOADED_PLACEMENT_POLICY,
+                            {}, 1, load_ttl=0)
+
+    def test_run(self):
+        self.first.create_image('golden', 4096)
+        self.first.write('golden', 'x' * 1024, 0)
+        self.fs.batch().snap_image(
+            'golden', constants.DEFAULT_SNAPSHOT_NAME).snap_protect(
+            'golden', constants.DEFAULT_SNAPSHOT_NAME).run()
+
+        # The other cluster is empty but the clone stays in the cluster of
+        # its parent
+        self.second.create_image('small', 4096)
+        self.second.write('small', 'x' * 512, 0)
+        self.fs.clone('golden', constants.DEFAULT_SNAPSHOT_NAME, 'clone')
+        self.assertEqual(sorted(self.second.list_images()),
+                         ['clone', 'small'])
+        self.assertEqual(self.fs.route('clone'), self.second)
+
+        # The parent is busy while it has a clone in the other pool
+        self.assertRaises(file_system_exceptions.ImageBusyException,
+                          self.fs.snap_unprotect, 'golden',
+                          constants.DEFAULT_SNAPSHOT_NAME)
+        self.fs.flatten('clone')
+        self.fs.snap_unprotect('golden', constants.DEFAULT_SNAPSHOT_NAME)
+
+    def tearDown(self):
+        self.db.location.delete_with_ceph_name('clone')
+        self.db.close()
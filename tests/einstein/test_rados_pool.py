@@ -0,0 +1,32 @@
+import unittest
+from unittest import TestCase
+
+import ims.common.constants as constants
+from ims.common.log import *
+from ims.einstein.rados_pool import RadosPool
+
+_cfg = config.get()
+
+
+class TestRadosPool(TestCase):
+    @trace
+    def setUp(self):
+        ceph_config = _cfg.fs[constants.CEPH_CONFIG_SECTION_NAME]
+        self.pool = RadosPool(ceph_config[constants.CEPH_ID_KEY],
+                              ceph_config[constants.CEPH_CONFIG_FILE_KEY],
+                              ceph_config[constants.CEPH_POOL_KEY], 2,
+                              check_interval=0)
+
+    def test_run(self):
+        # A returned connection is lent again instead of connecting
+        with self.pool.borrow() as context:
+            first = context
+        with self.pool.borrow() as context:
+            self.assertIs(context, first)
+            # Only a second connection is created while the first is out
+            with self.pool.borrow() as other:
+                self.assertIsNot(other, first)
+        self.assertEqual(self.pool.created, 2)
+
+    def tearDown(self):
+        self.pool.close()
@@ -0,0 +1,71 @@
+import unittest
+from unittest import TestCase
+
+import ims.common.constants as constants
+from ims.common.log import *
+from ims.einstein.saga import Saga
+from ims.exception import *
+
+
+class FakeSession:
+    def __init__(self):
+        self.undone = []
+        self.failures = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+def undo(session, step):
+    session.undone.append(step)
+
+
+def undo_once_failing(session, step):
+    if session.failures == 0:
+        session.failures += 1
+        raise file_system_exceptions.ImageBusyException(step)
+    session.undone.append(step)
+
+
+class TestRollback(TestCase):
+    @trace
+    def setUp(self):
+        self.session = FakeSession()
+        self.saga = Saga(constants.PROVISION_COMMAND, lambda: self.session)
+
+    def test_run(self):
+        self.saga.add(constants.HIL_STEP, undo, constants.HIL_STEP)
+        self.saga.add(constants.DB_STEP, undo, constants.DB_STEP)
+        self.saga.add(constants.RBD_STEP, undo_once_failing,
+                      constants.RBD_STEP)
+        self.saga.rollback()
+        self.assertEqual(self.session.undone,
+                         [constants.RBD_STEP, constants.DB_STEP,
+                          constants.HIL_STEP])
+
+    def tearDown(self):
+        pass
+
+
+def clear(session, node_name):
+    session.undone.append(node_name)
+
+
+class TestCleanup(TestCase):
+    @trace
+    def setUp(self):
+        self.session = FakeSession()
+        self.saga = Saga(constants.PROVISION_COMMAND, lambda: self.session,
+                         clear, 'node 1')
+
+    def test_run(self):
+        # The cleanup runs once all the compensations have succeeded
+        self.saga.add(constants.HIL_STEP, undo, constants.HIL_STEP)
+        self.saga.rollback()
+        self.assertEqual(self.session.undone, [constants.HIL_STEP, 'node 1'])
+
+    def tearDown(self):
+        pass
@@ -0,0 +1,68 @@
+import base64
+import shutil
+import tempfile
+import unittest
+from unittest import TestCase
+
+import ims.common.config as config
+import ims.common.constants as constants
+from ims.common.log import *
+from ims.database import *
+from ims.einstein.fake.backend import FakeBackend
+from ims.einstein.fake.hil import FakeHILServer
+from ims.einstein.operations import BMI
+
+BLOCK = constants.UPLOAD_BLOCK_SIZE
+
+
+class TestUpload(TestCase):
+    @trace
+    def setUp(self):
+        self.db = Database()
+        self.db.project.insert('project 1', 'network 1')
+        self.root = tempfile.mkdtemp()
+        self.hil = FakeHILServer(["eno1"])
+        self.haas_url = config.get().haas_url
+        config.get().haas_url = self.hil.url
+        self.backend = FakeBackend(self.root)
+        self.bmi = BMI("user", "password", 'project 1', backend=self.backend)
+
+    def test_run(self):
+        ret = self.bmi.start_upload('image 1', str(3 * BLOCK))
+        self.assertEqual(ret[constants.RETURN_VALUE_KEY], 0)
+
+        # The block of zeros is skipped
+        data = base64.b64encode('\0' * BLOCK + 'x' * BLOCK)
+        ret = self.bmi.upload_chunk('image 1', '0', data)
+        self.assertEqual(ret[constants.RETURN_VALUE_KEY], 2 * BLOCK)
+        ret = self.bmi.upload_chunk('image 1', '0', data)
+        self.assertEqual(ret[constants.STATUS_CODE_KEY], 409)
+
+        # The interrupted upload resumes where it stopped and the image
+        # cannot be used until it is done
+        ret = self.bmi.start_upload('image 1', str(3 * BLOCK))
+        self.assertEqual(ret[constants.RETURN_VALUE_KEY], 2 * BLOCK)
+        ret = self.bmi.provision('node 1', 'image 1', 'network 1', 'eno1')
+        self.assertEqual(ret[constants.STATUS_CODE_KEY], 409)
+
+        ret = self.bmi.upload_chunk('image 1', str(2 * BLOCK),
+                                    base64.b64encode('y' * BLOCK))
+        self.assertEqual(ret[constants.RETURN_VALUE_KEY], 3 * BLOCK)
+        image_id = self.db.image.fetch_id_with_name_from_project(
+            'image 1', 'project 1')
+        self.assertIsNone(self.db.upload.fetch_with_image_id(image_id))
+        ceph_name = str(config.get().uid) + "img" + str(image_id)
+        self.assertEqual(self.backend.fs.list_snapshots(ceph_name),
+                         [constants.DEFAULT_SNAPSHOT_NAME])
+        self.assertEqual(self.backend.fs.usage(ceph_name),
+                         (3 * BLOCK, 2 * BLOCK))
+
+    def tearDown(self):
+        self.bmi.remove_image('image 1')
+        self.bmi.shutdown()
+        self.backend.shutdown()
+        self.hil.shutdown()
+        config.get().haas_url = self.haas_url
+        shutil.rmtree(self.root)
+        self.db.project.delete_with_name('project 1')
+        self.db.close()
@@ -0,0 +1,33 @@
+import unittest
+from unittest import TestCase
+
+from ims.common.log import *
+from ims.database import *
+from ims.einstein.fake.ceph import FakeRBD
+from ims.einstein.usage import UsageRefresher
+
+
+class TestUsageRefresher(TestCase):
+    @trace
+    def setUp(self):
+        self.db = Database()
+        self.db.project.insert('project 1', 'network 1')
+        project_id = self.db.project.fetch_id_with_name('project 1')
+        self.db.image.insert('image 1', project_id)
+        self.db.image.insert('image 2', project_id)
+        self.image_id = self.db.image.fetch_id_with_name_from_project(
+            'image 1', 'project 1')
+        self.fs = FakeRBD()
+        self.fs.create_image('1img' + str(self.image_id), 4096)
+        self.fs.write('1img' + str(self.image_id), 'x' * 1024, 0)
+
+    def test_run(self):
+        UsageRefresher(self.fs, 1, 0).refresh()
+        # image 2 has no ceph image and is skipped
+        self.assertEqual(self.db.usage.fetch_from_project('project 1'),
+                         {'image 1': [4096, 1024]})
+
+    def tearDown(self):
+        self.db.project.delete_with_name('project 1')
+        self.db.usage.delete_stale()
+        self.db.close()
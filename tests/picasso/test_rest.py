@@ -29,6 +29,20 @@ NOT_EXIST_IMG_NAME = "i12"
 NOT_EXIST_SNAP_NAME = "hello"
 
 
+# The long running calls are queued as jobs, this polls until the job is done
+def wait_for_job(res):
+    if res.status_code != 202:
+        return res
+    data = {constants.PROJECT_PARAMETER: PROJECT,
+            constants.JOB_ID_PARAMETER: res.json()[constants.JOB_ID_PARAMETER]}
+    while True:
+        res = requests.post(url + "job_result/", data=data,
+                            auth=(CORRECT_HAAS_USERNAME, CORRECT_HAAS_PASSWORD))
+        if res.status_code != 202:
+            return res
+        time.sleep(constants.JOB_POLL_INTERVAL)
+
+
 class TestProvision(TestCase):
     @trace
     def setUp(self):
@@ -46,7 +60,8 @@ class TestProvision(TestCase):
                 constants.NIC_PARAMETER: NIC}
         res = requests.put(url + "provision/", data=data,
                            auth=(CORRECT_HAAS_USERNAME, CORRECT_HAAS_PASSWORD))
-        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.status_code, 202)
+        self.assertEqual(wait_for_job(res).status_code, 200)
         time.sleep(constants.HAAS_CALL_TIMEOUT)
 
     def tearDown(self):
@@ -77,7 +92,8 @@ class TestDeprovision(TestCase):
         res = requests.delete(url + "deprovision/", data=data,
                               auth=(
                               CORRECT_HAAS_USERNAME, CORRECT_HAAS_PASSWORD))
-        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.status_code, 202)
+        self.assertEqual(wait_for_job(res).status_code, 200)
         time.sleep(constants.HAAS_CALL_TIMEOUT)
 
     def tearDown(self):
@@ -104,7 +120,8 @@ class TestCreateSnapshot(TestCase):
                 constants.SNAP_NAME_PARAMETER: NEW_SNAP_NAME}
         res = requests.put(url + "create_snapshot/", data=data,
                            auth=(CORRECT_HAAS_USERNAME, CORRECT_HAAS_PASSWORD))
-        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.status_code, 202)
+        self.assertEqual(wait_for_job(res).status_code, 200)
 
         snaps = self.db.image.fetch_snapshots_from_project(PROJECT)
         has_image = False
@@ -187,7 +204,7 @@ class TestListImages(TestCase):
                             auth=(CORRECT_HAAS_USERNAME, CORRECT_HAAS_PASSWORD))
         js = res.json()
         self.assertEqual(res.status_code, 200)
-        self.assertEqual(js[0], EXIST_IMG_NAME)
+        self.assertEqual(js[0][0], EXIST_IMG_NAME)
 
     def tearDown(self):
         self.good_bmi.remove_image(EXIST_IMG_NAME)